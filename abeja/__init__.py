@@ -1,9 +1,60 @@
 # flake8: noqa
+import importlib
+import sys
+from types import ModuleType
 from typing import Optional
 
 from .version import VERSION
-from .tracking import Tracking
+
+# Submodules are imported on first attribute access so that ``import abeja``
+# (and therefore ``import abeja.datalake`` etc.) does not pull in tracking,
+# tensorboardX and every API client up front.
+_LAZY_SUBMODULES = frozenset((
+    'base_client',
+    'common',
+    'contrib',
+    'datalake',
+    'datasets',
+    'deployments',
+    'endpoints',
+    'exceptions',
+    'models',
+    'notebook',
+    'opsbeellm',
+    'registry',
+    'runs',
+    'secret',
+    'secret_version',
+    'security',
+    'services',
+    'train',
+    'training',
+    'triggers',
+    'user',
+))
 
 
 def tracking(total_steps: Optional[int] = None):
+    from .tracking import Tracking
     return Tracking(total_steps=total_steps)
+
+
+def __getattr__(name):
+    if name == 'Tracking':
+        from .tracking import Tracking
+        return Tracking
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+class _Module(ModuleType):
+    def __setattr__(self, name, value):
+        # importing ``abeja.tracking`` binds the submodule on this package,
+        # which would shadow the ``abeja.tracking()`` shortcut above.
+        if name == 'tracking' and isinstance(value, ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Module
@@ -1,6 +1,6 @@
 from typing import Optional
 
-from abeja.common.connection import Connection
+from abeja.common.connection import Connection, AsyncConnection
 
 
 class BaseAPIClient:
@@ -12,3 +12,38 @@ class BaseAPIClient:
             timeout: Optional[int] = None,
             max_retry_count: Optional[int] = None):
         self._connection = Connection(credential, timeout, max_retry_count)
+
+    def close(self) -> None:
+        """close pooled HTTP connections held by the client"""
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AsyncBaseAPIClient:
+    """A low-level asyncio client for ABEJA Platform API
+
+    `aiohttp` is required, see :class:`AsyncConnection <abeja.common.connection.AsyncConnection>`.
+    """
+
+    def __init__(
+            self,
+            credential: Optional[dict] = None,
+            timeout: Optional[int] = None,
+            max_retry_count: Optional[int] = None):
+        self._connection = AsyncConnection(
+            credential, timeout, max_retry_count)
+
+    async def close(self) -> None:
+        """close HTTP connections held by the client"""
+        await self._connection.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
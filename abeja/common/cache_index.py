@@ -0,0 +1,285 @@
+"""SQLite index of files cached in `MOUNT_DIR`.
+
+The index records size, content type, ETag, `uploaded_at` of the source
+and access of each cached file, so that cache lookups, eviction and
+queries of cached files of a channel read the index instead of calling
+`stat` for each file, which is slow on NFS such as EFS.
+
+The index is enabled by `ABEJA_STORAGE_INDEX=true`, and saved in
+`ABEJA_STORAGE_INDEX_PATH`, `[ABEJA_STORAGE_DIR_PATH]/.index.sqlite3` by
+default. The database is in WAL mode, so that lookups are not blocked by
+writes, which needs processes sharing it to run on the same host. On NFS,
+put the index on a local disk of each host. Cached files are looked up in
+the index without `stat`; a file removed by hand is noticed when it fails
+to be read, and its entry is removed then. Entries are keyed by the path
+relative to the cache directory, so the index can be rebuilt from the
+files on disk, e.g. when the index is lost::
+
+    $ python -m abeja.common.cache_index rebuild
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from abeja.common.config import MOUNT_DIR, STORAGE_INDEX_PATH
+
+INDEX_FILE = '.index.sqlite3'
+# accesses are written in a transaction when this number of them are recorded,
+# or this number of seconds passed since the last write
+TOUCH_BATCH_SIZE = 100
+TOUCH_FLUSH_INTERVAL = 1.0
+
+# files which are not cache entries: lock files, the index, partial downloads
+# and their progress, and temporary files named `<path>.<pid>-<datetime>-<random>`
+NOT_ENTRY = re.compile(r'(^\.|\.lock$|\.part$|\.part\.json(\.tmp)?$|\.\d+-\d{14}-[0-9a-f]{4}$)')
+
+_CHANNEL_ID = re.compile(r'^\d{13}$')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    uri TEXT,
+    size INTEGER NOT NULL,
+    content_type TEXT,
+    etag TEXT,
+    uploaded_at TEXT,
+    saved_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+)
+'''
+_COLUMNS = (
+    'path', 'uri', 'size', 'content_type', 'etag', 'uploaded_at',
+    'saved_at', 'accessed_at', 'hits')
+
+
+class CacheIndex:
+    """an index of cached files in a directory
+
+    a connection is opened for each thread, and the database is shared by
+    processes with the locking of SQLite. accesses recorded by :meth:`touch`
+    are buffered and written in batches, see :meth:`flush`.
+
+    :param root: cache directory
+    :param path: path of the database, `<root>/.index.sqlite3` by default
+    """
+
+    def __init__(self, root: str, path: Optional[str] = None) -> None:
+        self.root = root
+        self.path = path or os.path.join(root, INDEX_FILE)
+        self._local = threading.local()
+        # key -> [last access time, number of accesses] not written yet
+        self._touches = {}  # type: Dict[str, List]
+        self._flushed_at = time.monotonic()
+        self._touches_lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        """return the entry of a cached file
+
+        :param path: path of the file
+        :return: None if the file is not indexed
+        """
+        self.flush()
+        row = self._connection().execute(
+            'SELECT {} FROM entries WHERE path = ?'.format(', '.join(_COLUMNS)),
+            (self._key(path),)).fetchone()
+        return self._entry(row) if row else None
+
+    def add(
+            self,
+            path: str,
+            size: int,
+            uri: Optional[str] = None,
+            content_type: Optional[str] = None,
+            etag: Optional[str] = None,
+            uploaded_at: Optional[str] = None) -> None:
+        """add or replace the entry of a cached file"""
+        now = time.time()
+        key = self._key(path)
+        with self._touches_lock:
+            self._touches.pop(key, None)
+        self._connection().execute(
+            'INSERT OR REPLACE INTO entries ({}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)'.format(
+                ', '.join(_COLUMNS)),
+            (key, uri, size, content_type, etag, uploaded_at, now, now))
+
+    def touch(self, path: str) -> bool:
+        """record an access to a cached file
+
+        the access is written with others later, so that a cache hit does
+        not wait for a write transaction.
+
+        :return: False if the file is not indexed
+        """
+        key = self._key(path)
+        row = self._connection().execute('SELECT 1 FROM entries WHERE path = ?', (key,)).fetchone()
+        if row is None:
+            return False
+        with self._touches_lock:
+            touch = self._touches.setdefault(key, [0.0, 0])
+            touch[0] = time.time()
+            touch[1] += 1
+            full = len(self._touches) >= TOUCH_BATCH_SIZE or \
+                time.monotonic() - self._flushed_at >= TOUCH_FLUSH_INTERVAL
+        if full:
+            self.flush()
+        return True
+
+    def flush(self) -> None:
+        """write buffered accesses in a transaction"""
+        with self._touches_lock:
+            touches, self._touches = self._touches, {}
+            self._flushed_at = time.monotonic()
+        if not touches:
+            return
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'UPDATE entries SET accessed_at = MAX(accessed_at, ?), hits = hits + ? WHERE path = ?',
+                [(accessed_at, hits, key) for key, (accessed_at, hits) in touches.items()])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def remove(self, path: str) -> None:
+        key = self._key(path)
+        with self._touches_lock:
+            self._touches.pop(key, None)
+        self._connection().execute('DELETE FROM entries WHERE path = ?', (key,))
+
+    def entries(self, prefix: str = '') -> List[Dict[str, Any]]:
+        """list entries of cached files whose paths start with `prefix`
+
+        .. code-block:: python
+
+            # files of a datalake channel cached in MOUNT_DIR
+            entries = CacheIndex(MOUNT_DIR).entries(channel_id + '/')
+
+        :param prefix: prefix of paths relative to the cache directory
+        """
+        self.flush()
+        pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        rows = self._connection().execute(
+            "SELECT {} FROM entries WHERE path LIKE ? ESCAPE '\\'".format(', '.join(_COLUMNS)),
+            (pattern,)).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def total_size(self) -> int:
+        return self._connection().execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def rebuild(self) -> int:
+        """replace entries with the files on disk
+
+        other than the size and the modification time, information of
+        files which are already indexed is kept.
+
+        :return: number of entries
+        """
+        known = {self._key(entry['path']): entry for entry in self.entries()}
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM entries')
+            count = 0
+            for path, stat in walk_entries(self.root):
+                key = self._key(path)
+                entry = known.get(key, {})
+                conn.execute(
+                    'INSERT INTO entries ({}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'.format(
+                        ', '.join(_COLUMNS)),
+                    (key, entry.get('uri') or _guess_uri(key), stat.st_size,
+                     entry.get('content_type'), entry.get('etag'), entry.get('uploaded_at'),
+                     stat.st_mtime, max(stat.st_atime, entry.get('accessed_at') or 0),
+                     entry.get('hits') or 0))
+                count += 1
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return count
+
+    def close(self) -> None:
+        self.flush()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def _entry(self, row) -> Dict[str, Any]:
+        entry = dict(zip(_COLUMNS, row))
+        entry['path'] = os.path.join(self.root, *entry['path'].split('/'))
+        return entry
+
+
+def walk_entries(root: str) -> Iterator:
+    """list cached files on disk with their stat"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        # e.g. `.objects` of the content store
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        for name in filenames:
+            if NOT_ENTRY.search(name):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                yield path, os.stat(path)
+            except OSError:
+                continue
+
+
+def _guess_uri(key: str) -> Optional[str]:
+    """guess uri of a datalake file saved in `<channel_id>/<file_id>`"""
+    entries = key.split('/')
+    if len(entries) == 2 and _CHANNEL_ID.match(entries[0]):
+        return 'datalake://{}/{}'.format(*entries)
+    return None
+
+
+_indexes = {}   # type: Dict[str, CacheIndex]
+_indexes_lock = threading.Lock()
+
+
+def get_cache_index(root: str) -> CacheIndex:
+    """return the index of `root`, usually `MOUNT_DIR`"""
+    with _indexes_lock:
+        if root not in _indexes:
+            _indexes[root] = CacheIndex(root, STORAGE_INDEX_PATH)
+        return _indexes[root]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m abeja.common.cache_index',
+        description='manage the index of files cached in ABEJA_STORAGE_DIR_PATH')
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--root', default=MOUNT_DIR, help='cache directory')
+    parser.add_argument('--index', default=STORAGE_INDEX_PATH, help='path of the index')
+    args = parser.parse_args(argv)
+
+    index = CacheIndex(args.root, args.index)
+    count = index.rebuild()
+    print('indexed {} files in {}'.format(count, args.root))    # noqa: T001
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,9 +14,36 @@ def get_cache_dir():
 
 # directory to save local files
 MOUNT_DIR = os.environ.get('ABEJA_STORAGE_DIR_PATH', get_cache_dir())
+# max total size of local files in bytes, and files are evicted if exceeded. unlimited if 0
+STORAGE_SIZE_LIMIT = int(os.environ.get('ABEJA_STORAGE_SIZE_LIMIT', 0))
+# ratio of the limit to which the total size is reduced by eviction
+STORAGE_SIZE_LOW_WATERMARK = float(os.environ.get('ABEJA_STORAGE_SIZE_LOW_WATERMARK', 0.9))
+# `lru` or `lfu`
+STORAGE_EVICTION_POLICY = os.environ.get('ABEJA_STORAGE_EVICTION_POLICY', 'lru').lower()
+# interval in seconds to re-check the total size of local files, which may be written by other processes.
+# files on disk are listed again then unless they are indexed
+STORAGE_USAGE_CHECK_INTERVAL = float(os.environ.get('ABEJA_STORAGE_USAGE_CHECK_INTERVAL', 60))
+# index local files with SQLite, which is saved in `[ABEJA_STORAGE_DIR_PATH]/.index.sqlite3` by default
+STORAGE_INDEX = os.environ.get('ABEJA_STORAGE_INDEX', 'false').lower() in ('1', 'true')
+STORAGE_INDEX_PATH = os.environ.get('ABEJA_STORAGE_INDEX_PATH') or None
+# save the same content of local files once, keyed by ETag, in `[ABEJA_STORAGE_DIR_PATH]/.objects`
+STORAGE_DEDUP = os.environ.get('ABEJA_STORAGE_DEDUP', 'false').lower() in ('1', 'true')
+# max total size in bytes of content of objects decoded from files and kept in memory, disabled if 0
+DECODED_OBJECT_CACHE_SIZE = int(os.environ.get('DECODED_OBJECT_CACHE_SIZE', 0))
 DEFAULT_CHUNK_SIZE = 1 * 1024 * 1024    # 1MB
 FETCH_WORKER_COUNT = int(os.environ.get('FETCH_WORKER_COUNT', 5))
 UPLOAD_WORKER_COUNT = int(os.environ.get('UPLOAD_WORKER_COUNT', 5))
+# max number of items prefetched ahead of the consumer by iterators
+PREFETCH_WINDOW_SIZE = int(os.environ.get('PREFETCH_WINDOW_SIZE', 4 * FETCH_WORKER_COUNT))
+# number of pages requested in background ahead of the consumer by iterators
+PAGE_READ_AHEAD = int(os.environ.get('PAGE_READ_AHEAD', 0))
 # chunksize of uploaded file to S3 by ARMS
 S3_CHUNK_SIZE = 5 * 1024 * 1024
+# verify downloaded content of datalake files against S3 ETag
+VERIFY_DOWNLOAD_ETAG = os.environ.get('VERIFY_DOWNLOAD_ETAG', 'true').lower() not in ('0', 'false')
 DOWNLOAD_RETRY_ATTEMPT_NUMBER = 3
+# size of byte ranges and number of workers of parallel ranged downloads
+DOWNLOAD_PART_SIZE = int(os.environ.get('DOWNLOAD_PART_SIZE', 8 * 1024 * 1024))
+DOWNLOAD_WORKER_COUNT = int(os.environ.get('DOWNLOAD_WORKER_COUNT', 4))
+# presigned download urls are refreshed this many seconds before they expire
+DOWNLOAD_URI_EXPIRY_MARGIN = int(os.environ.get('DOWNLOAD_URI_EXPIRY_MARGIN', 60))
@@ -1,20 +1,39 @@
 import base64
+import copy
 import json
 import os
 import http
-from typing import Optional, Union, Text, IO, MutableMapping, Any
+import threading
+import time
+from collections.abc import Mapping
+from typing import Callable, List, Optional, Union, Text, IO, MutableMapping, Any
 from urllib.parse import urlparse
 
-from requests import Session
+from requests import Session, Response
 from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError as RequestsHTTPError
-from requests.packages.urllib3.util.retry import Retry
+from requests.exceptions import RequestException
+from requests.structures import CaseInsensitiveDict
 
 from abeja import VERSION
 from abeja.common.auth import get_credential
+from abeja.common.json_codec import JSONCodec, get_default_codec
+from abeja.common.json_stream import JSONArrayStream, DEFAULT_STREAM_CHUNK_SIZE
+from abeja.common.metrics import (
+    RequestHook,
+    RequestMetrics,
+    body_size,
+    call_request_hooks,
+    get_request_hooks
+)
+from abeja.common.rate_limiter import RateLimiter, DEFAULT_RATE_LIMITER
+from abeja.common.response_cache import ResponseCache, DEFAULT_RESPONSE_CACHE_TTL
+from abeja.common.retry import RetryPolicy, FAILURE_STATUS_CODES
+from abeja.common.single_flight import SingleFlight
 from abeja.exceptions import (
     HttpError,
     BadRequest,
+    CircuitBreakerOpen,
     Unauthorized,
     Forbidden,
     NotFound,
@@ -25,24 +44,79 @@ from abeja.exceptions import (
 
 SDK_CONNECTION_TIMEOUT_ENV_KEY = 'ABEJA_SDK_CONNECTION_TIMEOUT'
 SDK_MAX_RETRY_COUNT_ENV_KEY = 'ABEJA_SDK_MAX_RETRY_COUNT'
+SDK_POOL_CONNECTIONS_ENV_KEY = 'ABEJA_SDK_POOL_CONNECTIONS'
+SDK_POOL_MAXSIZE_ENV_KEY = 'ABEJA_SDK_POOL_MAXSIZE'
+SDK_RESPONSE_CACHE_SIZE_ENV_KEY = 'ABEJA_SDK_RESPONSE_CACHE_SIZE'
+SDK_RESPONSE_CACHE_TTL_ENV_KEY = 'ABEJA_SDK_RESPONSE_CACHE_TTL'
 
 DEFAULT_MAX_RETRY_COUNT = 5
 DEFAULT_CONNECTION_TIMEOUT = 30
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 20
+
+
+class _JSONCodecResponse(Response):
+    """response whose json body is decoded by a json codec"""
+    json_codec = None   # type: Optional[JSONCodec]
+
+    def json(self, **kwargs):
+        if not kwargs and self.json_codec is not None:
+            try:
+                return self.json_codec.loads(self.content)
+            except ValueError:
+                # let requests handle unusual encodings and raise its own error
+                pass
+        return super().json(**kwargs)
+
 
+class _JSONCodecSession(Session):
+    """session which decodes json responses with a json codec.
 
-class Connection:
-    """A connection to ABEJA Platform API."""
+    json bodies are encoded with the codec only for requests to `api_url`,
+    bodies sent to services are encoded by requests as they are.
+    """
+
+    def __init__(self, json_codec: JSONCodec, api_url: str) -> None:
+        super().__init__()
+        self.json_codec = json_codec
+        self.api_netloc = urlparse(api_url).netloc
+
+    def prepare_request(self, request):
+        if request.json is not None and not request.data and not request.files and \
+                urlparse(request.url).netloc == self.api_netloc:
+            request.data = self.json_codec.dumps(request.json)
+            request.json = None
+            request.headers = CaseInsensitiveDict(request.headers)
+            request.headers.setdefault('Content-Type', 'application/json')
+        return super().prepare_request(request)
+
+    def send(self, request, **kwargs):
+        res = super().send(request, **kwargs)
+        res.__class__ = _JSONCodecResponse
+        res.json_codec = self.json_codec
+        return res
+
+
+class BaseConnection:
+    """common settings and credentials of connections to ABEJA Platform API."""
     BASE_URL = os.environ.get('ABEJA_API_URL', 'https://api.abeja.io')
 
     def __init__(
             self,
             credential=None,
             timeout: Optional[int] = None,
-            max_retry_count: Optional[int] = None):
+            max_retry_count: Optional[int] = None,
+            retry_policy: Optional[RetryPolicy] = None,
+            rate_limiter: Optional[RateLimiter] = None,
+            json_codec: Optional[JSONCodec] = None):
         self.timeout = timeout or os.environ.get(
             SDK_CONNECTION_TIMEOUT_ENV_KEY) or DEFAULT_CONNECTION_TIMEOUT
         self.max_retry_count = max_retry_count or os.environ.get(
             SDK_MAX_RETRY_COUNT_ENV_KEY) or DEFAULT_MAX_RETRY_COUNT
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter or DEFAULT_RATE_LIMITER
+        self.json_codec = json_codec or get_default_codec()
+        self.request_hooks = []  # type: List[RequestHook]
         if credential is None:
             self.credential = get_credential() or {}
         else:
@@ -56,6 +130,153 @@ class Connection:
             self.credential['datasource_id'] = 'datasource-{}'.format(
                 self.credential['datasource_id'])
 
+    def add_request_hook(self, hook: RequestHook) -> None:
+        """add a hook called with :class:`RequestMetrics <abeja.common.metrics.RequestMetrics>`
+        after every request of this connection.
+        """
+        self.request_hooks.append(hook)
+
+    def remove_request_hook(self, hook: RequestHook) -> None:
+        self.request_hooks.remove(hook)
+
+    def _emit_request_metrics(
+            self, build_metrics: Callable[[], RequestMetrics]) -> None:
+        """call request hooks, metrics are built only if any hook exists"""
+        hooks = self.request_hooks + get_request_hooks()
+        if hooks:
+            call_request_hooks(hooks, build_metrics())
+
+    def _before_request(self, url: str) -> str:
+        """check the circuit breaker and count a request in the retry budget
+
+        :return: host of the url
+        :raises: CircuitBreakerOpen if requests to the host are rejected
+        """
+        host = urlparse(url).netloc
+        circuit_breaker = self.retry_policy.circuit_breaker
+        if circuit_breaker is not None and not circuit_breaker.allow_request(host):
+            raise CircuitBreakerOpen(
+                'requests to {} are rejected by circuit breaker'.format(host))
+        if self.retry_policy.budget is not None:
+            self.retry_policy.budget.record_request()
+        return host
+
+    def _after_request(self, host: str, status_code: Optional[int]) -> None:
+        """record the result of a request in the circuit breaker
+
+        :param status_code: status code of the response, or None if no response
+        """
+        circuit_breaker = self.retry_policy.circuit_breaker
+        if circuit_breaker is None:
+            return
+        if status_code is None or status_code in FAILURE_STATUS_CODES:
+            circuit_breaker.record_failure(host)
+        else:
+            circuit_breaker.record_success(host)
+
+    def _get_request_headers(self, headers):
+        if headers is None:
+            headers = {}
+        headers.update(self._set_user_agent())
+        headers.update(self._get_auth_header())
+        return headers
+
+    def _get_service_url(self, subdomain: str, path: str) -> str:
+        base = urlparse(self.BASE_URL)
+        return '{}://{}.{}{}'.format(base.scheme, subdomain, base.netloc, path)
+
+    def _get_auth_header(self):
+        if self.credential.get('auth_token'):
+            return {
+                'Authorization': 'Bearer {}'.format(
+                    self.credential['auth_token'])}
+        if self.credential.get('user_id') and self.credential.get(
+                'personal_access_token'):
+            user_id = self.credential['user_id']
+            personal_access_token = self.credential['personal_access_token']
+            base = '{}:{}'.format(user_id, personal_access_token)
+            encoded = base64.b64encode(base.encode('utf-8'))
+            return {
+                'Authorization': 'Basic {}'.format(encoded.decode('utf-8'))
+            }
+        if self.credential.get('datasource_id') and self.credential.get(
+                'datasource_secret'):
+            datasource_id = self.credential['datasource_id']
+            datasource_secret = self.credential['datasource_secret']
+            base = '{}:{}'.format(datasource_id, datasource_secret)
+            encoded = base64.b64encode(base.encode('utf-8'))
+            return {
+                'Authorization': 'Basic {}'.format(encoded.decode('utf-8'))
+            }
+        return {}
+
+    def _set_user_agent(self):
+        return {'User-Agent': 'abeja-platform-sdk/{}'.format(VERSION)}
+
+
+class Connection(BaseConnection):
+    """A connection to ABEJA Platform API.
+
+    A connection owns a pooled HTTP session which is created on the first
+    request and reused by the following requests, so that TCP/TLS connections
+    are kept alive across API calls. The session is safe to share between
+    threads. Requests are retried following `retry_policy`, see
+    :class:`RetryPolicy <abeja.common.retry.RetryPolicy>`, and are paced by
+    `rate_limiter` which is shared in the process by default, see
+    :mod:`abeja.common.rate_limiter`. Metrics of each request are reported to
+    request hooks, see :mod:`abeja.common.metrics`. Call :meth:`close` (or use the connection as a context manager)
+    to release pooled connections explicitly.
+
+    Identical GET requests made by :meth:`api_request` from several threads
+    at the same time are coalesced into a single request, unless
+    `coalesce_requests` is False.
+
+    GET responses of :meth:`api_request` can be cached and revalidated with
+    conditional requests by giving a
+    :class:`ResponseCache <abeja.common.response_cache.ResponseCache>`,
+    or by setting `ABEJA_SDK_RESPONSE_CACHE_SIZE` (and optionally
+    `ABEJA_SDK_RESPONSE_CACHE_TTL` in seconds) as environment variables.
+
+    JSON bodies of :meth:`api_request` are encoded and decoded by `json_codec`,
+    which uses orjson if it is installed, see :mod:`abeja.common.json_codec`.
+
+    .. code-block:: python
+
+        with Connection() as connection:
+            connection.api_request('GET', '/organizations/1234567890123')
+    """
+
+    def __init__(
+            self,
+            credential=None,
+            timeout: Optional[int] = None,
+            max_retry_count: Optional[int] = None,
+            pool_connections: Optional[int] = None,
+            pool_maxsize: Optional[int] = None,
+            coalesce_requests: bool = True,
+            response_cache: Optional[ResponseCache] = None,
+            retry_policy: Optional[RetryPolicy] = None,
+            rate_limiter: Optional[RateLimiter] = None,
+            json_codec: Optional[JSONCodec] = None):
+        super().__init__(
+            credential, timeout, max_retry_count, retry_policy, rate_limiter,
+            json_codec)
+        self.pool_connections = int(pool_connections or os.environ.get(
+            SDK_POOL_CONNECTIONS_ENV_KEY) or DEFAULT_POOL_CONNECTIONS)
+        self.pool_maxsize = int(pool_maxsize or os.environ.get(
+            SDK_POOL_MAXSIZE_ENV_KEY) or DEFAULT_POOL_MAXSIZE)
+        self._session = None    # type: Optional[Session]
+        self._session_pid = None    # type: Optional[int]
+        self._session_lock = threading.Lock()
+        self._single_flight = SingleFlight() if coalesce_requests else None
+        if response_cache is None:
+            cache_size = int(os.environ.get(SDK_RESPONSE_CACHE_SIZE_ENV_KEY) or 0)
+            if cache_size > 0:
+                response_cache = ResponseCache(
+                    maxsize=cache_size,
+                    ttl=float(os.environ.get(SDK_RESPONSE_CACHE_TTL_ENV_KEY) or DEFAULT_RESPONSE_CACHE_TTL))
+        self.response_cache = response_cache
+
     def api_request(
             self,
             method,
@@ -76,10 +297,60 @@ class Connection:
         :param kwargs:
         :return: (dict) api response
         """
-        if headers is None:
-            headers = {}
-        headers.update(self._set_user_agent())
-        headers.update(self._get_auth_header())
+        headers = self._get_request_headers(headers)
+        if method.upper() == 'GET' and data is None and json is None and not kwargs:
+            return self._get_api_request(method, path, headers, params)
+        return self._api_request(
+            method,
+            path,
+            data=data,
+            json=json,
+            headers=headers,
+            params=params,
+            **kwargs)
+
+    def _get_api_request(self, method, path, headers, params):
+        """call GET api with request coalescing and response cache if enabled"""
+        key = (path, _freeze(params), _freeze(headers))
+        if self._single_flight is None:
+            return self._cached_api_request(key, method, path, headers, params)
+        # callers may modify the response, so give each of them its own copy.
+        res, _ = self._single_flight.do(
+            key, lambda: self._cached_api_request(
+                key, method, path, headers, params),
+            copy_result=copy.deepcopy)
+        return res
+
+    def _cached_api_request(self, key, method, path, headers, params):
+        if self.response_cache is None:
+            return self._api_request(
+                method, path, headers=headers, params=params)
+
+        entry = self.response_cache.get(key)
+        if entry is not None:
+            headers = {**headers, **entry.conditional_headers()}
+        try:
+            res = self.request(method,
+                               '{}{}'.format(self.BASE_URL, path),
+                               headers=headers,
+                               params=params)
+        except RequestsHTTPError as e:
+            http_error_handler(e)
+        if entry is not None and res.status_code == http.HTTPStatus.NOT_MODIFIED:
+            return copy.deepcopy(entry.body)
+        body = res.json()
+        self.response_cache.put(key, res.headers, body)
+        return body
+
+    def _api_request(
+            self,
+            method,
+            path,
+            data=None,
+            json=None,
+            headers=None,
+            params=None,
+            **kwargs):
         try:
             res = self.request(method,
                                '{}{}'.format(self.BASE_URL, path),
@@ -92,6 +363,39 @@ class Connection:
         except RequestsHTTPError as e:
             http_error_handler(e)
 
+    def api_request_stream(
+            self,
+            method,
+            path,
+            key: str,
+            headers=None,
+            params=None,
+            item_hook: Optional[Callable[[Any], Any]] = None,
+            chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE) -> JSONArrayStream:
+        """call platform api which returns a list, and parse the response incrementally
+
+        :param method:
+        :param path:
+        :param key: name of the list in the response
+        :param headers:
+        :param params:
+        :param item_hook: function applied to each element of the list
+        :param chunk_size: size of chunks read from the response
+        :return: (JSONArrayStream) iterator over elements of the list
+        """
+        headers = self._get_request_headers(headers)
+        try:
+            res = self.request(method,
+                               '{}{}'.format(self.BASE_URL, path),
+                               headers=headers,
+                               params=params,
+                               stream=True)
+        except RequestsHTTPError as e:
+            http_error_handler(e)
+        return JSONArrayStream(
+            res.iter_content(chunk_size), key,
+            item_hook=item_hook, on_close=res.close)
+
     def service_request(
             self,
             subdomain: str,
@@ -112,14 +416,8 @@ class Connection:
         :param kwargs:
         :return: (requests.Response)
         """
-        if headers is None:
-            headers = {}
-        headers.update(self._set_user_agent())
-        headers.update(self._get_auth_header())
-
-        base = urlparse(self.BASE_URL)
-        target_url = '{}://{}.{}{}'.format(base.scheme,
-                                           subdomain, base.netloc, path)
+        headers = self._get_request_headers(headers)
+        target_url = self._get_service_url(subdomain, path)
         try:
             return self.request(
                 method='POST',
@@ -144,6 +442,9 @@ class Connection:
             **kwargs):
         """make request with retry and timeout settings.
 
+        metrics of a response requested with `stream=True` are passed to
+        request hooks once its body is read to the end or it is closed.
+
         :param method:
         :param url:
         :param data:
@@ -156,7 +457,11 @@ class Connection:
         """
         if timeout is None:
             timeout = self.timeout
-        with self._generate_session() as session:
+        session = self._get_session()
+        self.rate_limiter.acquire(url)
+        host = self._before_request(url)
+        started_at = time.monotonic()
+        try:
             res = session.request(
                 method,
                 url,
@@ -166,56 +471,395 @@ class Connection:
                 headers=headers,
                 timeout=timeout,
                 **kwargs)
-            res.raise_for_status()
+        except RequestException as e:
+            error = e.__class__.__name__
+            self._after_request(host, None)
+            self._emit_request_metrics(lambda: RequestMetrics(
+                method, url, time.monotonic() - started_at,
+                bytes_sent=body_size(data) if json is None else None,
+                error=error))
+            raise
+        self._after_request(host, res.status_code)
+
+        def emit_metrics():
+            self._emit_request_metrics(lambda: _get_response_metrics(
+                method, url, res, time.monotonic() - started_at))
+        if kwargs.get('stream'):
+            # the body has not been read yet
+            _call_when_body_consumed(res, emit_metrics)
+        else:
+            emit_metrics()
+        res.raise_for_status()
         return res
 
+    def close(self) -> None:
+        """close the pooled session and release its connections.
+
+        the connection is still usable after closing, a new session is
+        created on the next request.
+        """
+        with self._session_lock:
+            session, self._session = self._session, None
+            self._session_pid = None
+        if session is not None:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_session(self) -> Session:
+        """return the pooled session, creating it if needed.
+
+        a session is never shared across processes because pooled sockets
+        inherited by a forked child would be shared with its parent.
+        :return: session
+        """
+        pid = os.getpid()
+        session = self._session
+        if session is not None and self._session_pid == pid:
+            return session
+        with self._session_lock:
+            if self._session is None or self._session_pid != pid:
+                self._session = self._generate_session()
+                self._session_pid = pid
+            return self._session
+
     def _generate_session(self):
         """generate simple session to retry
         :return: session
         """
-        session = Session()
-        try:
-            retries = Retry(
-                total=self.max_retry_count, backoff_factor=1, allowed_methods=(
-                    'GET', 'POST', 'PUT', 'PATCH', 'DELETE'), status_forcelist=(
-                    500, 502, 503, 504), raise_on_status=False)
-        except TypeError:
-            retries = Retry(
-                total=self.max_retry_count, backoff_factor=1, method_whitelist=(
-                    'GET', 'POST', 'PUT', 'PATCH', 'DELETE'), status_forcelist=(
-                    500, 502, 503, 504), raise_on_status=False)
-
-        session.mount('http://', HTTPAdapter(max_retries=retries))
-        session.mount('https://', HTTPAdapter(max_retries=retries))
+        session = _JSONCodecSession(self.json_codec, self.BASE_URL)
+        retries = self.retry_policy.build_retry(int(self.max_retry_count))
+        for prefix in ('http://', 'https://'):
+            session.mount(prefix, HTTPAdapter(
+                pool_connections=self.pool_connections,
+                pool_maxsize=self.pool_maxsize,
+                max_retries=retries))
         return session
 
-    def _get_auth_header(self):
-        if self.credential.get('auth_token'):
-            return {
-                'Authorization': 'Bearer {}'.format(
-                    self.credential['auth_token'])}
-        if self.credential.get('user_id') and self.credential.get(
-                'personal_access_token'):
-            user_id = self.credential['user_id']
-            personal_access_token = self.credential['personal_access_token']
-            base = '{}:{}'.format(user_id, personal_access_token)
-            encoded = base64.b64encode(base.encode('utf-8'))
-            return {
-                'Authorization': 'Basic {}'.format(encoded.decode('utf-8'))
-            }
-        if self.credential.get('datasource_id') and self.credential.get(
-                'datasource_secret'):
-            datasource_id = self.credential['datasource_id']
-            datasource_secret = self.credential['datasource_secret']
-            base = '{}:{}'.format(datasource_id, datasource_secret)
-            encoded = base64.b64encode(base.encode('utf-8'))
-            return {
-                'Authorization': 'Basic {}'.format(encoded.decode('utf-8'))
-            }
-        return {}
 
-    def _set_user_agent(self):
-        return {'User-Agent': 'abeja-platform-sdk/{}'.format(VERSION)}
+class AsyncConnection(BaseConnection):
+    """An asyncio connection to ABEJA Platform API.
+
+    This connection requires `aiohttp` which can be installed with
+    ``pip install abeja-sdk[async]``. Errors and retries are handled in the
+    same way as :class:`Connection`. The underlying session is bound to the
+    event loop on which the first request is made.
+
+    .. code-block:: python
+
+        async with AsyncConnection() as connection:
+            await connection.api_request('GET', '/organizations/1234567890123')
+    """
+
+    def __init__(
+            self,
+            credential=None,
+            timeout: Optional[int] = None,
+            max_retry_count: Optional[int] = None,
+            pool_maxsize: Optional[int] = None,
+            retry_policy: Optional[RetryPolicy] = None,
+            rate_limiter: Optional[RateLimiter] = None,
+            json_codec: Optional[JSONCodec] = None):
+        try:
+            import aiohttp
+        except ImportError:     # pragma: no cover
+            raise ImportError(
+                'aiohttp is required to use AsyncConnection. '
+                'install it with `pip install abeja-sdk[async]`.')
+        self._aiohttp = aiohttp
+        super().__init__(
+            credential, timeout, max_retry_count, retry_policy, rate_limiter,
+            json_codec)
+        self.pool_maxsize = int(pool_maxsize or os.environ.get(
+            SDK_POOL_MAXSIZE_ENV_KEY) or DEFAULT_POOL_MAXSIZE)
+        self._session = None
+
+    def _encode_json_body(self, data, json, headers):
+        """encode `json` with the json codec of this connection
+
+        :return: (data, headers) to send
+        """
+        if json is None or data is not None:
+            return data, headers
+        headers = CaseInsensitiveDict(headers)
+        headers.setdefault('Content-Type', 'application/json')
+        return self.json_codec.dumps(json), headers
+
+    async def api_request(
+            self,
+            method,
+            path,
+            data=None,
+            json=None,
+            headers=None,
+            params=None,
+            **kwargs):
+        """call platform api and handle errors if needed
+
+        :param method:
+        :param path:
+        :param data:
+        :param headers:
+        :param params:
+        :param json:
+        :param kwargs:
+        :return: (dict) api response
+        """
+        headers = self._get_request_headers(headers)
+        data, headers = self._encode_json_body(data, json, headers)
+        try:
+            res = await self.request(method,
+                                     '{}{}'.format(self.BASE_URL, path),
+                                     data=data,
+                                     headers=headers,
+                                     params=params,
+                                     **kwargs)
+            # an empty body fails to be decoded as in the sync connection
+            return self.json_codec.loads(await res.read())
+        except RequestsHTTPError as e:
+            http_error_handler(e)
+
+    async def service_request(
+            self,
+            subdomain: str,
+            path: str,
+            data: Union[None, Text, bytes, IO]=None,
+            json: Optional[Any]=None,
+            headers: Optional[MutableMapping[Text, Text]]=None,
+            params: Union[None, bytes, MutableMapping[Text, Text]]=None,
+            **kwargs):
+        """call service api and handle errors if needed
+
+        :param subdomain:
+        :param path:
+        :param data:
+        :param json:
+        :param headers:
+        :param params:
+        :param kwargs:
+        :return: (aiohttp.ClientResponse) response whose body is already read
+        """
+        headers = self._get_request_headers(headers)
+        target_url = self._get_service_url(subdomain, path)
+        try:
+            return await self.request(
+                method='POST',
+                url=target_url,
+                data=data,
+                json=json,
+                headers=headers,
+                params=params,
+                **kwargs)
+        except RequestsHTTPError as e:
+            http_error_handler(e)
+
+    async def request(
+            self,
+            method,
+            url,
+            data=None,
+            json=None,
+            headers=None,
+            params=None,
+            timeout=None,
+            **kwargs):
+        """make request with retry and timeout settings.
+
+        requests are retried on connection errors and on the status codes
+        following `retry_policy` in the same way as :class:`Connection`.
+        a file object of `data` is rewound to its position before each retry,
+        and a request whose body can not be rewound is not retried.
+
+        :param method:
+        :param url:
+        :param data:
+        :param json:
+        :param headers:
+        :param params:
+        :param timeout:
+        :param kwargs:
+        :return: (aiohttp.ClientResponse) response whose body is already read
+        :raises: requests.exceptions.HTTPError if the response status is 4xx or 5xx
+        """
+        import asyncio
+        if timeout is None:
+            timeout = self.timeout
+        client_timeout = self._aiohttp.ClientTimeout(
+            sock_connect=float(timeout), sock_read=float(timeout))
+        session = self._get_session()
+        policy = self.retry_policy
+        max_retry_count = policy.total if policy.total is not None else int(self.max_retry_count)
+        body_position = _tell_body(data)
+        retryable = policy.is_retryable(method) and \
+            (not hasattr(data, 'read') or body_position is not None)
+        retry_count = 0
+        wait = self.rate_limiter.reserve(url)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        started_at = time.monotonic()
+        # counted once as in the sync connection, retries are counted by the budget
+        host = self._before_request(url)
+        while True:
+            if retry_count > 0 and body_position is not None:
+                data.seek(body_position)
+            attempt_started_at = time.monotonic()
+            try:
+                res = await session.request(
+                    method,
+                    url,
+                    data=data,
+                    json=json,
+                    params=params,
+                    headers=headers,
+                    timeout=client_timeout,
+                    **kwargs)
+            except (self._aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error = e.__class__.__name__
+                self._after_request(host, None)
+                if not retryable or retry_count >= max_retry_count or \
+                        not self._acquire_retry_budget():
+                    self._emit_request_metrics(lambda: RequestMetrics(
+                        method, url, time.monotonic() - started_at,
+                        bytes_sent=body_size(data) if json is None else None,
+                        retry_count=retry_count,
+                        error=error))
+                    raise
+                delay = policy.get_backoff_time(retry_count + 1)
+            else:
+                self._after_request(host, res.status)
+                if not retryable or not policy.is_retryable(method, res.status) or \
+                        retry_count >= max_retry_count or \
+                        not self._acquire_retry_budget():
+                    break
+                retry_after = policy.get_retry_after(res.headers)
+                delay = retry_after if retry_after is not None \
+                    else policy.get_backoff_time(retry_count + 1)
+                res.release()
+            retry_count += 1
+            await asyncio.sleep(delay)
+
+        time_to_first_byte = time.monotonic() - attempt_started_at
+        body = await res.read()
+        self._emit_request_metrics(lambda: RequestMetrics(
+            method, url, time.monotonic() - started_at,
+            status_code=res.status,
+            bytes_sent=body_size(data) if json is None else None,
+            bytes_received=len(body),
+            retry_count=retry_count,
+            time_to_first_byte=time_to_first_byte))
+        if res.status >= 400:
+            raise RequestsHTTPError(
+                '{} Error for url: {}'.format(res.status, res.url),
+                response=_to_requests_response(res, body))
+        return res
+
+    async def close(self) -> None:
+        """close the session and release its connections."""
+        session, self._session = self._session, None
+        if session is not None:
+            await session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _acquire_retry_budget(self) -> bool:
+        budget = self.retry_policy.budget
+        return budget is None or budget.try_acquire()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = self._aiohttp.TCPConnector(limit=self.pool_maxsize)
+            self._session = self._aiohttp.ClientSession(connector=connector)
+        return self._session
+
+
+def _tell_body(data) -> Optional[int]:
+    """position of a file object to send, or None if it is not a seekable file"""
+    if not hasattr(data, 'read'):
+        return None
+    try:
+        if hasattr(data, 'seekable') and not data.seekable():
+            return None
+        return data.tell()
+    except (AttributeError, OSError):
+        return None
+
+
+def _freeze(value) -> str:
+    """hashable representation of request params or headers"""
+    if isinstance(value, Mapping):
+        return repr(sorted(value.items(), key=lambda item: str(item[0])))
+    return repr(value)
+
+
+def _call_when_body_consumed(res: Response, callback: Callable[[], None]) -> None:
+    """call `callback` once when the body of a streamed response is read to the end,
+    or when the response is closed
+    """
+    iter_content = res.iter_content
+    close = res.close
+    called = []  # type: List[bool]
+
+    def call_once():
+        if not called:
+            called.append(True)
+            callback()
+
+    def iter_content_and_call(*args, **kwargs):
+        yield from iter_content(*args, **kwargs)
+        call_once()
+
+    def close_and_call():
+        try:
+            close()
+        finally:
+            call_once()
+
+    res.iter_content = iter_content_and_call  # type: ignore
+    res.close = close_and_call  # type: ignore
+
+
+def _get_response_metrics(
+        method: str, url: str, res: Response, elapsed: float) -> RequestMetrics:
+    bytes_sent = body_size(res.request.body) if res.request is not None else None
+    content_length = res.headers.get('Content-Length')
+    if content_length is not None and content_length.isdigit():
+        bytes_received = int(content_length)  # type: Optional[int]
+    elif res._content_consumed and isinstance(res._content, bytes):
+        bytes_received = len(res._content)
+    elif res._content_consumed and hasattr(res.raw, 'tell'):
+        # a streamed body read with `iter_content`, counted as it is sent
+        bytes_received = res.raw.tell()
+    else:
+        bytes_received = None
+    retries = getattr(res.raw, 'retries', None)
+    return RequestMetrics(
+        method,
+        url,
+        elapsed,
+        status_code=res.status_code,
+        bytes_sent=bytes_sent,
+        bytes_received=bytes_received,
+        retry_count=len(retries.history) if retries is not None else 0,
+        time_to_first_byte=res.elapsed.total_seconds())
+
+
+def _to_requests_response(res, body: bytes) -> Response:
+    """convert aiohttp response into requests response to share error handling"""
+    response = Response()
+    response.status_code = res.status
+    response.url = str(res.url)
+    response.headers = CaseInsensitiveDict(res.headers)
+    response.encoding = res.charset
+    response._content = body
+    return response
 
 
 STATUS_CODE_EXCEPTION_CLASS_MAP = {
@@ -0,0 +1,116 @@
+"""Content-addressed store of cached files.
+
+The same content is often referred by several uris, such as datalake files
+of different channels and http urls in `source_data` of dataset items.
+If `ABEJA_STORAGE_DEDUP` is enabled, content is saved once in
+`[ABEJA_STORAGE_DIR_PATH]/.objects/<etag>`, and the cache file of each uri
+is a hard link to it. The ETag of a download is known from the response
+headers before its body is read, so content stored already is linked
+without downloading it again.
+
+Only ETags which are md5 of content, as those of S3, are used, since other
+ETags, e.g. of nginx, may be the same for different content.
+"""
+import os
+import threading
+from typing import Dict, Optional
+
+from abeja.common.config import STORAGE_DEDUP
+from abeja.common.s3etag import parse_s3etag
+
+OBJECTS_DIR = '.objects'
+
+
+class ContentStore:
+    """objects in a cache directory keyed by ETag
+
+    :param root: cache directory
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.objects_dir = os.path.join(root, OBJECTS_DIR)
+
+    def object_path(self, etag: Optional[str]) -> Optional[str]:
+        """return the path of an object, or None if the ETag is not md5 of content"""
+        parsed = parse_s3etag(etag)
+        if parsed is None:
+            return None
+        md5, part_count = parsed
+        name = md5 if part_count == 1 else '{}-{}'.format(md5, part_count)
+        return os.path.join(self.objects_dir, name[:2], name)
+
+    def contains(self, etag: Optional[str]) -> bool:
+        object_path = self.object_path(etag)
+        return object_path is not None and os.path.exists(object_path)
+
+    def link(self, etag: Optional[str], path: str) -> bool:
+        """save the object of `etag` in `path` as a hard link
+
+        :return: False if the object is not stored
+        """
+        object_path = self.object_path(etag)
+        if object_path is None:
+            return False
+        tmppath = '{}.{}-link'.format(path, os.getpid())
+        try:
+            os.link(object_path, tmppath)
+        except OSError:
+            return False
+        os.replace(tmppath, path)
+        return True
+
+    def add(self, etag: Optional[str], path: str) -> bool:
+        """store content of a file saved in `path`
+
+        if the object is stored already by another uri, `path` is replaced
+        with a link to it, so that the content is saved only once.
+
+        :return: False if the content can not be stored
+        """
+        object_path = self.object_path(etag)
+        if object_path is None:
+            return False
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        try:
+            os.link(path, object_path)
+            return True
+        except FileExistsError:
+            if os.path.samefile(path, object_path):
+                return True
+            return self.link(etag, path)
+        except OSError:
+            # e.g. hard links are not supported by the file system
+            return False
+
+    def collect_garbage(self) -> int:
+        """remove objects not linked by any cache file
+
+        :return: freed bytes
+        """
+        freed = 0
+        for dirpath, _, filenames in os.walk(self.objects_dir):
+            for name in filenames:
+                object_path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(object_path)
+                    if stat.st_nlink == 1:
+                        os.remove(object_path)
+                        freed += stat.st_size
+                except OSError:
+                    continue
+        return freed
+
+
+_stores = {}    # type: Dict[str, ContentStore]
+_stores_lock = threading.Lock()
+
+
+def get_content_store(root: str) -> Optional[ContentStore]:
+    """return the store of `root`, usually `MOUNT_DIR`, or None if disabled"""
+    if not STORAGE_DEDUP:
+        return None
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = ContentStore(root)
+        return _stores[root]
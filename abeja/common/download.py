@@ -0,0 +1,421 @@
+"""Parallel ranged downloads.
+
+An object is split into byte ranges of `part_size` which are fetched
+concurrently with HTTP `Range` requests, and each part is written at its
+own offset of the destination. The first range request tells the total
+size of the object, so small objects need a single request as before. If
+the server ignores `Range` header, the whole content of the first response
+is written as a single stream.
+
+With `verify_etag`, content is checked against the S3 ETag while it is
+written, see :class:`S3ETagVerifier <abeja.common.s3etag.S3ETagVerifier>`.
+"""
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from requests.exceptions import ChunkedEncodingError, HTTPError
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.models import Response
+
+from abeja.common.config import (
+    DEFAULT_CHUNK_SIZE,
+    DOWNLOAD_PART_SIZE,
+    DOWNLOAD_WORKER_COUNT,
+    S3_CHUNK_SIZE
+)
+from abeja.common.s3etag import S3ETagVerifier, content_md5_etag
+from abeja.exceptions import EtagHashNotMatch, IncompleteDownload
+
+# function to make a GET request with given headers, and return streamed response
+RangeRequest = Callable[[Dict[str, str]], Response]
+
+_CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+
+class FileSink:
+    """write parts into a binary file object with positional writes"""
+
+    def __init__(self, f: BinaryIO) -> None:
+        self._f = f
+        self._fd = f.fileno()
+        self._lock = threading.Lock()
+
+    def truncate(self, size: int) -> None:
+        self._f.truncate(size)
+
+    def write_at(self, offset: int, data: bytes) -> None:
+        if hasattr(os, 'pwrite'):
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(self._fd, view, offset)
+                view = view[written:]
+                offset += written
+        else:   # pragma: no cover
+            with self._lock:
+                self._f.seek(offset)
+                self._f.write(data)
+
+
+class BufferSink:
+    """write parts into an in-memory buffer"""
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+
+    def truncate(self, size: int) -> None:
+        del self.buffer[size:]
+        self.buffer.extend(bytes(size - len(self.buffer)))
+
+    def write_at(self, offset: int, data: bytes) -> None:
+        self.buffer[offset:offset + len(data)] = data
+
+
+class _VerifyingSink:
+    """pass parts to a sink, computing the ETag of them"""
+
+    def __init__(self, sink, verifier: S3ETagVerifier) -> None:
+        self._sink = sink
+        self._verifier = verifier
+
+    def truncate(self, size: int) -> None:
+        self._sink.truncate(size)
+
+    def write_at(self, offset: int, data: bytes) -> None:
+        self._verifier.update(offset, data)
+        self._sink.write_at(offset, data)
+
+
+class ContentCached(Exception):
+    """content of an object is saved already, and the download is stopped"""
+
+    def __init__(self, etag: str) -> None:
+        super().__init__('content of {} is cached'.format(etag))
+        self.etag = etag
+
+
+class DownloadState:
+    """progress of a download, saved in a sidecar json file to resume the download.
+
+    the sidecar records the validator (ETag) and the size of the object, and
+    the byte ranges already written. a download is resumable only if the
+    object has an ETag, so that changed objects are never mixed.
+
+    if `is_cached(etag)` returns True for the ETag of the first response,
+    the download stops with :class:`ContentCached` before reading content.
+    """
+
+    def __init__(
+            self,
+            path: Optional[str] = None,
+            is_cached: Optional[Callable[[str], bool]] = None) -> None:
+        self.path = path
+        self.is_cached = is_cached
+        self.etag = None   # type: Optional[str]
+        self.size = None   # type: Optional[int]
+        self.parts = []    # type: List[Tuple[int, int]]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(
+            cls,
+            path: str,
+            is_cached: Optional[Callable[[str], bool]] = None) -> 'DownloadState':
+        """load a state from the sidecar file, or return an empty state"""
+        state = cls(path, is_cached)
+        try:
+            with open(path) as f:
+                record = json.load(f)
+            etag, size, parts = record['etag'], record['size'], record['parts']
+            state.parts = [(int(start), int(end)) for start, end in parts]
+            state.etag, state.size = str(etag), int(size)
+        except (OSError, ValueError, KeyError, TypeError):
+            state.reset()
+        return state
+
+    def is_resumable(self) -> bool:
+        return bool(self.etag) and self.size is not None
+
+    def start(self, etag: Optional[str], size: int) -> None:
+        with self._lock:
+            self.etag, self.size, self.parts = etag, size, []
+            self._save()
+
+    def add_part(self, start: int, end: int) -> None:
+        with self._lock:
+            self.parts.append((start, end))
+            self._save()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.etag, self.size, self.parts = None, None, []
+
+    def missing_ranges(self, part_size: int) -> List[Tuple[int, int]]:
+        """byte ranges not written yet, split in `part_size`"""
+        size = self.size
+        assert size is not None, 'the download is not started'
+        ranges = []
+        offset = 0
+        for start, end in sorted(self.parts) + [(size, size)]:
+            for s in range(offset, start, part_size):
+                ranges.append((s, min(s + part_size, start) - 1))
+            offset = max(offset, end + 1)
+        return ranges
+
+    def remove(self) -> None:
+        """remove the sidecar file"""
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _save(self) -> None:
+        if self.path is None or not self.is_resumable():
+            return
+        tmppath = '{}.tmp'.format(self.path)
+        with open(tmppath, 'w') as f:
+            json.dump({'etag': self.etag, 'size': self.size, 'parts': self.parts}, f)
+        os.replace(tmppath, self.path)
+
+
+def is_interrupted_download(error: BaseException) -> bool:
+    """whether a download failed in the middle and can be resumed"""
+    return isinstance(error, (IncompleteDownload, ChunkedEncodingError, RequestsConnectionError))
+
+
+def download(
+        request: RangeRequest,
+        sink,
+        part_size: Optional[int] = None,
+        worker_count: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        state: Optional['DownloadState'] = None,
+        verify_etag: bool = False) -> int:
+    """download an object into `sink` with parallel range requests
+
+    if `state` records parts downloaded before, only the missing parts are
+    requested as long as the object is not changed.
+
+    if `verify_etag` is True, content is verified against the S3 ETag while
+    it is written. ranges are aligned to the parts of a multipart upload,
+    and an object uploaded at once is verified only if it is downloaded in
+    a single request, since md5 of parallel ranges can not be combined.
+    content is not verified if it can not be, e.g. when a download is resumed.
+
+    :param request: function to make a GET request with given headers
+    :param sink: :class:`FileSink` or :class:`BufferSink`
+    :param part_size: size of a range, `DOWNLOAD_PART_SIZE` by default
+    :param worker_count: number of concurrent requests, `DOWNLOAD_WORKER_COUNT` by default
+    :param chunk_size: size of chunks read from a response
+    :param state: progress of the download to resume and to update
+    :param verify_etag: whether to verify content against the S3 ETag
+    :return: size of the object
+    :raises: IncompleteDownload if a part is missing or truncated
+    :raises: EtagHashNotMatch if content does not match the ETag
+    :raises: ContentCached if `state.is_cached` returns True for the ETag
+    """
+    part_size = part_size or DOWNLOAD_PART_SIZE
+    worker_count = worker_count or DOWNLOAD_WORKER_COUNT
+    if verify_etag and part_size >= S3_CHUNK_SIZE:
+        # the first range is requested before the part size of the upload
+        # is known, so align it to the chunk size used by the platform
+        part_size = max(1, round(part_size / S3_CHUNK_SIZE)) * S3_CHUNK_SIZE
+    if state is None:
+        state = DownloadState()
+    if state.is_resumable():
+        size = state.size
+        assert size is not None
+        sink.truncate(size)
+        try:
+            _download_parts(
+                request, sink, state, state.missing_ranges(part_size),
+                worker_count, chunk_size)
+            return size
+        except HTTPError as e:
+            # the object is changed since the last download
+            if e.response is None or e.response.status_code != 412:
+                raise
+        state.reset()
+
+    try:
+        res = request({'Range': 'bytes=0-{}'.format(part_size - 1)})
+    except HTTPError as e:
+        # an empty object can not satisfy any range
+        if e.response is None or e.response.status_code != 416:
+            raise
+        res = request({})
+    _check_cached(res, state)
+
+    if res.status_code == 206 and res.headers.get('Content-Encoding', 'identity') != 'identity':
+        # ranges of encoded content can not be decoded separately
+        res.close()
+        res = request({})
+    if res.status_code != 206:
+        # the server ignores ranges, take the whole content as a single stream
+        state.reset()
+        # not resumable without the size, but tells the version of content
+        state.etag = res.headers.get('ETag')
+        verifier = _create_verifier(res) if verify_etag else None
+        if verifier is not None:
+            sink = _VerifyingSink(sink, verifier)
+        size = _write_response(res, sink, 0, chunk_size)
+        sink.truncate(size)
+        _verify(verifier, state)
+        return size
+
+    content_range = _parse_content_range(res)
+    if content_range is None or content_range[0] != 0:
+        res.close()
+        raise IncompleteDownload(
+            'unexpected Content-Range for the first part: {}'.format(
+                res.headers.get('Content-Range')))
+    _, end, size = content_range
+    sink.truncate(size)
+    state.start(res.headers.get('ETag'), size)
+    verifier = _create_verifier(res, size) if verify_etag else None
+    if verifier is not None and not verifier.is_multipart and end + 1 < size:
+        verifier = None
+    if verifier is not None:
+        sink = _VerifyingSink(sink, verifier)
+        ranges = _split_ranges(end + 1, size, part_size, align=verifier.part_size)
+    else:
+        ranges = _split_ranges(end + 1, size, part_size)
+    _download_parts(
+        request, sink, state, ranges, worker_count, chunk_size, first_part=(res, end))
+    _verify(verifier, state)
+    return size
+
+
+def _check_cached(res: Response, state: 'DownloadState') -> None:
+    etag = res.headers.get('ETag')
+    if etag and state.is_cached is not None and state.is_cached(etag):
+        res.close()
+        state.reset()
+        state.etag = etag
+        raise ContentCached(etag)
+
+
+def _create_verifier(res: Response, size: Optional[int] = None) -> Optional[S3ETagVerifier]:
+    if res.headers.get('Content-Encoding', 'identity') != 'identity':
+        # ETag is computed from the encoded content
+        return None
+    if size is None:
+        try:
+            size = int(res.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return None
+    return S3ETagVerifier.create(content_md5_etag(res.headers), size)
+
+
+def _verify(verifier: Optional[S3ETagVerifier], state: 'DownloadState') -> None:
+    if verifier is None:
+        return
+    try:
+        verifier.verify()
+    except EtagHashNotMatch:
+        # the parts are corrupted, so do not resume from them
+        state.reset()
+        state.remove()
+        raise
+
+
+def _split_ranges(
+        start: int,
+        size: int,
+        part_size: int,
+        align: Optional[int] = None) -> List[Tuple[int, int]]:
+    """split bytes from `start` to the end into ranges of `part_size`.
+
+    if `align` is given, ranges end at multiples of `align`, so that each
+    part of a multipart upload is downloaded by a single request.
+    """
+    if align is None:
+        return [(s, min(s + part_size, size) - 1) for s in range(start, size, part_size)]
+    part_size = max(1, part_size // align) * align
+    ranges = []
+    while start < size:
+        end = min((start // part_size + 1) * part_size, size)
+        ranges.append((start, end - 1))
+        start = end
+    return ranges
+
+
+def _download_parts(
+        request: RangeRequest,
+        sink,
+        state: 'DownloadState',
+        ranges: List[Tuple[int, int]],
+        worker_count: int,
+        chunk_size: int,
+        first_part: Optional[Tuple[Response, int]] = None) -> None:
+    headers = {}
+    if state.etag:
+        # fail rather than mix parts of different versions of the object
+        headers['If-Match'] = state.etag
+    if first_part is not None and not ranges:
+        _write_part(first_part[0], sink, state, 0, first_part[1], chunk_size)
+        return
+
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        futures = []
+        if first_part is not None:
+            futures.append(executor.submit(
+                _write_part, first_part[0], sink, state, 0, first_part[1], chunk_size))
+        futures += [
+            executor.submit(_download_part, request, headers, sink, state, s, e, chunk_size)
+            for s, e in ranges]
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in not_done:
+            future.cancel()
+        for future in done:
+            future.result()
+
+
+def _download_part(
+        request: RangeRequest,
+        headers: Dict[str, str],
+        sink,
+        state: 'DownloadState',
+        start: int,
+        end: int,
+        chunk_size: int) -> None:
+    res = request({**headers, 'Range': 'bytes={}-{}'.format(start, end)})
+    content_range = _parse_content_range(res) if res.status_code == 206 else None
+    if content_range is None or content_range[:2] != (start, end):
+        res.close()
+        raise IncompleteDownload(
+            'range {}-{} is not returned by the server'.format(start, end))
+    _write_part(res, sink, state, start, end, chunk_size)
+
+
+def _write_part(
+        res: Response,
+        sink,
+        state: 'DownloadState',
+        start: int,
+        end: int,
+        chunk_size: int) -> None:
+    written = _write_response(res, sink, start, chunk_size)
+    if written != end - start + 1:
+        raise IncompleteDownload(
+            'range {}-{} is truncated at {} bytes'.format(start, end, written))
+    state.add_part(start, end)
+
+
+def _write_response(res: Response, sink, offset: int, chunk_size: int) -> int:
+    """write the body of a response at `offset`, and return the number of written bytes"""
+    written = 0
+    with res:
+        for chunk in res.iter_content(chunk_size=chunk_size):
+            sink.write_at(offset + written, chunk)
+            written += len(chunk)
+    return written
+
+
+def _parse_content_range(res: Response) -> Optional[Tuple[int, int, int]]:
+    """parse `Content-Range: bytes <start>-<end>/<size>` header"""
+    m = _CONTENT_RANGE.match(res.headers.get('Content-Range', ''))
+    if m is None or m.group(3) == '*':
+        return None
+    return int(m.group(1)), int(m.group(2)), int(m.group(3))
@@ -1,7 +1,13 @@
+from typing import BinaryIO, Dict, Optional
+
 import requests
+from requests.models import Response
+from retrying import retry
 
+from abeja.common.config import DOWNLOAD_RETRY_ATTEMPT_NUMBER
 from abeja.common.connection import http_error_handler
-from abeja.common.local_file import use_binary_cache
+from abeja.common.download import DownloadState, FileSink, download, is_interrupted_download
+from abeja.common.local_file import use_binary_download_cache, use_buffer_download_cache
 from abeja.common.source_data import SourceData
 from abeja.datalake.api.client import APIClient
 
@@ -13,10 +19,15 @@ class HTTPFile(SourceData):
 
     def get_content(self, cache: bool = True) -> bytes:
         if cache:
-            decorated = use_binary_cache(self._get_content_from_remote)
+            decorated = use_binary_download_cache(self._download_to_file)
             return decorated(self)
         return self._get_content_from_remote()
 
+    def get_buffer(self) -> memoryview:
+        """get content as a read-only memoryview over the cache file"""
+        decorated = use_buffer_download_cache(self._download_to_file)
+        return decorated(self)
+
     def _get_content_from_remote(self):
         try:
             res = self.__api._connection.request("GET", self.uri)
@@ -24,6 +35,21 @@ class HTTPFile(SourceData):
         except requests.exceptions.HTTPError as e:
             raise http_error_handler(e)
 
+    def _request_range(self, headers: Dict[str, str]) -> Response:
+        return self.__api._connection.request(
+            "GET", self.uri, headers=headers, stream=True)
+
+    @retry(stop_max_attempt_number=DOWNLOAD_RETRY_ATTEMPT_NUMBER,
+           retry_on_exception=is_interrupted_download)
+    def _download_to_file(
+            self, f: BinaryIO, state: Optional[DownloadState] = None) -> None:
+        """download content into a binary file with parallel range requests,
+        interrupted downloads are resumed from the parts recorded in `state`"""
+        try:
+            download(self._request_range, FileSink(f), state=state)
+        except requests.exceptions.HTTPError as e:
+            raise http_error_handler(e)
+
     def to_source_data(self):
         return {
             "data_uri": self.uri,
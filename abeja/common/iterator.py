@@ -1,8 +1,17 @@
 from abc import ABCMeta, abstractmethod
 
+from abeja.common.config import PAGE_READ_AHEAD
+from abeja.common.prefetch import read_ahead
+
 
 class Iterator(metaclass=ABCMeta):
-    """abstract class for page iterator"""
+    """abstract class for page iterator
+
+    if `page_read_ahead` is positive, up to the number of next pages are
+    requested in background while the current page is consumed, so that the
+    consumer does not wait for an API round trip at each page boundary.
+    """
+    page_read_ahead = PAGE_READ_AHEAD
 
     def __iter__(self):
         return self._items_iter()
@@ -13,6 +22,11 @@ class Iterator(metaclass=ABCMeta):
                 yield item
 
     def _page_iter(self):
+        if self.page_read_ahead and self.page_read_ahead > 0:
+            return read_ahead(self._pages(), self.page_read_ahead)
+        return self._pages()
+
+    def _pages(self):
         page = self._page()
         while page:
             yield page
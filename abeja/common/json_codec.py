@@ -0,0 +1,103 @@
+"""JSON codecs used to encode request bodies and decode responses of api requests.
+
+:class:`OrjsonCodec` is used by default if `orjson` is installed
+(``pip install abeja-sdk[orjson]``), otherwise :class:`StdlibJSONCodec`.
+The codec can be chosen per connection, or for the process by setting
+`ABEJA_SDK_JSON_CODEC` environment variable to ``orjson`` or ``json``.
+"""
+import json
+import os
+from typing import Any, Optional, Union
+
+SDK_JSON_CODEC_ENV_KEY = 'ABEJA_SDK_JSON_CODEC'
+
+
+class JSONCodec:
+    """base class of json codecs"""
+    name = ''
+
+    def loads(self, s: Union[bytes, str]) -> Any:
+        """decode a json document
+
+        :raises: ValueError (json.JSONDecodeError) if `s` is not valid json
+        """
+        raise NotImplementedError
+
+    def dumps(self, obj: Any) -> bytes:
+        """encode an object to a utf-8 json document"""
+        raise NotImplementedError
+
+
+class StdlibJSONCodec(JSONCodec):
+    """json codec of the standard library"""
+    name = 'json'
+
+    def loads(self, s: Union[bytes, str]) -> Any:
+        return json.loads(s)
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+
+class OrjsonCodec(JSONCodec):
+    """json codec backed by orjson.
+
+    documents which orjson does not accept, such as integers over 64 bits,
+    NaN or objects with non-str keys, are handled by the standard library
+    instead. datetime and dataclass objects are not serialized implicitly,
+    in the same way as :class:`StdlibJSONCodec`.
+    """
+    name = 'orjson'
+
+    def __init__(self) -> None:
+        import orjson
+        self._orjson = orjson
+        self._dumps_option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        self._fallback = StdlibJSONCodec()
+
+    def loads(self, s: Union[bytes, str]) -> Any:
+        try:
+            return self._orjson.loads(s)
+        except self._orjson.JSONDecodeError:
+            return self._fallback.loads(s)
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return self._orjson.dumps(obj, option=self._dumps_option)
+        except TypeError:
+            return self._fallback.dumps(obj)
+
+
+_CODECS = {
+    StdlibJSONCodec.name: StdlibJSONCodec,
+    OrjsonCodec.name: OrjsonCodec,
+}
+
+_default_codec = None   # type: Optional[JSONCodec]
+
+
+def get_codec(name: str) -> JSONCodec:
+    """return a codec by its name
+
+    :raises: ValueError if the name is unknown
+    :raises: ImportError if the backend of the codec is not installed
+    """
+    try:
+        return _CODECS[name]()
+    except KeyError:
+        raise ValueError('unknown json codec: {}'.format(name))
+
+
+def get_default_codec() -> JSONCodec:
+    """return the codec shared by connections in the process"""
+    global _default_codec
+    if _default_codec is None:
+        name = os.environ.get(SDK_JSON_CODEC_ENV_KEY)
+        if name:
+            _default_codec = get_codec(name)
+        else:
+            try:
+                _default_codec = OrjsonCodec()
+            except ImportError:
+                _default_codec = StdlibJSONCodec()
+    return _default_codec
@@ -0,0 +1,182 @@
+"""Incremental parsing of large list responses.
+
+A list response such as ``{"items": [...], "next_page_token": "xxx"}`` is
+parsed from the response stream and the elements of the array are yielded
+one by one as they arrive, so that the whole page is never held in memory.
+"""
+import codecs
+import json
+import re
+from typing import Any, Callable, Dict, Generator, Iterable, Iterator, Optional
+
+DEFAULT_STREAM_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# characters which may continue a number, up to the end of the buffer
+_NUMBER_TAIL = re.compile(r'[0-9.eE+\-]*\Z')
+
+
+class JSONArrayStream:
+    """an iterator over elements of the array `key` of a json object.
+
+    other members of the object are stored in :attr:`fields` as they are
+    parsed, so members following the array, such as `next_page_token`,
+    are available once the iteration is finished.
+
+    .. code-block:: python
+
+        stream = JSONArrayStream(res.iter_content(65536), 'items')
+        for item in stream:
+            ...
+        next_page_token = stream.fields.get('next_page_token')
+
+    :param chunks: bytes of the json document
+    :param key: name of the array to iterate
+    :param item_hook: function applied to each element before it is returned
+    :param on_close: function called when the stream is exhausted or closed
+    :raises: ValueError (json.JSONDecodeError) if the document is not valid json
+    """
+
+    def __init__(
+            self,
+            chunks: Iterable[bytes],
+            key: str,
+            item_hook: Optional[Callable[[Any], Any]] = None,
+            on_close: Optional[Callable[[], None]] = None) -> None:
+        self.key = key
+        self.fields = {}  # type: Dict[str, Any]
+        self._chunks = iter(chunks)
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self._item_hook = item_hook
+        self._on_close = on_close
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._items = self._parse()
+
+    def __iter__(self) -> Iterator[Any]:
+        return self
+
+    def __next__(self) -> Any:
+        try:
+            return next(self._items)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read_all(self) -> Dict[str, Any]:
+        """read the rest of the stream and return the whole object"""
+        items = list(self)
+        return {**self.fields, self.key: items}
+
+    def close(self) -> None:
+        self._items.close()
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close()
+
+    def _parse(self) -> Generator[Any, None, None]:
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._read_value()
+            if not isinstance(key, str):
+                raise self._error('Expecting property name')
+            self._expect(':')
+            if key == self.key and self._peek() == '[':
+                self._pos += 1
+                yield from self._parse_array()
+            else:
+                self.fields[key] = self._read_value()
+            if self._read_delimiter(',}') == '}':
+                return
+
+    def _parse_array(self) -> Iterator[Any]:
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            item = self._read_value()
+            yield item if self._item_hook is None else self._item_hook(item)
+            if self._read_delimiter(',]') == ']':
+                return
+
+    def _read_value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # the buffer is doubled before decoding the value again, so that
+                # a large value is not decoded from its start for every chunk
+                if self._fill(2 * (len(self._buffer) - self._pos)):
+                    continue
+                raise
+            # a number at the end of the buffer may continue in the next chunk,
+            # e.g. `1.` is decoded as `1` until `25` arrives
+            if self._is_number(value) and \
+                    _NUMBER_TAIL.match(self._buffer, end) is not None and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    @staticmethod
+    def _is_number(value: Any) -> bool:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def _read_delimiter(self, delimiters: str) -> str:
+        c = self._peek()
+        if c not in delimiters:
+            raise self._error("Expecting '{}' delimiter".format("' or '".join(delimiters)))
+        self._pos += 1
+        return c
+
+    def _expect(self, c: str) -> None:
+        self._read_delimiter(c)
+
+    def _peek(self) -> str:
+        """skip whitespaces and return the next character"""
+        while True:
+            # the pattern matches an empty string at any position
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()  # type: ignore
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise self._error('Unexpected end of data')
+
+    def _fill(self, size: int = 0) -> bool:
+        """read chunks into the buffer until `size` characters are left to parse
+
+        at least one chunk is read.
+
+        :return: False if the stream has been read to the end
+        """
+        if self._eof:
+            return False
+        texts = [self._buffer[self._pos:]]
+        length = len(texts[0])
+        while True:
+            try:
+                text = self._text_decoder.decode(next(self._chunks))
+            except StopIteration:
+                self._eof = True
+                text = self._text_decoder.decode(b'', final=True)
+            texts.append(text)
+            length += len(text)
+            if self._eof or length >= size:
+                break
+        self._buffer = ''.join(texts)
+        self._pos = 0
+        return True
+
+    def _error(self, msg: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(msg, self._buffer, self._pos)
@@ -0,0 +1,340 @@
+"""Size-bounded local cache.
+
+Files cached in `MOUNT_DIR` by :mod:`abeja.common.local_file` are evicted
+when the total size exceeds `ABEJA_STORAGE_SIZE_LIMIT` bytes, until it is
+reduced to `ABEJA_STORAGE_SIZE_LOW_WATERMARK` of the limit.
+
+- LRU: files are evicted in the order of access time, which is updated
+  explicitly on each cache hit, so `noatime` mounts are supported.
+- LFU: files are evicted in the order of the number of cache hits, and
+  then of access time. hits are counted in this process, or shared by
+  processes if the cache is indexed.
+
+If `ABEJA_STORAGE_INDEX` is enabled, lookups and eviction read the index
+of :mod:`abeja.common.cache_index` instead of the files on disk.
+
+If `ABEJA_STORAGE_DEDUP` is enabled, cached files may be hard links to the
+same object of :mod:`abeja.common.content_store`. Without the index, the
+size of such files is counted once. The index counts it for each file, so
+the total size is overestimated and files may be evicted earlier. An object
+is removed when no cached file links to it.
+
+Processes sharing the directory are coordinated with `flock`. Only one
+process evicts at a time, and a file is removed only if it can be locked
+exclusively, so files pinned by :meth:`LocalCache.pin` in any process are
+never removed. Files being downloaded are not cache entries and are kept.
+
+The limit is shared by the processes. The index tells the total size
+written by all of them. Without the index, each process counts its own
+writes, and lists files on disk again every
+`ABEJA_STORAGE_USAGE_CHECK_INTERVAL` seconds, or when it has written as
+much as eviction frees, to notice writes of the others.
+"""
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from abeja.common.cache_index import CacheIndex, get_cache_index, walk_entries
+from abeja.common.content_store import ContentStore, get_content_store
+from abeja.common.config import (
+    STORAGE_EVICTION_POLICY,
+    STORAGE_INDEX,
+    STORAGE_SIZE_LIMIT,
+    STORAGE_SIZE_LOW_WATERMARK,
+    STORAGE_USAGE_CHECK_INTERVAL
+)
+from abeja.common.logging import logger
+
+try:
+    import fcntl
+except ImportError:     # pragma: no cover
+    fcntl = None    # type: ignore
+
+EVICTION_LOCK_FILE = '.eviction.lock'
+EVICTION_POLICIES = ('lru', 'lfu')
+
+
+class LocalCache:
+    """manage the total size of files in a cache directory
+
+    :param root: cache directory
+    :param size_limit: max total size in bytes, unlimited if 0
+    :param policy: `lru` or `lfu`
+    :param low_watermark: ratio of the limit to which the total size is reduced
+    :param index: index of cached files, files on disk are listed if None
+    :param store: content store whose objects are linked by cached files
+    :param usage_check_interval: seconds after which files on disk are
+        listed again to count writes of other processes, if not indexed
+    """
+
+    def __init__(
+            self,
+            root: str,
+            size_limit: int = 0,
+            policy: str = 'lru',
+            low_watermark: float = 0.9,
+            index: Optional[CacheIndex] = None,
+            store: Optional[ContentStore] = None,
+            usage_check_interval: float = 60) -> None:
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(
+                'eviction policy should be one of {}, but {}'.format(EVICTION_POLICIES, policy))
+        self.root = root
+        self.size_limit = size_limit
+        self.policy = policy
+        self.low_watermark = low_watermark
+        self.index = index
+        self.store = store
+        self.usage_check_interval = usage_check_interval
+        self._hits = Counter()  # type: Counter
+        self._pins = Counter()  # type: Counter
+        self._usage = None   # type: Optional[int]
+        self._written = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.size_limit > 0
+
+    def lookup(self, path: str) -> bool:
+        """whether a file is cached, and record the access if so
+
+        an indexed file is not checked on disk. if it fails to be read as
+        it is removed, :meth:`discard` it and save it again.
+        """
+        if self.index is not None and self.index.touch(path):
+            return True
+        if not os.path.exists(path):
+            return False
+        if self.index is not None:
+            # saved by a process without the index
+            self.index.add(path, os.path.getsize(path))
+        else:
+            self.record_access(path)
+        return True
+
+    def record_access(self, path: str) -> None:
+        """record a cache hit of a file"""
+        if self.index is not None:
+            self.index.touch(path)
+            return
+        if not self.enabled:
+            return
+        with self._lock:
+            self._hits[path] += 1
+        try:
+            # keep mtime, which tells when content is saved
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            pass
+
+    def discard(self, path: str) -> None:
+        """forget a cached file which is removed"""
+        if self.index is not None:
+            self.index.remove(path)
+        with self._lock:
+            self._hits.pop(path, None)
+
+    def record_write(self, path: str, **info) -> None:
+        """record a file saved in the cache, and evict files if needed
+
+        :param info: information of the source saved in the index,
+            see :meth:`CacheIndex.add <abeja.common.cache_index.CacheIndex.add>`
+        """
+        if self.index is None and not self.enabled:
+            return
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if self.index is not None:
+            self.index.add(path, size, **info)
+        if not self.enabled:
+            return
+        if self.index is not None:
+            # includes files written by other processes
+            usage = self.index.total_size()     # type: Optional[int]
+        else:
+            with self._lock:
+                if self._usage is not None:
+                    self._usage += size
+                    self._written += size
+                    if self._written >= self.size_limit - int(self.size_limit * self.low_watermark) or \
+                            time.monotonic() - self._checked_at >= self.usage_check_interval:
+                        # other processes may have written files as well
+                        self._usage = None
+                usage = self._usage
+        if usage is None or usage > self.size_limit:
+            self.evict(exclude=path)
+
+    @contextmanager
+    def pin(self, path: str) -> Iterator[str]:
+        """keep a file from eviction by any process while in the context
+
+        .. code-block:: python
+
+            with get_local_cache(MOUNT_DIR).pin(datalake_file.cache_only()) as path:
+                ...
+        """
+        with self._lock:
+            self._pins[path] += 1
+        try:
+            with open(path, 'rb') as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+                if os.fstat(f.fileno()).st_nlink == 0:
+                    # evicted while waiting for the lock
+                    raise FileNotFoundError(path)
+                yield path
+        finally:
+            with self._lock:
+                self._pins[path] -= 1
+                if self._pins[path] <= 0:
+                    del self._pins[path]
+
+    def usage(self) -> int:
+        """total size of cached files in bytes"""
+        if self.index is not None:
+            return self.index.total_size()
+        return self._total_size(self._entries())
+
+    def evict(self, exclude: Optional[str] = None) -> List[str]:
+        """remove files until the total size is under the low watermark
+
+        nothing is done if another process is evicting files.
+
+        :param exclude: path of a file not to be removed, e.g. just saved
+        :return: removed paths
+        """
+        if not self.enabled:
+            return []
+        os.makedirs(self.root, exist_ok=True)
+        fd = os.open(os.path.join(self.root, EVICTION_LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if not _try_lock(fd, fcntl.LOCK_EX if fcntl else 0):
+                return []
+            entries = self._entries()
+            usage = self._total_size(entries)
+            removed = []
+            if usage > self.size_limit:
+                target = int(self.size_limit * self.low_watermark)
+                # a file linked by the store is freed with its object
+                max_links = 1 if self.store is None else 2
+                for path, size, _ in self._order(entries):
+                    if usage <= target:
+                        break
+                    if path == exclude or path in self._pins:
+                        continue
+                    links = _link_count(path)
+                    if _remove_unless_locked(path):
+                        removed.append(path)
+                        if self.index is not None or links <= max_links:
+                            usage -= size
+                    if self.index is not None and not os.path.exists(path):
+                        self.index.remove(path)
+                if self.store is not None and removed:
+                    self.store.collect_garbage()
+            with self._lock:
+                self._usage = usage
+                self._written = 0
+                self._checked_at = time.monotonic()
+                for path in removed:
+                    self._hits.pop(path, None)
+            return removed
+        finally:
+            os.close(fd)
+
+    def _entries(self) -> List[Tuple[str, int, float]]:
+        """list cached files with their size and access time"""
+        if self.index is not None:
+            return [(e['path'], e['size'], e['accessed_at']) for e in self.index.entries()]
+        return [(path, stat.st_size, stat.st_atime) for path, stat in walk_entries(self.root)]
+
+    def _total_size(self, entries: List[Tuple[str, int, float]]) -> int:
+        """total size of files, counting hard links to the same content once
+        unless the files are indexed"""
+        if self.store is None or self.index is not None:
+            return sum(size for _, size, _ in entries)
+        inodes = {}     # type: Dict[Tuple[int, int], int]
+        for path, size, _ in entries:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            inodes[(stat.st_dev, stat.st_ino)] = size
+        return sum(inodes.values())
+
+    def _order(self, entries: List[Tuple[str, int, float]]) -> List[Tuple[str, int, float]]:
+        """sort entries in the order of eviction"""
+        if self.policy == 'lfu':
+            if self.index is not None:
+                hits = {e['path']: e['hits'] for e in self.index.entries()}     # type: Dict[str, int]
+            else:
+                with self._lock:
+                    hits = dict(self._hits)
+            return sorted(entries, key=lambda e: (hits.get(e[0], 0), e[2]))
+        return sorted(entries, key=lambda e: e[2])
+
+
+def _try_lock(fd: int, operation: int) -> bool:
+    if fcntl is None:   # pragma: no cover
+        return True
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _link_count(path: str) -> int:
+    try:
+        return os.stat(path).st_nlink
+    except OSError:
+        return 0
+
+
+def _remove_unless_locked(path: str) -> bool:
+    """remove a file unless it is pinned by any process"""
+    try:
+        # an exclusive lock needs a writable descriptor on NFS
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning('failed to open a cached file to evict: {}'.format(e))
+        return False
+    try:
+        if not _try_lock(fd, fcntl.LOCK_EX if fcntl else 0):
+            logger.debug('skip evicting a cached file in use: {}'.format(path))
+            return False
+        os.remove(path)
+        return True
+    except OSError as e:
+        logger.warning('failed to evict a cached file: {}'.format(e))
+        return False
+    finally:
+        os.close(fd)
+
+
+_local_cache = None     # type: Optional[LocalCache]
+_local_cache_lock = threading.Lock()
+
+
+def get_local_cache(root: str) -> LocalCache:
+    """return the cache of `root`, usually `MOUNT_DIR`, configured with environment variables"""
+    global _local_cache
+    with _local_cache_lock:
+        if _local_cache is None or _local_cache.root != root:
+            _local_cache = LocalCache(
+                root,
+                size_limit=STORAGE_SIZE_LIMIT,
+                policy=STORAGE_EVICTION_POLICY,
+                low_watermark=STORAGE_SIZE_LOW_WATERMARK,
+                index=get_cache_index(root) if STORAGE_INDEX else None,
+                store=get_content_store(root),
+                usage_check_interval=STORAGE_USAGE_CHECK_INTERVAL)
+        return _local_cache
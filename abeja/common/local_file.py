@@ -11,14 +11,30 @@ local file is saved in MOUNT_DIR and follows the rules below.
 
 """
 import errno
+import mmap
 import os
 import os.path
+import threading
+from contextlib import contextmanager
 from functools import wraps
+from typing import Dict, List
 from urllib.parse import urlparse
 from datetime import datetime
 import random
 
 from abeja.common.config import MOUNT_DIR, DEFAULT_CHUNK_SIZE
+from abeja.common.content_store import get_content_store
+from abeja.common.download import ContentCached, DownloadState
+from abeja.common.local_cache import get_local_cache
+
+try:
+    import fcntl
+except ImportError:     # pragma: no cover
+    fcntl = None    # type: ignore
+
+PARTIAL_FILE_SUFFIX = '.part'
+DOWNLOAD_STATE_SUFFIX = '.json'
+LOCK_FILE_SUFFIX = '.lock'
 
 # A random number generator used for generate temporary file name. ML code
 # often sets random seed, it causes file name conflict. So we have our own
@@ -29,52 +45,140 @@ RANDOM = random.Random()
 def use_binary_cache(func):
     """NOTE: this function expects to take `method object` as an arg"""
     @wraps(func)
+    @_save_again_if_removed
     def inner(obj):
-        path = _prepare_file_path(obj.uri)
+        path, cached = _lookup_cache(obj.uri)
+
+        if not cached:
+            with _lock_cache_entry(path) as cached:
+                if not cached:
+                    content = func()
 
-        if os.path.exists(path):
-            return _read_file(path, 'binary')
+                    _write_file(path, 'binary', content)
+                    _record_write(obj, path)
+
+                    return content
+
+        return _read_file(path, 'binary')
+    return inner
 
-        content = func()
 
-        _write_file(path, 'binary', content)
+def use_async_binary_cache(func):
+    """NOTE: this function expects to take `coroutine function` as an arg"""
+    @wraps(func)
+    async def inner(obj):
+        import asyncio
+        # file operations are run in the default executor not to block the event loop
+        loop = asyncio.get_running_loop()
+        path, cached = await loop.run_in_executor(None, _lookup_cache, obj.uri)
+
+        if cached:
+            try:
+                return await loop.run_in_executor(None, _read_file, path, 'binary')
+            except FileNotFoundError:
+                # removed after it is looked up, e.g. by hand while it is indexed
+                await loop.run_in_executor(None, _get_local_cache().discard, path)
+
+        content = await func()
+
+        def save():
+            _write_file(path, 'binary', content)
+            _record_write(obj, path)
+        await loop.run_in_executor(None, save)
 
         return content
     return inner
 
 
+def use_binary_download_cache(func):
+    """NOTE: this function expects to take `method object` which downloads
+    content into a given binary file object as an arg, see `download_file`"""
+    @wraps(func)
+    @_save_again_if_removed
+    def inner(obj):
+        path = _download_cache_file(obj, func)
+
+        return _read_file(path, 'binary')
+    return inner
+
+
+def use_iter_content_download_cache(func):
+    """NOTE: this function expects to take `method object` which downloads
+    content into a given binary file object as an arg, see `download_file`"""
+    @wraps(func)
+    @_save_again_if_removed
+    def inner(obj, chunk_size=DEFAULT_CHUNK_SIZE):
+        path = _download_cache_file(obj, func)
+
+        return _read_iter_content_file(path, chunk_size)
+    return inner
+
+
+def use_file_download_cache(func):
+    """NOTE: this function expects to take `method object` which downloads
+    content into a given binary file object as an arg, see `download_file`.
+    decorated function returns the path of the cache file instead of content"""
+    @wraps(func)
+    @_save_again_if_removed
+    def inner(obj):
+        path = _download_cache_file(obj, func)
+        # the path is opened later by the caller
+        os.stat(path)
+        return path
+    return inner
+
+
+def use_buffer_download_cache(func):
+    """NOTE: this function expects to take `method object` which downloads
+    content into a given binary file object as an arg, see `download_file`.
+    decorated function returns a read-only memoryview over the cache file"""
+    @wraps(func)
+    @_save_again_if_removed
+    def inner(obj):
+        path = _download_cache_file(obj, func)
+
+        return _map_file(path)
+    return inner
+
+
 def use_text_cache(func):
     """NOTE: this function expects to take `method object` as an arg"""
     @wraps(func)
+    @_save_again_if_removed
     def inner(obj):
-        path = _prepare_file_path(obj.uri)
+        path, cached = _lookup_cache(obj.uri)
 
-        if os.path.exists(path):
-            return _read_file(path, 'text')
+        if not cached:
+            with _lock_cache_entry(path) as cached:
+                if not cached:
+                    content = func()
 
-        content = func()
+                    _write_file(path, 'text', content)
+                    _record_write(obj, path)
 
-        _write_file(path, 'text', content)
+                    return content
 
-        return content
+        return _read_file(path, 'text')
     return inner
 
 
 def use_iter_content_cache(func):
     """NOTE: this function expects to take `method object` as an arg"""
     @wraps(func)
+    @_save_again_if_removed
     def inner(obj, chunk_size=DEFAULT_CHUNK_SIZE):
         """
         if file does not exist, save content in a file,
         and return content by reading the file
         """
-        path = _prepare_file_path(obj.uri)
+        path, cached = _lookup_cache(obj.uri)
 
-        if os.path.exists(path):
-            return _read_iter_content_file(path, chunk_size)
-
-        iter_content = func(chunk_size)
-        _write_iter_file(path, 'binary', iter_content)
+        if not cached:
+            with _lock_cache_entry(path) as cached:
+                if not cached:
+                    iter_content = func(chunk_size)
+                    _write_iter_file(path, 'binary', iter_content)
+                    _record_write(obj, path)
 
         return _read_iter_content_file(path, chunk_size)
     return inner
@@ -83,22 +187,40 @@ def use_iter_content_cache(func):
 def use_iter_lines_cache(func):
     """NOTE: this function expects to take `method object` as an arg"""
     @wraps(func)
+    @_save_again_if_removed
     def inner(obj):
         """if file does not exist, save content in a file,
         and return content by reading the file
         """
-        path = _prepare_file_path(obj.uri)
-
-        if os.path.exists(path):
-            return _read_iter_lines_file(path)
+        path, cached = _lookup_cache(obj.uri)
 
-        iter_lines = func()
-        _write_iter_file(path, 'text', iter_lines)
+        if not cached:
+            with _lock_cache_entry(path) as cached:
+                if not cached:
+                    iter_lines = func()
+                    _write_iter_file(path, 'text', iter_lines)
+                    _record_write(obj, path)
 
         return _read_iter_lines_file(path)
     return inner
 
 
+def _save_again_if_removed(inner):
+    """call `inner` again if the cache file is removed after it is looked up,
+    e.g. by hand while the index still has it"""
+    @wraps(inner)
+    def wrapper(obj, *args, **kwargs):
+        try:
+            return inner(obj, *args, **kwargs)
+        except FileNotFoundError as e:
+            path = _get_cache_path(obj.uri)
+            if e.filename != path:
+                raise
+            _get_local_cache().discard(path)
+            return inner(obj, *args, **kwargs)
+    return wrapper
+
+
 def _prepare_file_path(uri):
     """prepare directory for cache file to be saved.
 
@@ -112,6 +234,28 @@ def _prepare_file_path(uri):
     return os.path.join(base_dir, file)
 
 
+def _lookup_cache(uri):
+    """return the path of cache file, and whether the file is cached.
+    the directory is prepared only if the file is not cached, since it is
+    slow on NFS.
+
+    :param uri: ex. datalake://<channel_id>/<file_id>
+    :return: str, bool
+    """
+    base_dir, file = _parse_in_base_dir_and_file(uri)
+    path = os.path.join(base_dir, file)
+    if _get_local_cache().lookup(path):
+        return path, True
+
+    os.makedirs(base_dir, exist_ok=True)
+
+    return path, False
+
+
+def _get_cache_path(uri):
+    return os.path.join(*_parse_in_base_dir_and_file(uri))
+
+
 def _parse_in_base_dir_and_file(uri):
     """base_dir is directory where a file is contained
 
@@ -159,25 +303,52 @@ def _read_file(path, file_type):
                     return f2.read()
 
 
+def _map_file(path):
+    """map a file into memory read-only, and return a memoryview of it.
+
+    the mapping is shared with the page cache, so content is neither copied
+    nor allocated per call. it is released when the memoryview and its
+    slices are garbage collected.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # an empty file can not be mapped
+            return memoryview(b'')
+        try:
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except OSError as exc:
+            # The file is already deleted in the NFS server (EFS), try to
+            # re-open it and map.
+            if exc.errno == errno.ESTALE:
+                with open(path, 'rb') as f2:
+                    return memoryview(mmap.mmap(f2.fileno(), 0, access=mmap.ACCESS_READ))
+            raise
+
+
 def _read_iter_content_file(path, chunk_size):
     # We can't handle "Stale file handle" error for this case.
-    with open(path, 'rb') as f:
-        for chunk in _read_in_chunks(f, chunk_size):
-            yield chunk
+    # the file is opened before iteration, so that a removed file is noticed
+    f = open(path, 'rb')
+    return _close_after(f, _read_in_chunks(f, chunk_size))
 
 
 def _read_iter_lines_file(path):
     # We can't handle "Stale file handle" error for this case.
-    with open(path, 'r') as f:
-        for line in f:
-            yield line
+    f = open(path, 'r')
+    return _close_after(f, f)
+
+
+def _close_after(f, iterator):
+    with f:
+        for item in iterator:
+            yield item
 
 
 def _write_file(path, file_type, content):
     _write_iter_file(path, file_type, [content])
 
 
-def _write_iter_file(path, file_type, iter_content):
+def _get_tmp_path(path):
     # To attempt to write a file atomically, write contents into
     # temporary file, then rename it to the original path.
     #
@@ -188,7 +359,181 @@ def _write_iter_file(path, file_type, iter_content):
         os.getpid(),
         datetime.now().strftime('%Y%m%d%H%M%S'),
         RANDOM.randint(0, 0xffff))
-    tmppath = '{}.{}'.format(path, suffix)
+    return '{}.{}'.format(path, suffix)
+
+
+def _get_local_cache():
+    return get_local_cache(MOUNT_DIR)
+
+
+def _get_content_store():
+    return get_content_store(MOUNT_DIR)
+
+
+def _download_cache_file(obj, download):
+    """save a file in the cache by `download` unless it is cached, see `download_file`.
+    if the content store is enabled, content saved for another uri is linked
+    instead of being downloaded.
+
+    :return: path of the cache file
+    """
+    path, cached = _lookup_cache(obj.uri)
+    if cached:
+        return path
+    with _lock_cache_entry(path) as cached:
+        if not cached:
+            _download_uncached_file(obj, path, download)
+    return path
+
+
+def _download_uncached_file(obj, path, download):
+    store = _get_content_store()
+    if store is None:
+        state = download_file(path, download)
+        _record_write(obj, path, etag=state.etag)
+        return
+    try:
+        state = download_file(path, download, is_cached=store.contains)
+    except ContentCached as e:
+        if store.link(e.etag, path):
+            _record_write(obj, path, etag=e.etag)
+            return
+        # the object is removed after it is found
+        state = download_file(path, download)
+    store.add(state.etag, path)
+    _record_write(obj, path, etag=state.etag)
+
+
+def _record_write(obj, path, etag=None):
+    """record a file saved in the cache with information of the source"""
+    uploaded_at = getattr(obj, 'uploaded_at', None)
+    _get_local_cache().record_write(
+        path,
+        uri=obj.uri,
+        content_type=getattr(obj, 'content_type', None) or getattr(obj, 'type', None),
+        etag=etag,
+        uploaded_at=str(uploaded_at) if uploaded_at is not None else None)
+
+
+def download_file(path, download, is_cached=None):
+    """save a file by `download(f, state)` which writes content into a given
+    binary file object, updating :class:`DownloadState <abeja.common.download.DownloadState>`.
+
+    content is written into `<path>.part` and its progress is recorded in
+    `<path>.part.json`, which are kept if the download fails, so that the
+    next download of the file resumes from them. if another process is
+    downloading the same file, content is written into a temporary file
+    which is not resumed.
+
+    :param is_cached: function to tell whether content of an ETag is saved already,
+        see :class:`DownloadState <abeja.common.download.DownloadState>`
+    :return: :class:`DownloadState <abeja.common.download.DownloadState>` of the download
+    """
+    partpath = path + PARTIAL_FILE_SUFFIX
+    fd = os.open(partpath, os.O_RDWR | os.O_CREAT, 0o666)
+    if not _try_lock(fd):
+        os.close(fd)
+        tmppath = _get_tmp_path(path)
+        state = DownloadState(is_cached=is_cached)
+        try:
+            with open(tmppath, 'wb') as f:
+                download(f, state)
+        except BaseException:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+        os.replace(tmppath, path)
+        return state
+
+    with os.fdopen(fd, 'r+b') as f:
+        state = DownloadState.load(partpath + DOWNLOAD_STATE_SUFFIX, is_cached)
+        if state.is_resumable() and os.fstat(fd).st_size != state.size:
+            state.reset()
+        try:
+            download(f, state)
+        except BaseException:
+            if not state.is_resumable():
+                os.remove(partpath)
+                state.remove()
+            raise
+        os.replace(partpath, path)
+        state.remove()
+    return state
+
+
+_thread_locks = {}  # type: Dict[str, List]
+_thread_locks_lock = threading.Lock()
+
+
+@contextmanager
+def _lock_cache_entry(path):
+    """lock a cache entry exclusively while it is saved.
+
+    threads and processes which miss the cache of the same file wait for
+    the one saving it, and then read the saved file instead of downloading
+    the same content. the lock is `flock` of `<path>.lock`, which is
+    removed after the entry is saved.
+
+    :return: context manager which tells whether the file is saved while waiting
+    """
+    # `flock` over NFS is emulated with `fcntl` locks owned by the process,
+    # which do not exclude threads of the process
+    with _thread_locks_lock:
+        entry = _thread_locks.setdefault(path, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            fd = _open_lock_file(path + LOCK_FILE_SUFFIX)
+            try:
+                yield os.path.exists(path)
+            finally:
+                # waiters find the file saved, or retry with a new lock file
+                # if saving the file is failed
+                _remove_file(path + LOCK_FILE_SUFFIX)
+                os.close(fd)
+    finally:
+        with _thread_locks_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _thread_locks[path]
+
+
+def _open_lock_file(lockpath):
+    """open and lock a lock file, waiting for other processes"""
+    while True:
+        fd = os.open(lockpath, os.O_RDWR | os.O_CREAT, 0o666)
+        if fcntl is None:   # pragma: no cover
+            return fd
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.path.samestat(os.fstat(fd), os.stat(lockpath)):
+                return fd
+        except OSError:
+            pass
+        # removed by the previous holder while waiting
+        os.close(fd)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _try_lock(fd):
+    """lock a file not to be written by other processes"""
+    if fcntl is None:   # pragma: no cover
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _write_iter_file(path, file_type, iter_content):
+    tmppath = _get_tmp_path(path)
 
     mode = 'w'
     if file_type == 'binary':
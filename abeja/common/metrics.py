@@ -0,0 +1,283 @@
+"""instrumentation of requests to ABEJA Platform API.
+
+a request hook is a callable which takes :class:`RequestMetrics` and is
+called after every request made by connections. hooks can be added to a
+connection, or to all connections in the process.
+
+.. code-block:: python
+
+    from abeja.common import metrics
+
+    aggregator = metrics.MetricsAggregator()
+    metrics.add_request_hook(aggregator)
+
+    # ... use API clients ...
+
+    aggregator.summary()        # percentiles of latency per route
+    aggregator.to_prometheus()  # Prometheus text format
+"""
+import re
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from abeja.common.logging import logger
+
+RequestHook = Callable[['RequestMetrics'], None]
+
+_REQUEST_HOOKS = []  # type: List[RequestHook]
+_ID_SEGMENT_PATTERN = re.compile(
+    r'^('
+    r'\d+'                                          # platform id
+    r'|[a-z]+-[0-9a-f]{6,}'                         # prefixed id, e.g. user-1234567890123
+    r'|\d{8}T\d{6}-[0-9a-fA-F]{8}(-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}'  # datalake file id
+    r'|[0-9a-fA-F]{8}(-?[0-9a-fA-F]{4}){3}-?[0-9a-fA-F]{12}'            # uuid
+    r'|[0-9a-fA-F]{16,}'                            # hash
+    r')$')
+
+
+class RequestMetrics:
+    """metrics of a request
+
+    Properties:
+        - method (str): HTTP method
+        - url (str): requested url
+        - route (str): url path whose ids are replaced with `{id}`
+        - status_code (int): status code of the response, None if no response
+        - bytes_sent (int): size of the request body, None if unknown
+        - bytes_received (int): size of the response body, None if unknown
+        - retry_count (int): number of retries
+        - time_to_first_byte (float): seconds until the response header is received, None if no response
+        - elapsed (float): seconds until the request completes, including retries
+        - error (str): name of the exception class if the request failed without response
+    """
+
+    def __init__(
+            self,
+            method: str,
+            url: str,
+            elapsed: float,
+            status_code: Optional[int] = None,
+            bytes_sent: Optional[int] = None,
+            bytes_received: Optional[int] = None,
+            retry_count: int = 0,
+            time_to_first_byte: Optional[float] = None,
+            error: Optional[str] = None) -> None:
+        self.method = method.upper()
+        self.url = url
+        self.route = route_template(url)
+        self.status_code = status_code
+        self.bytes_sent = bytes_sent
+        self.bytes_received = bytes_received
+        self.retry_count = retry_count
+        self.time_to_first_byte = time_to_first_byte
+        self.elapsed = elapsed
+        self.error = error
+
+    def __repr__(self):
+        return '<{} {} {} status_code:{} elapsed:{:.3f}>'.format(
+            self.__class__.__name__, self.method, self.route,
+            self.status_code, self.elapsed)
+
+
+def route_template(url: str) -> str:
+    """convert url into a route template with low cardinality
+
+    >>> route_template('https://api.abeja.io/channels/1230000000000/20180510T110208-193d0d17-f0b1-4549-96df-651c02ccb8c9')
+    '/channels/{id}/{id}'
+    """
+    path = urlparse(url).path
+    return '/'.join(
+        '{id}' if _ID_SEGMENT_PATTERN.match(segment) else segment
+        for segment in path.split('/')) or '/'
+
+
+def body_size(body: Any) -> Optional[int]:
+    """size of a request body if it is known without reading it"""
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    return None
+
+
+def add_request_hook(hook: RequestHook) -> None:
+    """add a hook called after every request of all connections in the process"""
+    _REQUEST_HOOKS.append(hook)
+
+
+def remove_request_hook(hook: RequestHook) -> None:
+    _REQUEST_HOOKS.remove(hook)
+
+
+def get_request_hooks() -> List[RequestHook]:
+    return list(_REQUEST_HOOKS)
+
+
+def call_request_hooks(hooks: List[RequestHook], metrics: RequestMetrics) -> None:
+    """call hooks, errors in hooks are logged and ignored"""
+    for hook in hooks:
+        try:
+            hook(metrics)
+        except Exception as e:
+            logger.error('request hook failed: {}'.format(e))
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """percentile by nearest rank"""
+    index = int(round(q * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+class _RouteStats:
+    def __init__(self, max_samples: int) -> None:
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.elapsed_sum = 0.0
+        self.time_to_first_byte_sum = 0.0
+        self.time_to_first_byte_count = 0
+        self.status_counts = {}  # type: Dict[str, int]
+        self.elapsed = deque(maxlen=max_samples)  # type: Deque[float]
+        self.time_to_first_byte = deque(maxlen=max_samples)  # type: Deque[float]
+
+    def add(self, metrics: RequestMetrics) -> None:
+        self.count += 1
+        if metrics.error is not None or (
+                metrics.status_code is not None and metrics.status_code >= 400):
+            self.errors += 1
+        status = str(metrics.status_code) if metrics.status_code is not None else 'error'
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        self.retries += metrics.retry_count
+        self.bytes_sent += metrics.bytes_sent or 0
+        self.bytes_received += metrics.bytes_received or 0
+        self.elapsed_sum += metrics.elapsed
+        self.elapsed.append(metrics.elapsed)
+        if metrics.time_to_first_byte is not None:
+            self.time_to_first_byte_sum += metrics.time_to_first_byte
+            self.time_to_first_byte_count += 1
+            self.time_to_first_byte.append(metrics.time_to_first_byte)
+
+
+class MetricsAggregator:
+    """an in-process aggregator of request metrics per method and route.
+
+    latency percentiles are calculated from the latest `max_samples`
+    requests of each route. an instance is a request hook itself.
+    """
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, max_samples: int = 1024) -> None:
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._stats = {}  # type: Dict[Tuple[str, str], _RouteStats]
+
+    def __call__(self, metrics: RequestMetrics) -> None:
+        key = (metrics.method, metrics.route)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _RouteStats(self.max_samples)
+            stats.add(metrics)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def summary(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """summary of metrics per (method, route)
+
+        Return type:
+            dict
+
+        Returns:
+            .. code-block:: python
+
+                {
+                    ('GET', '/channels/{id}'): {
+                        'count': 10, 'errors': 0, 'retries': 0,
+                        'bytes_sent': 0, 'bytes_received': 20480,
+                        'status': {'200': 10},
+                        'p50': 0.05, 'p95': 0.12, 'p99': 0.2,
+                        'time_to_first_byte_p50': 0.04, ...
+                    }
+                }
+        """
+        result = {}
+        with self._lock:
+            for key, stats in self._stats.items():
+                elapsed = sorted(stats.elapsed)
+                ttfb = sorted(stats.time_to_first_byte)
+                summary = {
+                    'count': stats.count,
+                    'errors': stats.errors,
+                    'retries': stats.retries,
+                    'bytes_sent': stats.bytes_sent,
+                    'bytes_received': stats.bytes_received,
+                    'status': dict(stats.status_counts),
+                }  # type: Dict[str, Any]
+                for q in self.QUANTILES:
+                    name = 'p{}'.format(int(q * 100))
+                    summary[name] = _percentile(elapsed, q) if elapsed else None
+                    summary['time_to_first_byte_' + name] = \
+                        _percentile(ttfb, q) if ttfb else None
+                result[key] = summary
+        return result
+
+    def to_prometheus(self, prefix: str = 'abeja_sdk') -> str:
+        """export metrics in Prometheus text exposition format"""
+        lines = []  # type: List[str]
+
+        def add_header(name, metric_type, description):
+            lines.append('# HELP {}_{} {}'.format(prefix, name, description))
+            lines.append('# TYPE {}_{} {}'.format(prefix, name, metric_type))
+
+        def add_sample(name, labels, value):
+            label_text = ','.join(
+                '{}="{}"'.format(k, _escape_label_value(v)) for k, v in labels)
+            lines.append('{}_{}{{{}}} {}'.format(prefix, name, label_text, value))
+
+        with self._lock:
+            items = sorted(self._stats.items())
+
+            add_header('requests_total', 'counter', 'Number of requests.')
+            for (method, route), stats in items:
+                for status, count in sorted(stats.status_counts.items()):
+                    add_sample('requests_total', [
+                        ('method', method), ('route', route), ('status', status)], count)
+
+            for name, description, attr, count_attr in (
+                    ('request_duration_seconds',
+                     'Latency of requests including retries.',
+                     'elapsed', 'count'),
+                    ('request_time_to_first_byte_seconds',
+                     'Time to first byte of responses.',
+                     'time_to_first_byte', 'time_to_first_byte_count')):
+                add_header(name, 'summary', description)
+                for (method, route), stats in items:
+                    labels = [('method', method), ('route', route)]
+                    samples = sorted(getattr(stats, attr))
+                    if samples:
+                        for q in self.QUANTILES:
+                            add_sample(name, labels + [('quantile', str(q))],
+                                       _percentile(samples, q))
+                    add_sample(name + '_sum', labels, getattr(stats, attr + '_sum'))
+                    add_sample(name + '_count', labels, getattr(stats, count_attr))
+
+            for name, description, attr in (
+                    ('request_retries_total', 'Number of retries.', 'retries'),
+                    ('request_sent_bytes_total', 'Bytes of request bodies.', 'bytes_sent'),
+                    ('request_received_bytes_total', 'Bytes of response bodies.', 'bytes_received')):
+                add_header(name, 'counter', description)
+                for (method, route), stats in items:
+                    add_sample(name, [('method', method), ('route', route)],
+                               getattr(stats, attr))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
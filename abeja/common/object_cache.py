@@ -0,0 +1,92 @@
+"""In-process cache of decoded objects.
+
+Objects decoded from files, e.g. annotations parsed by
+:meth:`DatalakeFile.get_json <abeja.datalake.file.DatalakeFile.get_json>`,
+are kept in memory keyed by uri, so that repeated reads in a process skip
+both downloading and decoding. The cache is enabled by setting
+`DECODED_OBJECT_CACHE_SIZE` to the max total size in bytes of the source
+content of cached objects.
+
+Cached objects are shared by callers and must not be modified. Copy them
+before modification.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+from abeja.common.config import DECODED_OBJECT_CACHE_SIZE
+
+
+class ObjectCache:
+    """a size-bounded LRU cache of decoded objects.
+
+    the size of an object is given by the size of its source content, and
+    entries are evicted in LRU order when the total size exceeds `max_size`.
+    an object larger than `max_size` is not stored.
+
+    :param max_size: max total size in bytes
+    """
+
+    def __init__(self, max_size: int) -> None:
+        if max_size <= 0:
+            raise ValueError('max_size must be positive')
+        self.max_size = max_size
+        self.size = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # type: OrderedDict[Hashable, Tuple[Any, int]]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """return the object for `key` and mark it as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, obj: Any, size: int) -> None:
+        """store an object decoded from `size` bytes"""
+        with self._lock:
+            self._pop(key)
+            if size > self.max_size:
+                return
+            self._entries[key] = (obj, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _pop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+
+_object_cache = None     # type: Optional[ObjectCache]
+_object_cache_lock = threading.Lock()
+
+
+def get_object_cache() -> Optional[ObjectCache]:
+    """return the cache shared in the process, or None if disabled"""
+    global _object_cache
+    if DECODED_OBJECT_CACHE_SIZE <= 0:
+        return None
+    with _object_cache_lock:
+        if _object_cache is None:
+            _object_cache = ObjectCache(DECODED_OBJECT_CACHE_SIZE)
+        return _object_cache
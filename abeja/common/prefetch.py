@@ -0,0 +1,115 @@
+"""Bounded prefetch of iterator items.
+
+Items are taken from a source iterator only as the consumer pulls results,
+and at most `window_size` items are being processed or waiting to be
+consumed at a time. So the first result is available as soon as it is
+processed, and memory usage does not depend on the length of the source,
+e.g. the number of files in a channel.
+
+:func:`read_ahead` takes items from a slow source, such as pages of a list
+API, in a background thread, so that listing overlaps with processing.
+"""
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Deque, Iterable, Iterator, Optional, TypeVar
+
+from abeja.common.config import FETCH_WORKER_COUNT, PREFETCH_WINDOW_SIZE
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def prefetch(
+        items: Iterable[T],
+        func: Callable[[T], R],
+        window_size: Optional[int] = None,
+        worker_count: Optional[int] = None,
+        ordered: bool = False) -> Iterator[R]:
+    """apply `func` to items in background threads and yield the results
+
+    :param items: source of items, which is consumed lazily
+    :param func: function applied to each item, e.g. to download content
+    :param window_size: max number of items submitted and not yet yielded,
+        `PREFETCH_WINDOW_SIZE` by default
+    :param worker_count: number of threads, `FETCH_WORKER_COUNT` by default
+    :param ordered: if True, results are yielded in the order of items,
+        otherwise in the order of completion
+    :return: iterator of results
+    """
+    worker_count = worker_count or FETCH_WORKER_COUNT
+    window_size = max(window_size or PREFETCH_WINDOW_SIZE, worker_count)
+    source = iter(items)
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        pending = deque()   # type: Deque[Future]
+        try:
+            while True:
+                for item in source:
+                    pending.append(executor.submit(func, item))
+                    if len(pending) >= window_size:
+                        break
+                if not pending:
+                    return
+                if ordered:
+                    yield pending.popleft().result()
+                    continue
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                for future in done:
+                    yield future.result()
+        finally:
+            # the consumer stops iterating, or an item fails
+            for future in pending:
+                future.cancel()
+
+
+_END = object()
+
+
+def read_ahead(items: Iterable[T], size: int = 1) -> Iterator[T]:
+    """take items from `items` in a background thread, up to `size` ahead
+    of the consumer
+
+    exceptions raised by `items` are raised to the consumer in order.
+    the background thread stops when the consumer closes the iterator.
+
+    :param items: source of items
+    :param size: max number of items taken and not yet yielded
+    :return: iterator of the same items
+    """
+    buffer = queue.Queue(maxsize=max(size, 1))  # type: queue.Queue
+    stopped = threading.Event()
+
+    def put(entry) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((_END, e))
+            return
+        put((_END, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
@@ -0,0 +1,124 @@
+"""client-side rate limiting of requests.
+
+:data:`DEFAULT_RATE_LIMITER` is shared by all connections in the process,
+so that requests of every API client are paced together.
+
+.. code-block:: python
+
+    from abeja.common.rate_limiter import DEFAULT_RATE_LIMITER
+
+    # 20 requests per second to ABEJA Platform API
+    DEFAULT_RATE_LIMITER.set_limit(20, host='api.abeja.io')
+    # and 5 requests per second to datalake channels in it
+    DEFAULT_RATE_LIMITER.set_limit(5, host='api.abeja.io', path_prefix='/channels')
+
+the limit of requests to ABEJA Platform API can be also set by an environment
+variable `ABEJA_SDK_RATE_LIMIT` as `<requests per second>[:<burst>]`.
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+SDK_RATE_LIMIT_ENV_KEY = 'ABEJA_SDK_RATE_LIMIT'
+
+
+class TokenBucket:
+    """a thread-safe token bucket
+
+    tokens are added at `rate` per second up to `capacity`. a request which
+    finds no token reserves one in the future and has to wait for it, so
+    that waiting requests are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """take a token
+
+        :return: seconds to wait until the token is available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class RateLimiter:
+    """token bucket rate limits per host and per path prefix.
+
+    a request has to take a token from every bucket whose host and path
+    prefix match its url. a limit without host matches all hosts.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._buckets = {}  # type: Dict[Tuple[Optional[str], str], TokenBucket]
+
+    def set_limit(self, rate: float, burst: Optional[float] = None,
+                  host: Optional[str] = None, path_prefix: str = '') -> None:
+        """limit requests to `rate` per second, allowing bursts up to `burst`
+
+        :param rate: requests per second
+        :param burst: max number of requests sent at once, `rate` by default
+        :param host: host (and port) of the url, e.g. `api.abeja.io`. all hosts if None.
+        :param path_prefix: prefix of the path of the url, e.g. `/channels`.
+        """
+        bucket = TokenBucket(rate, burst)
+        with self._lock:
+            self._buckets[(host, path_prefix)] = bucket
+
+    def remove_limit(self, host: Optional[str] = None, path_prefix: str = '') -> None:
+        with self._lock:
+            self._buckets.pop((host, path_prefix), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def reserve(self, url: str) -> float:
+        """take tokens for a request to `url`
+
+        :return: seconds to wait before sending the request
+        """
+        if not self._buckets:
+            return 0.0
+        pr = urlparse(url)
+        with self._lock:
+            buckets = [
+                bucket for (host, path_prefix), bucket in self._buckets.items()
+                if (host is None or host == pr.netloc) and pr.path.startswith(path_prefix)]
+        return max([bucket.reserve() for bucket in buckets], default=0.0)
+
+    def acquire(self, url: str) -> None:
+        """block until a request to `url` is allowed"""
+        wait = self.reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _configure_from_env(rate_limiter: RateLimiter) -> None:
+    value = os.environ.get(SDK_RATE_LIMIT_ENV_KEY)
+    if not value:
+        return
+    rate, _, burst = value.partition(':')
+    host = urlparse(os.environ.get('ABEJA_API_URL', 'https://api.abeja.io')).netloc
+    rate_limiter.set_limit(
+        float(rate), float(burst) if burst else None, host=host)
+
+
+DEFAULT_RATE_LIMITER = RateLimiter()
+_configure_from_env(DEFAULT_RATE_LIMITER)
@@ -0,0 +1,234 @@
+"""Batched reading of record files.
+
+JSONL and CSV files are read in large chunks, and records are parsed from
+the chunks and yielded in batches, so that a large log is processed without
+handling each line of the file in Python before it is parsed. lines of a
+JSONL batch are decoded as one json array by a call of the codec, and CSV
+is parsed by `csv.reader` from a buffered text stream over the chunks.
+
+A batch is a list of records, or a dict of columns if `columns` is True.
+Columns are NumPy arrays if `numpy` is True, which requires NumPy.
+"""
+import csv
+import io
+import os
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from abeja.common.json_codec import get_default_codec
+
+RECORD_FORMATS = ('jsonl', 'csv')
+DEFAULT_RECORD_BATCH_SIZE = 4096
+# size of the buffer from which CSV text is decoded
+_CSV_BUFFER_SIZE = 1024 * 1024
+
+_CONTENT_TYPE_FORMATS = {
+    'application/jsonl': 'jsonl',
+    'application/jsonlines': 'jsonl',
+    'application/json-lines': 'jsonl',
+    'application/x-jsonlines': 'jsonl',
+    'application/x-ndjson': 'jsonl',
+    'application/ndjson': 'jsonl',
+    'text/csv': 'csv',
+}
+_EXTENSION_FORMATS = {
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.csv': 'csv',
+}
+
+Batch = Union[List[Any], Dict[Any, Any]]
+
+
+def guess_record_format(
+        content_type: Optional[str] = None,
+        filename: Optional[str] = None) -> Optional[str]:
+    """guess the format of a record file from its content type or file name
+
+    :return: `jsonl`, `csv` or None if unknown
+    """
+    if content_type:
+        record_format = _CONTENT_TYPE_FORMATS.get(content_type.split(';')[0].strip().lower())
+        if record_format:
+            return record_format
+    if filename:
+        return _EXTENSION_FORMATS.get(os.path.splitext(filename)[1].lower())
+    return None
+
+
+def iter_record_batches(
+        chunks: Iterable[bytes],
+        record_format: str,
+        batch_size: int = DEFAULT_RECORD_BATCH_SIZE,
+        columns: bool = False,
+        numpy: bool = False,
+        encoding: str = 'utf-8-sig',
+        delimiter: str = ',',
+        header: bool = True) -> Iterator[Batch]:
+    """parse records from chunks of a file, and yield them in batches
+
+    :param chunks: bytes of the file
+    :param record_format: `jsonl` or `csv`
+    :param batch_size: max number of records in a batch
+    :param columns: if True, a batch is a dict of columns. missing values of
+        JSONL records are None
+    :param numpy: if True, columns are NumPy arrays. CSV columns are
+        converted to integers or floats if all values can be
+    :param encoding: encoding of CSV files. JSONL files are UTF-8
+    :param delimiter: delimiter of CSV fields
+    :param header: if True, the first row of a CSV file is the names of
+        columns, and records are dicts. otherwise records are lists, and
+        columns are keyed by indexes
+    :return: iterator of batches
+    :raises: ValueError if the format is unknown, or a record is invalid
+    """
+    if record_format not in RECORD_FORMATS:
+        raise ValueError(
+            'record format should be one of {}, but {}'.format(RECORD_FORMATS, record_format))
+    if batch_size <= 0:
+        raise ValueError('batch_size must be positive')
+    np = _import_numpy() if numpy else None
+    if record_format == 'jsonl':
+        batches = _iter_jsonl(chunks, batch_size)
+    else:
+        batches = _batched(_iter_csv(chunks, encoding, delimiter, header), batch_size)
+    for batch in batches:
+        if np is not None:
+            yield _to_arrays(np, _to_columns(batch), record_format == 'csv')
+        elif columns:
+            yield _to_columns(batch)
+        else:
+            yield batch
+
+
+def _batched(records: Iterator[Any], batch_size: int) -> Iterator[List[Any]]:
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _iter_jsonl(chunks: Iterable[bytes], batch_size: int) -> Iterator[List[Any]]:
+    """split chunks into lines, and decode lines of each batch at once"""
+    loads = get_default_codec().loads
+    lines = []  # type: List[bytes]
+    rest = b''
+    for chunk in chunks:
+        parts = (rest + chunk).split(b'\n') if rest else chunk.split(b'\n')
+        rest = parts.pop()
+        lines.extend(line for line in parts if line.strip())
+        start = 0
+        while len(lines) - start >= batch_size:
+            yield _decode_lines(loads, lines[start:start + batch_size])
+            start += batch_size
+        del lines[:start]
+    if rest.strip():
+        lines.append(rest)
+    if lines:
+        yield _decode_lines(loads, lines)
+
+
+def _decode_lines(loads: Callable[[bytes], Any], lines: List[bytes]) -> List[Any]:
+    try:
+        records = loads(b'[' + b','.join(lines) + b']')
+    except ValueError:
+        records = None
+    if records is None or len(records) != len(lines):
+        # e.g. a line of `1, 2` is decoded as two records in the array, and
+        # each line is decoded to raise the error of the invalid line
+        records = [loads(line) for line in lines]
+    return records
+
+
+class _ChunkStream(io.RawIOBase):
+    """a readable stream of bytes over chunks"""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._chunk = memoryview(b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._chunk:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._chunk = memoryview(chunk)
+        size = min(len(b), len(self._chunk))
+        b[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
+def _iter_csv(
+        chunks: Iterable[bytes],
+        encoding: str,
+        delimiter: str,
+        header: bool) -> Iterator[Any]:
+    # line breaks are kept with `newline=''`, and the reader joins lines of
+    # quoted fields which contain them
+    text = io.TextIOWrapper(
+        io.BufferedReader(_ChunkStream(chunks), _CSV_BUFFER_SIZE), encoding=encoding, newline='')
+    rows = (row for row in csv.reader(text, delimiter=delimiter) if row)
+    if not header:
+        yield from rows
+        return
+    names = next(rows, None)
+    if names is None:
+        return
+    for row in rows:
+        yield dict(zip(names, row))
+
+
+def _to_columns(batch: List[Any]) -> Dict[Any, List[Any]]:
+    if isinstance(batch[0], dict):
+        keys = {}   # type: Dict[Any, None]
+        for record in batch:
+            keys.update(dict.fromkeys(record))
+        return {key: [record.get(key) for record in batch] for key in keys}
+    width = max(len(record) for record in batch)
+    return {
+        i: [record[i] if i < len(record) else None for record in batch]
+        for i in range(width)}
+
+
+def _to_arrays(np, columns: Dict[Any, List[Any]], parse_numbers: bool) -> Dict[Any, Any]:
+    arrays = {}
+    for key, values in columns.items():
+        if parse_numbers:
+            arrays[key] = _parse_number_array(np, values)
+            continue
+        try:
+            arrays[key] = np.asarray(values)
+        except ValueError:
+            # e.g. lists of different lengths
+            arrays[key] = _object_array(np, values)
+    return arrays
+
+
+def _parse_number_array(np, values: List[Optional[str]]):
+    if None not in values:
+        for dtype in (np.int64, np.float64):
+            try:
+                return np.asarray(values).astype(dtype)
+            except (ValueError, OverflowError):
+                continue
+    return _object_array(np, values) if None in values else np.asarray(values)
+
+
+def _object_array(np, values: List[Any]):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('numpy is required to read records as arrays') from None
+    return numpy
@@ -0,0 +1,94 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Mapping, Optional
+
+DEFAULT_RESPONSE_CACHE_TTL = 300
+
+
+class CacheEntry:
+    """a cached api response with its validators"""
+
+    def __init__(
+            self,
+            body: Any,
+            etag: Optional[str] = None,
+            last_modified: Optional[str] = None) -> None:
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = time.monotonic()
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """headers to revalidate the entry with a conditional request"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """a size-bounded LRU cache of api responses for conditional GET requests.
+
+    only responses with `ETag` or `Last-Modified` header are stored, and
+    a stored response is returned only after the server answers
+    `304 Not Modified` to a conditional request. entries are evicted in LRU
+    order when `maxsize` is exceeded, and are dropped `ttl` seconds after
+    they are stored even if they are still valid.
+
+    .. code-block:: python
+
+        from abeja.common.connection import Connection
+        from abeja.common.response_cache import ResponseCache
+
+        connection = Connection(response_cache=ResponseCache(maxsize=512))
+    """
+
+    def __init__(self, maxsize: int = 256,
+                 ttl: float = DEFAULT_RESPONSE_CACHE_TTL) -> None:
+        if maxsize <= 0:
+            raise ValueError('maxsize must be positive')
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # type: OrderedDict[Hashable, CacheEntry]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        """return an unexpired entry for `key` and mark it as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, headers: Mapping[str, str], body: Any) -> None:
+        """store a response body if the response headers have validators"""
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            self.discard(key)
+            return
+        entry = CacheEntry(copy.deepcopy(body), etag, last_modified)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,245 @@
+"""retry policies for connections to ABEJA Platform API.
+
+a :class:`RetryPolicy` decides which requests are retried and how long to
+wait before each retry. it supports
+
+- full-jitter exponential backoff, so that clients hit by the same failure
+  do not retry in lockstep
+- `Retry-After` header of `429 Too Many Requests` and `503 Service Unavailable`
+- a process-wide :class:`RetryBudget` which caps the share of retries among requests
+- an optional per-host :class:`CircuitBreaker`
+"""
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, List, Mapping, Optional, Sequence
+
+from requests.packages.urllib3.exceptions import MaxRetryError, ResponseError
+from requests.packages.urllib3.util.retry import Retry
+
+RETRY_ALLOWED_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+RETRY_STATUS_FORCELIST = (429, 500, 502, 503, 504)
+# status codes which are regarded as failures of a host by a circuit breaker
+FAILURE_STATUS_CODES = (500, 502, 503, 504)
+RETRY_BACKOFF_FACTOR = 1
+RETRY_BACKOFF_MAX = 120
+
+
+class RetryBudget:
+    """a budget which limits retries to a ratio of requests.
+
+    requests and retries within the last `window` seconds are counted, and
+    a retry is allowed while the number of retries is less than `ratio` of
+    the number of requests, or less than `min_retries_per_second` * `window`.
+    the budget is thread-safe and is meant to be shared in the process.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries_per_second: float = 10,
+                 window: float = 10) -> None:
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.window = window
+        self._lock = threading.Lock()
+        self._buckets = deque()  # type: Deque[List[int]]
+
+    def record_request(self) -> None:
+        """record a request sent for the first time"""
+        with self._lock:
+            self._current_bucket()[1] += 1
+
+    def try_acquire(self) -> bool:
+        """consume the budget for a retry if possible
+
+        :return: True if a retry is allowed
+        """
+        with self._lock:
+            bucket = self._current_bucket()
+            requests = sum(b[1] for b in self._buckets)
+            retries = sum(b[2] for b in self._buckets)
+            limit = max(self.ratio * requests,
+                        self.min_retries_per_second * self.window)
+            if retries >= limit:
+                return False
+            bucket[2] += 1
+            return True
+
+    def _current_bucket(self) -> List[int]:
+        """return [second, requests, retries] of the current second"""
+        now = int(time.monotonic())
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0])
+        return self._buckets[-1]
+
+
+class CircuitBreaker:
+    """a circuit breaker per host.
+
+    after `failure_threshold` consecutive failures to a host, requests to the
+    host are rejected for `recovery_timeout` seconds. then one trial request
+    is allowed, and the circuit is closed again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold: int = 5,
+                 recovery_timeout: float = 30) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._failures = {}  # type: Dict[str, int]
+        self._opened_at = {}  # type: Dict[str, float]
+
+    def allow_request(self, host: str) -> bool:
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return True
+            if time.monotonic() - opened_at < self.recovery_timeout:
+                return False
+            # half-open: allow a trial request, and wait for its result
+            self._opened_at[host] = time.monotonic()
+            return True
+
+    def record_success(self, host: str) -> None:
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened_at.pop(host, None)
+
+    def record_failure(self, host: str) -> None:
+        with self._lock:
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            if failures >= self.failure_threshold:
+                self._opened_at[host] = time.monotonic()
+
+
+DEFAULT_RETRY_BUDGET = RetryBudget()
+
+
+class RetryPolicy:
+    """a policy to retry requests.
+
+    .. code-block:: python
+
+        from abeja.common.connection import Connection
+        from abeja.common.retry import RetryPolicy, CircuitBreaker
+
+        connection = Connection(retry_policy=RetryPolicy(
+            backoff_factor=0.5, circuit_breaker=CircuitBreaker()))
+
+    Params:
+        - **total** (int): max number of retries. connection's `max_retry_count` is used if None.
+        - **backoff_factor** (float): base of exponential backoff in seconds.
+        - **backoff_max** (float): upper bound of backoff in seconds.
+        - **jitter** (bool): if True, wait a random time between 0 and the exponential backoff.
+        - **status_forcelist** (tuple): status codes to be retried.
+        - **allowed_methods** (tuple): methods to be retried.
+        - **respect_retry_after** (bool): if True, wait for `Retry-After` instead of backoff.
+        - **retry_after_max** (float): upper bound of `Retry-After` in seconds.
+        - **budget** (:class:`RetryBudget`): retry budget. the process-wide budget by default, no limit if None.
+        - **circuit_breaker** (:class:`CircuitBreaker`): circuit breaker. disabled by default.
+    """
+
+    def __init__(
+            self,
+            total: Optional[int] = None,
+            backoff_factor: float = RETRY_BACKOFF_FACTOR,
+            backoff_max: float = RETRY_BACKOFF_MAX,
+            jitter: bool = True,
+            status_forcelist: Sequence[int] = RETRY_STATUS_FORCELIST,
+            allowed_methods: Sequence[str] = RETRY_ALLOWED_METHODS,
+            respect_retry_after: bool = True,
+            retry_after_max: float = RETRY_BACKOFF_MAX,
+            budget: Optional[RetryBudget] = DEFAULT_RETRY_BUDGET,
+            circuit_breaker: Optional[CircuitBreaker] = None) -> None:
+        self.total = total
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.status_forcelist = tuple(status_forcelist)
+        self.allowed_methods = tuple(allowed_methods)
+        self.respect_retry_after = respect_retry_after
+        self.retry_after_max = retry_after_max
+        self.budget = budget
+        self.circuit_breaker = circuit_breaker
+
+    def get_backoff_time(self, retry_count: int) -> float:
+        """time to wait before the `retry_count`-th retry"""
+        if retry_count < 1:
+            return 0
+        backoff = min(self.backoff_max,
+                      self.backoff_factor * (2 ** (retry_count - 1)))
+        if self.jitter:
+            return random.uniform(0, backoff)
+        return backoff
+
+    def get_retry_after(self, headers: Mapping[str, str]) -> Optional[float]:
+        """time to wait which is requested by `Retry-After` header"""
+        if not self.respect_retry_after:
+            return None
+        value = headers.get('Retry-After')
+        if value is None:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            seconds = float(value)
+        else:
+            try:
+                seconds = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(self.retry_after_max, max(0.0, seconds))
+
+    def is_retryable(self, method: str, status_code: Optional[int] = None) -> bool:
+        """whether a request is retryable, or its response if status code is given"""
+        if method.upper() not in self.allowed_methods:
+            return False
+        return status_code is None or status_code in self.status_forcelist
+
+    def build_retry(self, total: int) -> Retry:
+        """build urllib3 `Retry` following this policy"""
+        params = dict(
+            total=self.total if self.total is not None else total,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.status_forcelist,
+            raise_on_status=False,
+            respect_retry_after_header=self.respect_retry_after,
+            policy=self)    # type: Dict[str, Any]
+        try:
+            return _PolicyRetry(allowed_methods=self.allowed_methods, **params)
+        except TypeError:
+            return _PolicyRetry(method_whitelist=self.allowed_methods, **params)
+
+
+class _PolicyRetry(Retry):
+    """urllib3 `Retry` which delegates backoff and retry budget to `RetryPolicy`"""
+
+    def __init__(self, *args, policy: Optional[RetryPolicy] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.policy = policy or RetryPolicy()
+
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.policy = self.policy
+        return retry
+
+    def get_backoff_time(self) -> float:
+        consecutive_errors_len = 0
+        for history in reversed(self.history):
+            if history.redirect_location is not None:
+                break
+            consecutive_errors_len += 1
+        return self.policy.get_backoff_time(consecutive_errors_len)
+
+    def get_retry_after(self, response) -> Optional[float]:
+        return self.policy.get_retry_after(response.headers)
+
+    def increment(self, method=None, url=None, response=None, error=None,
+                  _pool=None, _stacktrace=None):
+        budget = self.policy.budget
+        if budget is not None and not budget.try_acquire():
+            raise MaxRetryError(
+                _pool, url, error or ResponseError('retry budget exhausted'))
+        return super().increment(method, url, response, error, _pool, _stacktrace)
@@ -4,6 +4,12 @@ s3etag was a command line tool, so I just cut it out as a function.
 Original s3etag license is Apache License 2.0 .
 """
 import hashlib
+import re
+import threading
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from abeja.common.config import S3_CHUNK_SIZE
+from abeja.exceptions import EtagHashNotMatch
 
 
 def calc_s3etag(target: bytes, chunk_size: int) -> str:
@@ -25,3 +31,138 @@ def calc_s3etag(target: bytes, chunk_size: int) -> str:
     etag = "{}-{}".format(dgst_whole.hexdigest(),
                           count) if count > 1 else dgst_part.hexdigest()
     return etag
+
+
+_S3ETAG = re.compile(r'^(?:W/)?"?([0-9a-fA-F]{32})(?:-(\d+))?"?$')
+# ETags of objects encrypted with these are not md5 of content
+_SSE_KMS = ('aws:kms', 'aws:kms:dsse')
+_SSE_CUSTOMER_ALGORITHM = 'x-amz-server-side-encryption-customer-algorithm'
+
+
+def parse_s3etag(etag: Optional[str]) -> Optional[Tuple[str, int]]:
+    """parse an ETag into the md5 hex digest and the number of parts.
+
+    :return: None if the ETag is not an md5 of the content
+    """
+    m = _S3ETAG.match(etag.strip()) if etag else None
+    if m is None:
+        return None
+    return m.group(1).lower(), int(m.group(2) or 1)
+
+
+def content_md5_etag(headers: Mapping[str, str]) -> Optional[str]:
+    """return the ETag of a response, or None if it is not md5 of content
+
+    e.g. ETags of objects encrypted with SSE-KMS or SSE-C are not.
+    """
+    if headers.get('x-amz-server-side-encryption', '').lower() in _SSE_KMS \
+            or headers.get(_SSE_CUSTOMER_ALGORITHM):
+        return None
+    return headers.get('ETag')
+
+
+def infer_part_size(size: int, part_count: int) -> Optional[int]:
+    """infer the part size of a multipart upload from the object size.
+
+    every part but the last has the same size, so the part size `p` satisfies
+    `(part_count - 1) * p < size <= part_count * p`. other sizes than
+    `S3_CHUNK_SIZE`, which is used by the platform, may satisfy it as well,
+    so a multipart upload is verified only if it is uploaded in the chunk size.
+
+    :return: None if the part size can not be determined
+    """
+    if part_count == 1:
+        return size
+    lower = -(-size // part_count)
+    upper = -(-size // (part_count - 1)) - 1
+    if lower <= S3_CHUNK_SIZE <= upper:
+        return S3_CHUNK_SIZE
+    return None
+
+
+class S3ETagVerifier:
+    """compute the S3 ETag of content incrementally while it is streamed.
+
+    content can be given in any order of parts as long as each part of the
+    upload is given sequentially, so that parallel ranged downloads aligned
+    to :attr:`part_size` are verified without another pass over the data.
+
+    .. code-block:: python
+
+        verifier = S3ETagVerifier.create(res.headers.get('ETag'), size)
+        for chunk in res.iter_content():
+            verifier.update(offset, chunk)
+            ...
+        verifier.verify()
+
+    :param md5: md5 hex digest of the ETag
+    :param part_count: number of parts of the ETag
+    :param size: size of the content
+    :param part_size: size of each part but the last
+    """
+
+    def __init__(self, md5: str, part_count: int, size: int, part_size: int) -> None:
+        self.md5 = md5
+        self.part_count = part_count
+        self.size = size
+        self.part_size = part_size
+        self.verifiable = True
+        self._hashes = {}   # type: Dict[int, Any]
+        self._offsets = {}  # type: Dict[int, int]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, etag: Optional[str], size: Optional[int]) -> Optional['S3ETagVerifier']:
+        """return a verifier, or None if the ETag can not be verified"""
+        parsed = parse_s3etag(etag)
+        if parsed is None or size is None:
+            return None
+        md5, part_count = parsed
+        part_size = infer_part_size(size, part_count)
+        if part_size is None:
+            return None
+        return cls(md5, part_count, size, max(part_size, 1))
+
+    @property
+    def is_multipart(self) -> bool:
+        return self.part_count > 1
+
+    def update(self, offset: int, data: bytes) -> None:
+        """add content written at `offset`"""
+        view = memoryview(data)
+        while view and self.verifiable:
+            index = offset // self.part_size
+            end = min((index + 1) * self.part_size, self.size)
+            piece, view = view[:end - offset], view[end - offset:]
+            with self._lock:
+                if self._offsets.get(index, index * self.part_size) != offset:
+                    # a part is not given sequentially, e.g. a resumed download
+                    self.verifiable = False
+                    return
+                self._offsets[index] = offset + len(piece)
+                md5 = self._hashes.setdefault(index, hashlib.md5())
+            md5.update(piece)
+            offset += len(piece)
+
+    def verify(self) -> bool:
+        """check the computed ETag
+
+        :return: False if the whole content is not given to verify
+        :raises: EtagHashNotMatch if the content does not match the ETag
+        """
+        if not self.verifiable or sum(self._offsets.values()) - sum(
+                i * self.part_size for i in self._offsets) != self.size:
+            return False
+        if self.is_multipart:
+            if len(self._hashes) != self.part_count:
+                return False
+            whole = hashlib.md5()
+            for index in range(self.part_count):
+                whole.update(self._hashes[index].digest())
+            md5 = whole.hexdigest()
+        else:
+            md5 = self._hashes[0].hexdigest() if self._hashes else hashlib.md5().hexdigest()
+        if md5 != self.md5:
+            raise EtagHashNotMatch(
+                'Etag is not match: expected {}, actual {}'.format(self.md5, md5))
+        return True
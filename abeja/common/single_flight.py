@@ -0,0 +1,75 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None  # type: Any
+        self.error = None  # type: Optional[BaseException]
+
+
+class SingleFlight:
+    """suppress duplicated function calls which are in flight at the same time.
+
+    while a call for a key is running, other callers with the same key wait
+    for it and share its result (or its exception) instead of calling the
+    function by themselves.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls = {}  # type: Dict[Hashable, _Call]
+
+    def do(
+            self,
+            key: Hashable,
+            func: Callable[[], Any],
+            copy_result: Optional[Callable[[Any], Any]] = None) -> Tuple[Any, bool]:
+        """call `func` unless a call for `key` is already in flight.
+
+        :param key: key identifying duplicated calls
+        :param func: function to be called
+        :param copy_result: function to copy a result, e.g. `copy.deepcopy`.
+            if given, the caller and each waiter get their own results, so
+            that they can modify them. the result is copied for waiters
+            before they are woken up, so the caller may modify its result
+            while waiters copy it.
+        :return: result of the call and whether it is shared with another caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if copy_result is not None:
+                return copy_result(call.result), True
+            return call.result, True
+
+        try:
+            result = func()
+        except BaseException as e:
+            with self._lock:
+                del self._calls[key]
+            call.error = e
+            call.done.set()
+            raise
+        with self._lock:
+            del self._calls[key]
+            has_waiters = call.waiters > 0
+        # the result for waiters is a snapshot which is only read by them
+        if has_waiters and copy_result is not None:
+            call.result = copy_result(result)
+        else:
+            call.result = result
+        call.done.set()
+        return result, False
@@ -1,3 +1,4 @@
 # flake8: noqa
 from abeja.datalake.api.client import APIClient
+from abeja.datalake.api.async_client import AsyncAPIClient
 from abeja.datalake.client import Client
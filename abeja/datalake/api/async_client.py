@@ -0,0 +1,157 @@
+from typing import IO, Optional
+
+from requests.exceptions import HTTPError as RequestsHTTPError
+
+from abeja.common.api_client import AsyncBaseAPIClient
+from abeja.common.connection import http_error_handler
+from abeja.common.utils import get_filter_archived_applied_params
+from abeja.datalake.api.client import (
+    build_list_channel_files_params,
+    decode_file_metadata_if_exist,
+    decode_files_metadata_if_exist,
+    encode_metadata
+)
+
+
+class AsyncAPIClient(AsyncBaseAPIClient):
+    """A low-level asyncio client for Datalake API
+
+    Each method is a coroutine which takes the same parameters and returns
+    the same response as the method of :class:`APIClient <abeja.datalake.APIClient>`
+    with the same name.
+
+    .. code-block:: python
+
+        from abeja.datalake import AsyncAPIClient
+
+        async with AsyncAPIClient() as api_client:
+            response = await api_client.get_channel(organization_id, channel_id)
+    """
+
+    async def list_channels(
+            self,
+            organization_id: str,
+            limit: Optional[int]=None,
+            offset: Optional[int]=None,
+            filter_archived: Optional[bool] = None) -> dict:
+        """get channels
+
+        API reference: GET /organizations/<organization_id>/channels/
+        """
+        params = {}
+        if limit is not None:
+            params['limit'] = limit
+        if offset is not None:
+            params['offset'] = offset
+
+        params = get_filter_archived_applied_params(params, filter_archived)
+
+        path = '/organizations/{}/channels'.format(organization_id)
+        return await self._connection.api_request(
+            method='GET', path=path, params=params)
+
+    async def get_channel(self, organization_id: str, channel_id: str) -> dict:
+        """get a channel
+
+        API reference: GET /organizations/<organization_id>/channels/<channel_id>
+        """
+        path = '/organizations/{}/channels/{}'.format(
+            organization_id, channel_id)
+        return await self._connection.api_request(method='GET', path=path)
+
+    async def list_channel_files(
+            self, channel_id: str, start: str=None, end: str=None,
+            timezone: str=None, items_per_page: int=None, sort: str=None,
+            next_page_token: str=None, query: str=None) -> dict:
+        """get files in a channel.
+
+        API reference: GET /channels/<channel_id>/
+        """
+        params = build_list_channel_files_params(
+            start, end, timezone, items_per_page, sort, next_page_token, query)
+        path = '/channels/{}'.format(channel_id)
+        res = await self._connection.api_request(
+            method='GET', path=path, params=params)
+        return decode_files_metadata_if_exist(res)
+
+    async def get_channel_file_download(
+            self, channel_id: str, file_id: str) -> dict:
+        """get a file info in a channel.
+
+        API reference: GET /channels/<channel_id>/<file_id>
+        """
+        path = '/channels/{}/{}'.format(channel_id, file_id)
+        res = await self._connection.api_request(method='GET', path=path)
+        return decode_file_metadata_if_exist(res)
+
+    async def post_channel_file_upload(
+            self,
+            channel_id: str,
+            file_obj: IO,
+            content_type: str,
+            metadata: dict=None,
+            lifetime: str=None,
+            conflict_target: str=None) -> dict:
+        """upload a file to a channel.
+
+        API reference: POST /channels/<channel_id>/upload
+        """
+        path = '/channels/{}/upload'.format(channel_id)
+        if not metadata:
+            metadata = {}
+        headers = {
+            'Content-Type': content_type
+        }
+        encoded_metadata = encode_metadata(metadata)
+        headers.update(encoded_metadata)
+
+        params = {}
+        if lifetime is not None:
+            params['lifetime'] = lifetime
+        if conflict_target is not None:
+            params['conflict_target'] = conflict_target
+        res = await self._connection.api_request(
+            method='POST', path=path, headers=headers, params=params,
+            data=file_obj)
+        return decode_file_metadata_if_exist(res)
+
+    async def delete_channel_file(self, channel_id: str, file_id: str) -> dict:
+        """delete a file in a channel.
+
+        API reference: DELETE /channels/<channel_id>/<file_id>
+        """
+        path = '/channels/{}/{}'.format(channel_id, file_id)
+        return await self._connection.api_request(method='DELETE', path=path)
+
+    async def put_channel_file_metadata(
+            self,
+            channel_id: str,
+            file_id: str,
+            metadata: dict=None) -> dict:
+        """update a metadata of a file in a channel.
+
+        API reference: PUT /channels/<channel_id>/<file_id>/metadata
+        """
+        path = '/channels/{}/{}/metadata'.format(channel_id, file_id)
+        if metadata is None:
+            metadata = {}
+        encoded_metadata = encode_metadata(metadata)
+        res = await self._connection.api_request(
+            method='PUT', path=path, json=encoded_metadata)
+        return decode_file_metadata_if_exist(res)
+
+    async def get_file_content(self, download_uri: str) -> bytes:
+        """download content of a file from its `download_uri`.
+
+        Params:
+            - **download_uri** (str): presigned url returned by
+              :meth:`get_channel_file_download`
+
+        Return type:
+            bytes
+        """
+        try:
+            res = await self._connection.request('GET', download_uri)
+        except RequestsHTTPError as e:
+            http_error_handler(e)
+        return await res.read()
@@ -3,11 +3,12 @@ import json
 import mimetypes
 import os
 from pathlib import Path
-from typing import Dict, IO, Optional
+from typing import Dict, IO, Optional, Union
 import urllib.parse
 
 from abeja.common.api_client import BaseAPIClient
 from abeja.common.file_helpers import convert_to_valid_path
+from abeja.common.json_stream import JSONArrayStream
 from abeja.exceptions import BadRequest, Unauthorized, NotFound, Forbidden, InternalServerError
 from abeja.common.utils import get_filter_archived_applied_params
 
@@ -39,6 +40,41 @@ def decode_file_metadata_if_exist(file: dict) -> dict:
     return file
 
 
+def decode_files_metadata_if_exist(res: dict) -> dict:
+    if res.get('files'):
+        res['files'] = [
+            decode_file_metadata_if_exist(f)
+            for f in res['files']
+        ]
+    return res
+
+
+def build_list_channel_files_params(
+        start: Optional[str]=None, end: Optional[str]=None,
+        timezone: Optional[str]=None, items_per_page: Optional[int]=None,
+        sort: Optional[str]=None, next_page_token: Optional[str]=None,
+        query: Optional[str]=None) -> dict:
+    params = {}
+    if start is not None:
+        params['start'] = start
+    if end is not None:
+        params['end'] = end
+    if (start or end) and timezone is not None:
+        params['timezone'] = timezone
+    if items_per_page is not None:
+        params['items_per_page'] = items_per_page
+    if sort is not None:
+        params['sort'] = sort
+    if next_page_token is not None:
+        params['next_page_token'] = next_page_token
+    if query is not None:
+        assert isinstance(
+            query, str), 'Unexpected query type: {}'.format(
+            type(query))
+        params['q'] = query
+    return params
+
+
 class APIClient(BaseAPIClient):
     """A low-level client for Datalake API
 
@@ -700,7 +736,8 @@ class APIClient(BaseAPIClient):
     def list_channel_files(
             self, channel_id: str, start: str=None, end: str=None,
             timezone: str=None, items_per_page: int=None, sort: str=None,
-            next_page_token: str=None, query: str=None) -> dict:
+            next_page_token: str=None, query: str=None,
+            stream: bool=False) -> Union[dict, JSONArrayStream]:
         """get files in a channel.
 
         API reference: GET /channels/<channel_id>/
@@ -728,6 +765,11 @@ class APIClient(BaseAPIClient):
             - **query** (str):
                 query to search.
                 It is possible to filter what contain specific value by describing like "x-abeja-meta-filename:filename".
+            - **stream** (bool): **[optional]**
+                if True, files are parsed from the response as they arrive.
+                :class:`JSONArrayStream <abeja.common.json_stream.JSONArrayStream>` which yields
+                file dicts is returned, and the other keys of the response are set to its `fields`
+                after the iteration.
 
         Return type:
             dict
@@ -759,34 +801,16 @@ class APIClient(BaseAPIClient):
             - Forbidden
             - InternalServerError
         """
-        params = {}
-        if start is not None:
-            params['start'] = start
-        if end is not None:
-            params['end'] = end
-        if (start or end) and timezone is not None:
-            params['timezone'] = timezone
-        if items_per_page is not None:
-            params['items_per_page'] = items_per_page
-        if sort is not None:
-            params['sort'] = sort
-        if next_page_token is not None:
-            params['next_page_token'] = next_page_token
-        if query is not None:
-            assert isinstance(
-                query, str), 'Unexpected query type: {}'.format(
-                type(query))
-            params['q'] = query
+        params = build_list_channel_files_params(
+            start, end, timezone, items_per_page, sort, next_page_token, query)
         path = '/channels/{}'.format(channel_id)
+        if stream:
+            return self._connection.api_request_stream(
+                method='GET', path=path, key='files', params=params,
+                item_hook=decode_file_metadata_if_exist)
         res = self._connection.api_request(
             method='GET', path=path, params=params)
-
-        if res.get('files'):
-            res['files'] = [
-                decode_file_metadata_if_exist(f)
-                for f in res['files']
-            ]
-        return res
+        return decode_files_metadata_if_exist(res)
 
     def get_channel_file_download(self, channel_id: str, file_id: str) -> dict:
         """get a file info in a channel.
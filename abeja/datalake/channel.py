@@ -66,7 +66,11 @@ class Channel:
             next_page_token: str=None,
             limit: int=None,
             prefetch: bool=False,
-            query: str=None) -> FileIterator:
+            query: str=None,
+            prefetch_window: int=None,
+            prefetch_workers: int=None,
+            prefetch_ordered: bool=False,
+            page_read_ahead: int=None) -> FileIterator:
         """get datalake files in the channel
 
         Request syntax:
@@ -87,6 +91,19 @@ class Channel:
                 multiple items can be specified by separating with commas (,).
                 It is possible to sort in descending order by specifying a hyphen (-) in front of the item.
                 By default, the list is sorted by uploaded_at in ascending order.
+            - **prefetch** (bool):
+                if True, content of files is downloaded into the local cache in background.
+            - **prefetch_window** (int):
+                max number of files downloaded ahead of the iteration.
+                ``PREFETCH_WINDOW_SIZE`` by default.
+            - **prefetch_workers** (int):
+                number of threads to download files. ``FETCH_WORKER_COUNT`` by default.
+            - **prefetch_ordered** (bool):
+                if True, files are returned in the listed order,
+                otherwise in the order of completed downloads.
+            - **page_read_ahead** (int):
+                number of next pages requested in background while the current page is consumed.
+                ``PAGE_READ_AHEAD`` by default, and at least 1 if prefetch is True.
 
         Return type:
             :class:`FileIterator <abeja.datalake.file.FileIterator>` object
@@ -102,7 +119,11 @@ class Channel:
             items_per_page=limit,
             sort=sort,
             prefetch=prefetch,
-            query=query)
+            query=query,
+            prefetch_window=prefetch_window,
+            prefetch_workers=prefetch_workers,
+            prefetch_ordered=prefetch_ordered,
+            page_read_ahead=page_read_ahead)
 
     def get_file(self, file_id: str) -> DatalakeFile:
         """get a datalake file in the channel
@@ -1,35 +1,62 @@
 # -*- coding: utf-8 -*-
 import os
+import datetime
 # import re
-from typing import Any, Dict, List, Iterable, Generator, Optional
+from functools import partial
+from typing import Any, BinaryIO, Dict, List, Iterable, Generator, Optional, Union
 from urllib.parse import urlparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 from retrying import retry
 from requests.models import Response
 
-from abeja.common.config import DEFAULT_CHUNK_SIZE, FETCH_WORKER_COUNT, DOWNLOAD_RETRY_ATTEMPT_NUMBER
-# from abeja.common.config import S3_CHUNK_SIZE
+from abeja.common.config import (
+    DEFAULT_CHUNK_SIZE,
+    DOWNLOAD_RETRY_ATTEMPT_NUMBER,
+    DOWNLOAD_URI_EXPIRY_MARGIN,
+    VERIFY_DOWNLOAD_ETAG
+)
 from abeja.common.source_data import SourceData
 from abeja.common.iterator import Iterator
+from abeja.common.prefetch import prefetch, read_ahead
 from abeja.common.connection import http_error_handler
+from abeja.common.download import DownloadState, FileSink, download, is_interrupted_download
+from abeja.common.json_codec import get_default_codec
 from abeja.common.local_file import (
-    use_binary_cache,
+    download_file,
+    use_async_binary_cache,
+    use_binary_download_cache,
+    use_buffer_download_cache,
+    use_file_download_cache,
     use_text_cache,
-    use_iter_content_cache,
+    use_iter_content_download_cache,
     use_iter_lines_cache
 )
-# from abeja.common.s3etag import calc_s3etag
-from abeja.exceptions import HttpError, EtagHashNotMatch
+from abeja.common.object_cache import get_object_cache
+from abeja.common.records import (
+    DEFAULT_RECORD_BATCH_SIZE,
+    RECORD_FORMATS,
+    guess_record_format,
+    iter_record_batches
+)
+from abeja.common.s3etag import S3ETagVerifier, content_md5_etag
+from abeja.exceptions import HttpError, EtagHashNotMatch, Forbidden
 from abeja.datalake.api.client import APIClient
+from abeja.datalake.api.async_client import AsyncAPIClient
 from .metadata import DatalakeMetadata
 
 
+_MISSING = object()
+
+
 def retry_if_etag_hash_not_match(error):
     return isinstance(error, EtagHashNotMatch)
 
 
+def retry_if_download_failed(error):
+    return is_interrupted_download(error) or retry_if_etag_hash_not_match(error)
+
+
 class DatalakeFile(SourceData):
     """a model class for a datalake channel file
 
@@ -141,10 +168,63 @@ class DatalakeFile(SourceData):
             bytes
         """
         if cache:
-            decorated = use_binary_cache(self._get_content_from_remote)
+            decorated = use_binary_download_cache(self._download_to_file)
             return decorated(self)
         return self._get_content_from_remote()
 
+    def get_buffer(self) -> memoryview:
+        """Get content as a read-only buffer without copying it
+
+        content is saved in `[ABEJA_STORAGE_DIR_PATH]/[channel_id]/[file_id]` if not exists,
+        and the file is mapped into memory. the buffer can be passed to
+        functions which accept bytes-like objects, such as `numpy.frombuffer`,
+        without copying the content.
+
+        Request syntax:
+            .. code-block:: python
+
+                import numpy as np
+
+                file_id = '20180101T000000-00000000-1111-2222-3333-999999999999'
+                datalake_file = channel.get_file(file_id=file_id)
+                array = np.frombuffer(datalake_file.get_buffer(), dtype=np.uint8)
+
+        Return type:
+            memoryview
+        """
+        decorated = use_buffer_download_cache(self._download_to_file)
+        return decorated(self)
+
+    async def get_content_async(
+            self,
+            async_api: AsyncAPIClient,
+            cache: bool=True) -> bytes:
+        """Get content from a binary file with asyncio
+
+        Request syntax:
+            .. code-block:: python
+
+                from abeja.datalake import AsyncAPIClient
+
+                async with AsyncAPIClient() as async_api:
+                    content = await datalake_file.get_content_async(async_api)
+
+        Params:
+            - **async_api** (:class:`AsyncAPIClient <abeja.datalake.AsyncAPIClient>`):
+                a client used to request file info and content.
+            - **cache** (str):
+                if True, read file saved in `[ABEJA_STORAGE_DIR_PATH]/[channel_id]/[file_id]`
+                if exists, and if not, downloaded content will be saved in the path. By default, True.
+
+        Return type:
+            bytes
+        """
+        get_content = partial(self._get_content_from_remote_async, async_api)
+        if cache:
+            decorated = use_async_binary_cache(get_content)
+            return await decorated(self)
+        return await get_content()
+
     def get_iter_content(self,
                          cache: bool=True,
                          chunk_size: int=DEFAULT_CHUNK_SIZE) -> Generator[bytes,
@@ -171,11 +251,50 @@ class DatalakeFile(SourceData):
             generator
         """
         if cache:
-            decorated = use_iter_content_cache(
-                self._get_iter_content_from_remote)
+            decorated = use_iter_content_download_cache(self._download_to_file)
             return decorated(self, chunk_size)
         return self._get_iter_content_from_remote(chunk_size)
 
+    def cache_only(self) -> str:
+        """Download content into the local cache without reading it into memory
+
+        content is streamed into the cache file in chunks, so the memory
+        usage does not depend on the file size.
+
+        Request syntax:
+            .. code-block:: python
+
+                file_id = '20180101T000000-00000000-1111-2222-3333-999999999999'
+                datalake_file = channel.get_file(file_id=file_id)
+                path = datalake_file.cache_only()
+
+        Return type:
+            str: path of the cache file, `[ABEJA_STORAGE_DIR_PATH]/[channel_id]/[file_id]`
+        """
+        decorated = use_file_download_cache(self._download_to_file)
+        return decorated(self)
+
+    def download_to(self, path: str) -> str:
+        """Download content into a file without reading it into memory
+
+        the local cache is not used. if the file exists, it is overwritten.
+
+        Request syntax:
+            .. code-block:: python
+
+                file_id = '20180101T000000-00000000-1111-2222-3333-999999999999'
+                datalake_file = channel.get_file(file_id=file_id)
+                datalake_file.download_to('./video.mp4')
+
+        Params:
+            - **path** (str): path of the file to save content
+
+        Return type:
+            str: path of the file
+        """
+        download_file(path, self._download_to_file)
+        return path
+
     def get_text(
             self,
             cache: bool = True,
@@ -208,7 +327,7 @@ class DatalakeFile(SourceData):
             ret = ret.encode('iso-8859-1').decode('utf-8')
         return ret
 
-    def get_json(self) -> dict:
+    def get_json(self, cache: bool=False) -> dict:
         """Get json from a file
 
         Request syntax:
@@ -216,7 +335,14 @@ class DatalakeFile(SourceData):
 
                 file_id = '20180101T000000-00000000-1111-2222-3333-999999999999'
                 datalake_file = channel.get_file(file_id=file_id)
-                content = datalake_file.get_json()
+                content = datalake_file.get_json(cache=True)
+
+        Params:
+            - **cache** (bool):
+                if True, read file saved in `[ABEJA_STORAGE_DIR_PATH]/[channel_id]/[file_id]`
+                if exists, and if not, downloaded content will be saved in the path. By default, False.
+                if `DECODED_OBJECT_CACHE_SIZE` is set, decoded objects are also kept in memory
+                up to the size, and shared by calls for the same file. Do not modify them.
 
         Return type:
             dict
@@ -224,7 +350,19 @@ class DatalakeFile(SourceData):
         Raises:
             json.decoder.JSONDecodeError
         """
-        return self._get_json_from_remote()
+        if not cache:
+            return self._get_json_from_remote()
+        object_cache = get_object_cache()
+        if object_cache is not None:
+            obj = object_cache.get(self.uri, _MISSING)
+            if obj is not _MISSING:
+                return obj
+        decorated = use_binary_download_cache(self._download_to_file)
+        content = decorated(self)
+        obj = get_default_codec().loads(content)
+        if object_cache is not None:
+            object_cache.put(self.uri, obj, len(content))
+        return obj
 
     def get_iter_lines(self, cache: bool=True) -> Generator[str, None, None]:
         """Get lines iteratively from a text file
@@ -253,6 +391,79 @@ class DatalakeFile(SourceData):
             return decorated(self)
         return self._get_iter_lines_from_remote()
 
+    def iter_records(
+            self,
+            format: Optional[str]=None,
+            batch_size: int=DEFAULT_RECORD_BATCH_SIZE,
+            columns: bool=False,
+            numpy: bool=False,
+            cache: bool=True,
+            encoding: str='utf-8-sig',
+            delimiter: str=',',
+            header: bool=True,
+            chunk_size: int=DEFAULT_CHUNK_SIZE) -> Generator[Union[list, dict], None, None]:
+        """Get records of a JSONL or CSV file in batches
+
+        content is read in chunks of `chunk_size`, and records are parsed
+        from the chunks, so that a large file is read without iterating
+        over each line.
+
+        Request syntax:
+            .. code-block:: python
+
+                file_id = '20180101T000000-00000000-1111-2222-3333-999999999999'
+                datalake_file = channel.get_file(file_id=file_id)
+                for batch in datalake_file.iter_records(format='jsonl', batch_size=10000):
+                    for record in batch:
+                        ...
+
+                # dict of NumPy arrays of columns
+                for batch in datalake_file.iter_records(format='csv', numpy=True):
+                    total += batch['price'].sum()
+
+        Params:
+            - **format** (str):
+                `jsonl` or `csv`. By default, guessed from the content type or
+                `filename` in metadata.
+            - **batch_size** (int):
+                max number of records in a batch. By default, 4096.
+            - **columns** (bool):
+                if True, a batch is a dict of lists of column values instead of a list of records.
+                missing values of JSONL records are None. By default, False.
+            - **numpy** (bool):
+                if True, a batch is a dict of NumPy arrays of column values.
+                CSV columns are converted to integers or floats if all values can be. By default, False.
+            - **cache** (bool):
+                if True, read file saved in `[ABEJA_STORAGE_DIR_PATH]/[channel_id]/[file_id]`
+                if exists, and if not, downloaded content will be saved in the path. By default, True.
+            - **encoding** (str):
+                encoding of a CSV file. JSONL files are read as UTF-8.
+            - **delimiter** (str):
+                delimiter of CSV fields.
+            - **header** (bool):
+                if True, the first row of a CSV file is the names of columns, and records are dicts.
+                otherwise records are lists. By default, True.
+            - **chunk_size** (int):
+                The number of bytes it should read into memory at once.
+                default value : 1,048,576 ( = 1MB )
+
+        Return type:
+            generator of list or dict
+
+        Raises:
+            ValueError: if the format is unknown, or a record is invalid
+            ImportError: if `numpy` is True and NumPy is not installed
+        """
+        record_format = format or guess_record_format(
+            self.content_type, self.metadata.get('filename'))
+        if record_format not in RECORD_FORMATS:
+            raise ValueError(
+                'format should be one of {}, but {}'.format(RECORD_FORMATS, record_format))
+        chunks = self.get_iter_content(cache=cache, chunk_size=chunk_size)
+        return iter_record_batches(
+            chunks, record_format, batch_size=batch_size, columns=columns, numpy=numpy,
+            encoding=encoding, delimiter=delimiter, header=header)
+
     def get_file_info(self) -> dict:
         """Get information of a file
 
@@ -287,36 +498,60 @@ class DatalakeFile(SourceData):
         return self._api._connection.api_request(method='GET', path=path)
 
     def _validate_etag(self, res: Response) -> bytes:
-        # Prior to the version 0.6.0, SDK automatically validates ETag response header,
-        # but it causes the problem described in the issue https://github.com/abeja-inc/platform-planning/issues/3188
-        # So we decided to disable the validation.
-        #
-        # TODO:
-        # - Discuss how we achieve ETag validation without assuming constant chunk size
-        # - Shouldn't we retry if HTTP 5xx from S3?
-        #
+        # Prior to the version 0.6.0, SDK validated ETag assuming constant chunk size,
+        # which caused the problem described in the issue https://github.com/abeja-inc/platform-planning/issues/3188
+        # Now the part size of multipart ETag is inferred from the content size.
         content = res.content
-        # etag = res.headers.get('etag')
-        # etag = re.sub('"', '', etag) if etag else None
-        # if etag:
-        #     chunk_size = S3_CHUNK_SIZE
-        #     if '-' not in etag:
-        #         chunk_size = len(content)
-        #     md5sum = calc_s3etag(content, chunk_size)
-        #     if etag != md5sum:
-        #         raise EtagHashNotMatch('Etag is not match')
+        verifier = self._create_etag_verifier(res, len(content))
+        if verifier is not None:
+            verifier.update(0, content)
+            verifier.verify()
         return content
 
+    def _create_etag_verifier(
+            self, res: Response, size: Optional[int]) -> Optional[S3ETagVerifier]:
+        if not VERIFY_DOWNLOAD_ETAG:
+            return None
+        if res.headers.get('Content-Encoding', 'identity') != 'identity':
+            # ETag is computed from the encoded content
+            return None
+        return S3ETagVerifier.create(content_md5_etag(res.headers), size)
+
     @retry(stop_max_attempt_number=DOWNLOAD_RETRY_ATTEMPT_NUMBER,
            retry_on_exception=retry_if_etag_hash_not_match)
     def _get_content_from_remote(self) -> bytes:
         res = self._do_download()
         return self._validate_etag(res)
 
+    async def _get_content_from_remote_async(
+            self, async_api: AsyncAPIClient) -> bytes:
+        """download content with the download uri, which is refreshed once if it is rejected"""
+        reused = self._has_valid_download_uri()
+        if not reused:
+            await self._refresh_download_uri_async(async_api)
+        try:
+            return await async_api.get_file_content(self.download_uri)
+        except Forbidden:
+            # the known uri may be expired or revoked, so retry once with new one
+            if not reused:
+                raise
+        await self._refresh_download_uri_async(async_api)
+        return await async_api.get_file_content(self.download_uri)
+
+    async def _refresh_download_uri_async(self, async_api: AsyncAPIClient) -> None:
+        file_info = await async_api.get_channel_file_download(
+            self.channel_id, self.file_id)
+        self._set_download_uri(file_info)
+
     def _get_iter_content_from_remote(
             self, chunk_size) -> Generator[bytes, None, None]:
         res = self._do_download(stream=True)
-        return res.iter_content(chunk_size=chunk_size)
+        content_length = res.headers.get('Content-Length')
+        verifier = self._create_etag_verifier(
+            res, int(content_length) if content_length and content_length.isdigit() else None)
+        if verifier is None:
+            return res.iter_content(chunk_size=chunk_size)
+        return _iter_verified_content(res.iter_content(chunk_size=chunk_size), verifier)
 
     @retry(stop_max_attempt_number=DOWNLOAD_RETRY_ATTEMPT_NUMBER,
            retry_on_exception=retry_if_etag_hash_not_match)
@@ -344,14 +579,62 @@ class DatalakeFile(SourceData):
         """
         return path.lstrip('/')
 
-    def _get_download_uri(self) -> str:
-        file_info = self.get_file_info()
-        return file_info['download_uri']
+    def _has_valid_download_uri(self) -> bool:
+        """whether the presigned download uri is known and not close to expiry"""
+        if not self.download_uri or not self.url_expires_on:
+            return False
+        try:
+            expires_on = _parse_datetime(self.url_expires_on)
+        except ValueError:
+            return False
+        margin = datetime.timedelta(seconds=DOWNLOAD_URI_EXPIRY_MARGIN)
+        return datetime.datetime.now(datetime.timezone.utc) + margin < expires_on
+
+    def _set_download_uri(self, file_info: dict) -> None:
+        self.download_uri = file_info['download_uri']
+        self.url_expires_on = file_info.get('url_expires_on')
+
+    def _get_download_uri(self, refresh: bool=False) -> str:
+        """return the presigned download uri, get it from remote only if needed"""
+        if refresh or not self._has_valid_download_uri():
+            self._set_download_uri(self.get_file_info())
+        return self.download_uri
+
+    def _request_download(
+            self,
+            stream: bool=False,
+            headers: Optional[Dict[str, str]]=None) -> Response:
+        """request content with the download uri, which is refreshed once if it is rejected"""
+        kwargs = {'stream': stream}  # type: Dict[str, Any]
+        if headers:
+            kwargs['headers'] = headers
+        reused = self._has_valid_download_uri()
+        url = self._get_download_uri()
+        try:
+            return self._api._connection.request('GET', url, **kwargs)
+        except requests.exceptions.HTTPError as e:
+            # the known uri may be expired or revoked, so retry once with new one
+            if not reused or e.response is None or e.response.status_code != 403:
+                raise
+        url = self._get_download_uri(refresh=True)
+        return self._api._connection.request('GET', url, **kwargs)
 
     def _do_download(self, stream: bool=False) -> Response:
-        url = self._get_download_uri()
         try:
-            return self._api._connection.request('GET', url, stream=stream)
+            return self._request_download(stream)
+        except requests.exceptions.HTTPError as e:
+            http_error_handler(e)
+
+    @retry(stop_max_attempt_number=DOWNLOAD_RETRY_ATTEMPT_NUMBER,
+           retry_on_exception=retry_if_download_failed)
+    def _download_to_file(
+            self, f: BinaryIO, state: Optional[DownloadState]=None) -> None:
+        """download content into a binary file with parallel range requests,
+        interrupted downloads are resumed from the parts recorded in `state`"""
+        try:
+            download(
+                partial(self._request_download, True), FileSink(f), state=state,
+                verify_etag=VERIFY_DOWNLOAD_ETAG)
         except requests.exceptions.HTTPError as e:
             http_error_handler(e)
 
@@ -399,9 +682,28 @@ class DatalakeFile(SourceData):
         return source_data
 
 
+def _parse_datetime(value: str) -> datetime.datetime:
+    """parse ISO 8601 datetime like `2017-12-20T17:08:26+00:00`, naive one is in UTC"""
+    dt = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt
+
+
+def _iter_verified_content(
+        chunks: Iterable[bytes], verifier: S3ETagVerifier) -> Generator[bytes, None, None]:
+    """yield chunks computing the ETag of them, and verify it at the end"""
+    offset = 0
+    for chunk in chunks:
+        verifier.update(offset, chunk)
+        offset += len(chunk)
+        yield chunk
+    verifier.verify()
+
+
 def _download_file_content(item: DatalakeFile) -> DatalakeFile:
     # download content and cache to local disk
-    item.get_content(cache=True)
+    item.cache_only()
     return item
 
 
@@ -418,7 +720,11 @@ class FileIterator(Iterator):
             sort: str=None,
             next_page_token: str=None,
             prefetch=False,
-            query: str=None) -> None:
+            query: str=None,
+            prefetch_window: Optional[int]=None,
+            prefetch_workers: Optional[int]=None,
+            prefetch_ordered: bool=False,
+            page_read_ahead: Optional[int]=None) -> None:
         self._api = api
         self.organization_id = organization_id
         self.channel_id = channel_id
@@ -432,6 +738,11 @@ class FileIterator(Iterator):
         self._current_page = None
         self._current_page_file_idx = 0
         self.prefetch = prefetch
+        self.prefetch_window = prefetch_window
+        self.prefetch_workers = prefetch_workers
+        self.prefetch_ordered = prefetch_ordered
+        if page_read_ahead is not None:
+            self.page_read_ahead = page_read_ahead
         self.query = query
         super().__init__()
 
@@ -442,16 +753,14 @@ class FileIterator(Iterator):
             return self._items_iter()
 
     def _items_iter_with_prefetch(self) -> Iterable[DatalakeFile]:
-        page = self._page()
-        with ThreadPoolExecutor(max_workers=FETCH_WORKER_COUNT) as executor:
-            futures = []
-            while page:
-                futures += [executor.submit(_download_file_content, item)
-                            for item in page]
-                page = self._page()
-            for f in as_completed(futures):
-                download_item = f.result()
-                yield download_item
+        # the next page is listed in background while files are downloaded
+        pages = read_ahead(self._pages(), max(self.page_read_ahead, 1))
+        items = (item for page in pages for item in page)
+        return prefetch(
+            items, _download_file_content,
+            window_size=self.prefetch_window,
+            worker_count=self.prefetch_workers,
+            ordered=self.prefetch_ordered)
 
     def __next__(self):
         if self._current_page is None or self._current_page_file_idx >= len(
@@ -538,7 +847,9 @@ class Files:
 
     def list(self, start: str=None, end: str=None, timezone: str=None,
              sort: str = None, next_page_token: str=None,
-             limit: int=None, prefetch: bool=False) -> FileIterator:
+             limit: int=None, prefetch: bool=False,
+             prefetch_window: int=None, prefetch_workers: int=None,
+             prefetch_ordered: bool=False, page_read_ahead: int=None) -> FileIterator:
         """return iterator for all datalake files in a channel
 
         Request syntax:
@@ -564,6 +875,19 @@ class Files:
             - **next_page_token** (str) : next page token to get the next items. **[optional]**
             - **limit** (int): limit of items. **[optional]**
             - **prefetch** :(bool)**[optional]**
+                if True, content of files is downloaded into the local cache in background.
+            - **prefetch_window** (int):
+                max number of files downloaded ahead of the iteration. **[optional]**
+                ``PREFETCH_WINDOW_SIZE`` by default.
+            - **prefetch_workers** (int):
+                number of threads to download files. **[optional]**
+                ``FETCH_WORKER_COUNT`` by default.
+            - **prefetch_ordered** (bool):
+                if True, files are returned in the listed order,
+                otherwise in the order of completed downloads. **[optional]**
+            - **page_read_ahead** (int):
+                number of next pages requested in background while the current page is consumed.
+                ``PAGE_READ_AHEAD`` by default, and at least 1 if prefetch is True. **[optional]**
 
         Return type:
             :class:`FileIterator <abeja.datalake.file.FileIterator>`
@@ -578,4 +902,8 @@ class Files:
             sort=sort,
             next_page_token=next_page_token,
             items_per_page=limit,
-            prefetch=prefetch)
+            prefetch=prefetch,
+            prefetch_window=prefetch_window,
+            prefetch_workers=prefetch_workers,
+            prefetch_ordered=prefetch_ordered,
+            page_read_ahead=page_read_ahead)
@@ -1,6 +1,7 @@
-from typing import List, Optional
+from typing import List, Optional, Union
 
 from abeja.common.api_client import BaseAPIClient
+from abeja.common.json_stream import JSONArrayStream
 
 
 class APIClient(BaseAPIClient):
@@ -541,7 +542,8 @@ class APIClient(BaseAPIClient):
 
     def list_dataset_items(
             self, organization_id: str, dataset_id: str,
-            params: Optional[dict]=None) -> List[dict]:
+            params: Optional[dict]=None,
+            stream: bool=False) -> Union[dict, JSONArrayStream]:
         """Get item list in a dataset
 
         API reference: GET /organizations/<organization_id>/datasets/<dataset_id>/items/
@@ -552,6 +554,10 @@ class APIClient(BaseAPIClient):
             - **params** (dict): **[optional]**
                 - **next_page_token** (str): token to get the next page
                 - **q** (str): search query, ex) `label_id:1 AND label:dog OR tag:A`
+            - **stream** (bool): **[optional]** if True, items are parsed from the response
+              as they arrive. :class:`JSONArrayStream <abeja.common.json_stream.JSONArrayStream>`
+              which yields dataset item dicts is returned, and `total_count` and
+              `next_page_token` are set to its `fields` after the iteration.
 
         Return type:
             dict
@@ -623,6 +629,9 @@ class APIClient(BaseAPIClient):
                                                             dataset_id)
         if not params:
             params = {}
+        if stream:
+            return self._connection.api_request_stream(
+                method='GET', path=path, key='items', params=params)
         return self._connection.api_request(
             method='GET', path=path, params=params)
 
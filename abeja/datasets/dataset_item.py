@@ -1,11 +1,10 @@
 # -*- coding: utf-8 -*-
 import copy
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Tuple, Optional, List
 
-from abeja.common.config import FETCH_WORKER_COUNT
 from abeja.common.file_factory import file_factory
 from abeja.common.iterator import Iterator
+from abeja.common.prefetch import prefetch, read_ahead
 from abeja.datasets.base import DatasetBase
 from abeja.datasets.api.client import APIClient
 from abeja.exceptions import InvalidDataFormat
@@ -107,13 +106,21 @@ class DatasetItemIterator(Iterator):
     def __init__(
             self, api: APIClient, organization_id: str, dataset_id: str,
             next_page_token: Optional[str]=None, limit: Optional[int]=None,
-            prefetch: bool=False) -> None:
+            prefetch: bool=False, prefetch_window: Optional[int]=None,
+            prefetch_workers: Optional[int]=None,
+            prefetch_ordered: bool=False,
+            page_read_ahead: Optional[int]=None) -> None:
         self._api = api
         self.organization_id = organization_id
         self.dataset_id = dataset_id
         self.next_page_token = next_page_token
         self.limit = limit
         self.prefetch = prefetch
+        self.prefetch_window = prefetch_window
+        self.prefetch_workers = prefetch_workers
+        self.prefetch_ordered = prefetch_ordered
+        if page_read_ahead is not None:
+            self.page_read_ahead = page_read_ahead
         self._is_first_page = True
         self._current_page = None
         self._current_page_file_idx = 0
@@ -126,16 +133,14 @@ class DatasetItemIterator(Iterator):
             return self._items_iter()
 
     def _items_iter_with_prefetch(self):
-        page = self._page()
-        with ThreadPoolExecutor(max_workers=FETCH_WORKER_COUNT) as executor:
-            futures = []
-            while page:
-                futures += [executor.submit(_download_item_content, item)
-                            for item in page]
-                page = self._page()
-            for f in as_completed(futures):
-                download_item = f.result()
-                yield download_item
+        # the next page is listed in background while items are downloaded
+        pages = read_ahead(self._pages(), max(self.page_read_ahead, 1))
+        items = (item for page in pages for item in page)
+        return prefetch(
+            items, _download_item_content,
+            window_size=self.prefetch_window,
+            worker_count=self.prefetch_workers,
+            ordered=self.prefetch_ordered)
 
     def __next__(self):
         if self._current_page is None or self._current_page_file_idx >= len(
@@ -277,7 +282,11 @@ class DatasetItems:
             self,
             next_page_token: Optional[str]=None,
             limit: Optional[int]=None,
-            prefetch: bool=False) -> DatasetItemIterator:
+            prefetch: bool=False,
+            prefetch_window: Optional[int]=None,
+            prefetch_workers: Optional[int]=None,
+            prefetch_ordered: bool=False,
+            page_read_ahead: Optional[int]=None) -> DatasetItemIterator:
         """generate all dataset_items in a dataset
 
         Request syntax:
@@ -298,6 +307,15 @@ class DatasetItems:
               concurrently (therefore the order of dataset_items can be changed) and save them in
               the path specified in environment variable as ``ABEJA_STORAGE_DIR_PATH`` or current
               directory by default. **[optional]**
+            - **prefetch_window** (int) : max number of dataset_items downloaded ahead of the iteration.
+              ``PREFETCH_WINDOW_SIZE`` by default. **[optional]**
+            - **prefetch_workers** (int) : number of threads to download source_data.
+              ``FETCH_WORKER_COUNT`` by default. **[optional]**
+            - **prefetch_ordered** (bool) : False by default. if True, dataset_items are returned in the
+              listed order even if prefetch is True. **[optional]**
+            - **page_read_ahead** (int) : number of next pages requested in background while the
+              current page is consumed. ``PAGE_READ_AHEAD`` by default, and at least 1 if prefetch
+              is True. **[optional]**
 
         Return type:
             :class:`DatasetItemIterator <abeja.datasets.dataset_item.DatasetItemIterator>` object
@@ -309,7 +327,11 @@ class DatasetItems:
             self.dataset_id,
             next_page_token,
             limit,
-            prefetch)
+            prefetch,
+            prefetch_window=prefetch_window,
+            prefetch_workers=prefetch_workers,
+            prefetch_ordered=prefetch_ordered,
+            page_read_ahead=page_read_ahead)
 
     def update(self, dataset_item_id: str, attributes: dict) -> DatasetItem:
         """Update a datset item.
@@ -92,3 +92,11 @@ class InvalidPathException(Error):
 
 class EtagHashNotMatch(Error):
     pass
+
+
+class CircuitBreakerOpen(Error):
+    pass
+
+
+class IncompleteDownload(Error):
+    pass
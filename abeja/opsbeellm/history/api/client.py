@@ -1,7 +1,8 @@
 from __future__ import annotations
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Union
 
 from abeja.common.api_client import BaseAPIClient
+from abeja.common.json_stream import JSONArrayStream
 from abeja.exceptions import BadRequest
 
 
@@ -363,7 +364,8 @@ class APIClient(BaseAPIClient):
         limit: Optional[int] = 1000,
         sort_by: Optional[str] = "updated_at",
         sort_order: Optional[str] = "desc",
-    ) -> dict:
+        stream: Optional[bool] = False,
+    ) -> Union[dict, JSONArrayStream]:
         """get qa histories
 
         API reference: GET /opsbee-llm/organizations/<organization_id>/deployments/<deployment_id>/qa_histories
@@ -419,6 +421,9 @@ class APIClient(BaseAPIClient):
                     - `asc` for ascending order (e.g., oldest to newest)
                     - `desc` for descending order (e.g., newest to oldest)
                 - Defaults to `desc` if not specified.
+            - **stream** (bool): **[optional]** if True, histories are parsed from the response as they arrive.
+                :class:`JSONArrayStream <abeja.common.json_stream.JSONArrayStream>` which yields history dicts
+                is returned, and the other keys of the response are set to its `fields` after the iteration.
 
         Return type:
             dict
@@ -547,6 +552,8 @@ class APIClient(BaseAPIClient):
                 sort_order
             )
 
+        if stream:
+            return self._connection.api_request_stream(method='GET', path=path, key='histories', params=params)
         return self._connection.api_request(method='GET', path=path, params=params)
 
     def get_qa_history(
@@ -1164,7 +1171,8 @@ class APIClient(BaseAPIClient):
         limit: Optional[int] = 1000,
         sort_by: Optional[str] = "updated_at",
         sort_order: Optional[str] = "desc",
-    ) -> dict:
+        stream: Optional[bool] = False,
+    ) -> Union[dict, JSONArrayStream]:
         """get chat histories
 
         API reference: GET /opsbee-llm/organizations/<organization_id>/deployments/<deployment_id>/histories
@@ -1221,6 +1229,9 @@ class APIClient(BaseAPIClient):
                     - `asc` for ascending order (e.g., oldest to newest)
                     - `desc` for descending order (e.g., newest to oldest)
                 - Defaults to `desc` if not specified.
+            - **stream** (bool): **[optional]** if True, histories are parsed from the response as they arrive.
+                :class:`JSONArrayStream <abeja.common.json_stream.JSONArrayStream>` which yields history dicts
+                is returned, and the other keys of the response are set to its `fields` after the iteration.
 
         Return type:
             dict
@@ -1348,6 +1359,8 @@ class APIClient(BaseAPIClient):
                 sort_by,
                 sort_order
             )
+        if stream:
+            return self._connection.api_request_stream(method='GET', path=path, key='histories', params=params)
         return self._connection.api_request(method='GET', path=path, params=params)
 
     def get_chat_history(
@@ -10,7 +10,6 @@ from abeja.models.api.client import APIClient as ModelClient
 from abeja.training.api.client import APIClient as TrainingClient
 from abeja.training.statistics import Statistics as ABEJAStatistics
 from abeja.tracking.metric import Metric
-from tensorboardX import SummaryWriter
 
 
 tracking_logger = getLogger('tracking')
@@ -65,6 +64,8 @@ class Tracking:
         ABEJA_TRAINING_RESULT_DIR = os.environ.get(
             'ABEJA_TRAINING_RESULT_DIR', '.')
         log_path = os.path.join(ABEJA_TRAINING_RESULT_DIR, 'logs')
+        # tensorboardX is heavy to import, so defer it until a Tracking is created
+        from tensorboardX import SummaryWriter
         self._summary_writer = SummaryWriter(log_dir=log_path)
 
         if self._is_valid_job:
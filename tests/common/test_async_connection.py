@@ -0,0 +1,223 @@
+import asyncio
+import io
+import pytest
+
+from abeja.common.connection import AsyncConnection
+from abeja.common.json_codec import StdlibJSONCodec
+from abeja.common.retry import RetryBudget, RetryPolicy
+from abeja.exceptions import BadRequest, HttpError, InternalServerError
+
+web = pytest.importorskip('aiohttp.web')
+test_utils = pytest.importorskip('aiohttp.test_utils')
+
+
+def run_with_server(handler, coro_factory, path='/dummy', method='GET'):
+    async def main():
+        app = web.Application()
+        app.router.add_route(method, path, handler)
+        async with test_utils.TestServer(app) as server:
+            return await coro_factory(str(server.make_url('')))
+    return asyncio.run(main())
+
+
+def make_connection(base_url, **kwargs):
+    kwargs.setdefault('retry_policy', RetryPolicy(backoff_factor=0, budget=None))
+    connection = AsyncConnection(credential={'auth_token': 'token'}, **kwargs)
+    connection.BASE_URL = base_url
+    return connection
+
+
+def test_api_request():
+    async def handler(request):
+        assert request.headers['Authorization'] == 'Bearer token'
+        assert request.query['a'] == '1'
+        return web.json_response({'result': 'ok'})
+
+    async def main(base_url):
+        async with make_connection(base_url) as connection:
+            return await connection.api_request(
+                'GET', '/dummy', params={'a': '1'})
+
+    assert run_with_server(handler, main) == {'result': 'ok'}
+
+
+def test_api_request_with_bad_request():
+    async def handler(request):
+        return web.json_response({
+            'error': 'test',
+            'error_description': 'test error description'}, status=400)
+
+    async def main(base_url):
+        async with make_connection(base_url) as connection:
+            with pytest.raises(BadRequest) as e:
+                await connection.api_request('GET', '/dummy')
+            return e.value
+
+    error = run_with_server(handler, main)
+    assert error.error == 'test'
+    assert error.error_description == 'test error description'
+    assert error.status_code == 400
+
+
+def test_api_request_retries_server_error():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        if len(calls) < 3:
+            return web.Response(status=503)
+        return web.json_response({'result': 'ok'})
+
+    async def main(base_url):
+        async with make_connection(base_url) as connection:
+            return await connection.api_request('GET', '/dummy')
+
+    assert run_with_server(handler, main) == {'result': 'ok'}
+    assert len(calls) == 3
+
+
+def test_api_request_gives_up_after_max_retry_count():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        return web.Response(status=500, text='raw text')
+
+    async def main(base_url):
+        async with make_connection(base_url, max_retry_count=2) as connection:
+            with pytest.raises(InternalServerError):
+                await connection.api_request('GET', '/dummy')
+
+    run_with_server(handler, main)
+    assert len(calls) == 3
+
+
+def test_api_request_respects_retry_after():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        if len(calls) < 2:
+            return web.Response(status=429, headers={'Retry-After': '0'})
+        return web.json_response({'result': 'ok'})
+
+    async def main(base_url):
+        policy = RetryPolicy(backoff_factor=100, budget=None)
+        async with make_connection(base_url, retry_policy=policy) as connection:
+            return await connection.api_request('GET', '/dummy')
+
+    assert run_with_server(handler, main) == {'result': 'ok'}
+    assert len(calls) == 2
+
+
+def test_api_request_counts_retries_in_budget_once_per_request():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        if len(calls) < 3:
+            return web.Response(status=503)
+        return web.json_response({'result': 'ok'})
+
+    budget = RetryBudget()
+
+    async def main(base_url):
+        policy = RetryPolicy(backoff_factor=0, budget=budget)
+        async with make_connection(base_url, retry_policy=policy) as connection:
+            return await connection.api_request('GET', '/dummy')
+
+    assert run_with_server(handler, main) == {'result': 'ok'}
+    requests = sum(b[1] for b in budget._buckets)
+    retries = sum(b[2] for b in budget._buckets)
+    assert (requests, retries) == (1, 2)
+
+
+def test_close_and_reuse_session():
+    async def handler(request):
+        return web.json_response({})
+
+    async def main(base_url):
+        connection = make_connection(base_url)
+        await connection.api_request('GET', '/dummy')
+        session = connection._get_session()
+        await connection.api_request('GET', '/dummy')
+        assert connection._get_session() is session
+        await connection.close()
+        assert session.closed
+        assert connection._session is None
+
+    run_with_server(handler, main)
+
+
+def test_api_request_with_json_codec():
+    class SpyJSONCodec(StdlibJSONCodec):
+        dumped = []
+
+        def dumps(self, obj):
+            self.dumped.append(obj)
+            return super().dumps(obj)
+
+    async def handler(request):
+        assert request.headers['Content-Type'] == 'application/json'
+        return web.json_response(await request.json())
+
+    async def main(base_url):
+        async with make_connection(base_url, json_codec=codec) as connection:
+            return await connection.api_request(
+                'POST', '/dummy', json={'name': 'test'})
+
+    codec = SpyJSONCodec()
+    assert run_with_server(handler, main, method='POST') == {'name': 'test'}
+    assert codec.dumped == [{'name': 'test'}]
+
+
+def test_api_request_with_empty_response():
+    async def handler(request):
+        return web.Response(status=204)
+
+    async def main(base_url):
+        async with make_connection(base_url) as connection:
+            return await connection.api_request('DELETE', '/dummy')
+
+    with pytest.raises(ValueError):
+        run_with_server(handler, main, method='DELETE')
+
+
+def test_request_rewinds_file_body_before_retry():
+    bodies = []
+
+    async def handler(request):
+        bodies.append(await request.read())
+        if len(bodies) < 2:
+            return web.Response(status=503)
+        return web.json_response({'result': 'ok'}, status=201)
+
+    async def main(base_url):
+        file_obj = io.BytesIO(b'header:hello world')
+        file_obj.seek(len(b'header:'))
+        async with make_connection(base_url) as connection:
+            return await connection.api_request('POST', '/dummy', data=file_obj)
+
+    assert run_with_server(handler, main, method='POST') == {'result': 'ok'}
+    assert bodies == [b'hello world', b'hello world']
+
+
+def test_request_does_not_retry_unseekable_body():
+    calls = []
+
+    class UnseekableIO(io.BytesIO):
+        def seekable(self):
+            return False
+
+    async def handler(request):
+        calls.append(await request.read())
+        return web.Response(status=503)
+
+    async def main(base_url):
+        async with make_connection(base_url) as connection:
+            with pytest.raises(HttpError):
+                await connection.api_request(
+                    'POST', '/dummy', data=UnseekableIO(b'hello world'))
+
+    run_with_server(handler, main, method='POST')
+    assert calls == [b'hello world']
@@ -0,0 +1,199 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from abeja.common import cache_index, local_file
+from abeja.common.cache_index import INDEX_FILE, CacheIndex, main
+from abeja.common.local_cache import LocalCache
+
+CHANNEL_ID = '1234567890123'
+
+
+def make_file(root, name, size=3):
+    path = os.path.join(str(root), name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return path
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = CacheIndex(str(tmp_path))
+    yield index
+    index.close()
+
+
+def test_add_and_get(index, tmp_path):
+    path = os.path.join(str(tmp_path), CHANNEL_ID, 'file')
+    assert index.get(path) is None
+    index.add(path, 10, uri='datalake://{}/file'.format(CHANNEL_ID), content_type='image/jpeg',
+              etag='"etag"', uploaded_at='2017-12-18T05:39:47+00:00')
+    entry = index.get(path)
+    assert entry['path'] == path
+    assert (entry['uri'], entry['size'], entry['content_type'], entry['etag'], entry['uploaded_at']) == (
+        'datalake://{}/file'.format(CHANNEL_ID), 10, 'image/jpeg', '"etag"', '2017-12-18T05:39:47+00:00')
+    assert entry['hits'] == 0
+    assert os.path.exists(os.path.join(str(tmp_path), INDEX_FILE))
+
+
+def test_touch_and_remove(index, tmp_path):
+    path = os.path.join(str(tmp_path), 'a', 'file')
+    assert not index.touch(path)
+    index.add(path, 10)
+    accessed_at = index.get(path)['accessed_at']
+    assert index.touch(path)
+    entry = index.get(path)
+    assert entry['hits'] == 1
+    assert entry['accessed_at'] >= accessed_at
+    index.remove(path)
+    assert index.get(path) is None
+
+
+def test_touches_are_written_in_batches(index, tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_index, 'TOUCH_BATCH_SIZE', 2)
+    monkeypatch.setattr(cache_index, 'TOUCH_FLUSH_INTERVAL', 3600)
+    paths = [os.path.join(str(tmp_path), 'a', str(i)) for i in range(2)]
+    for path in paths:
+        index.add(path, 10)
+    other = CacheIndex(str(tmp_path))
+    assert index.touch(paths[0])
+    assert other.get(paths[0])['hits'] == 0
+    assert index.touch(paths[1])
+    assert [other.get(path)['hits'] for path in paths] == [1, 1]
+    other.close()
+
+
+def test_journal_mode_is_wal(index):
+    assert index._connection().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_entries_with_prefix(index, tmp_path):
+    for key in ['{}/a'.format(CHANNEL_ID), '{}/b'.format(CHANNEL_ID), '1234567890124/a', 'x_y/a', 'xzy/a']:
+        index.add(os.path.join(str(tmp_path), key), 10)
+    assert sorted(os.path.basename(e['path']) for e in index.entries(CHANNEL_ID + '/')) == ['a', 'b']
+    # wildcards of LIKE are escaped
+    assert len(index.entries('x_y/')) == 1
+    assert len(index.entries()) == 5
+    assert index.total_size() == 50
+
+
+def test_rebuild(index, tmp_path):
+    kept = make_file(tmp_path, '{}/file1'.format(CHANNEL_ID), 5)
+    make_file(tmp_path, '{}/file2'.format(CHANNEL_ID), 7)
+    make_file(tmp_path, 'example.com/a/b.jpg', 1)
+    make_file(tmp_path, '{}/file3.part'.format(CHANNEL_ID))
+    index.add(kept, 1, etag='"etag"')
+    index.add(os.path.join(str(tmp_path), 'removed'), 1)
+
+    assert index.rebuild() == 3
+    entries = {e['path']: e for e in index.entries()}
+    assert sorted(os.path.relpath(p, str(tmp_path)) for p in entries) == [
+        '{}/file1'.format(CHANNEL_ID), '{}/file2'.format(CHANNEL_ID), 'example.com/a/b.jpg']
+    assert entries[kept]['size'] == 5
+    assert entries[kept]['etag'] == '"etag"'
+    assert entries[kept]['uri'] == 'datalake://{}/file1'.format(CHANNEL_ID)
+    assert entries[os.path.join(str(tmp_path), 'example.com/a/b.jpg')]['uri'] is None
+
+
+def test_rebuild_command(tmp_path, capsys):
+    make_file(tmp_path, '{}/file'.format(CHANNEL_ID))
+    assert main(['rebuild', '--root', str(tmp_path)]) == 0
+    assert 'indexed 1 files' in capsys.readouterr().out
+    assert len(CacheIndex(str(tmp_path)).entries()) == 1
+
+
+def test_local_cache_looks_up_index(index, tmp_path):
+    cache = LocalCache(str(tmp_path), index=index)
+    path = make_file(tmp_path, 'a/file')
+    # a file saved without the index is indexed at the first lookup
+    assert cache.lookup(path)
+    assert index.get(path)['size'] == 3
+    os.remove(path)
+    # then the file is not checked on disk
+    assert cache.lookup(path)
+    assert index.get(path)['hits'] == 1
+    assert not cache.lookup(os.path.join(str(tmp_path), 'a', 'other'))
+
+
+def test_local_cache_evicts_with_index(index, tmp_path):
+    cache = LocalCache(str(tmp_path), size_limit=1000, policy='lfu', index=index)
+    paths = [make_file(tmp_path, 'a/{}'.format(i), 100) for i in range(3)]
+    for path in paths:
+        cache.record_write(path)
+    # hits are shared by processes with the index
+    other = LocalCache(str(tmp_path), index=CacheIndex(str(tmp_path)))
+    other.record_access(paths[0])
+    other.record_access(paths[2])
+    # accesses are written in batches
+    other.index.flush()
+    cache.size_limit = 250
+    assert cache.evict() == [paths[1]]
+    assert cache.usage() == 200
+    assert not os.path.exists(paths[1])
+    assert index.get(paths[1]) is None
+
+
+def test_local_cache_counts_files_indexed_by_other_processes(index, tmp_path):
+    cache = LocalCache(str(tmp_path), size_limit=250, index=index)
+    first = make_file(tmp_path, 'a/0', 100)
+    cache.record_write(first)
+    other = LocalCache(str(tmp_path), index=CacheIndex(str(tmp_path)))
+    other.record_write(make_file(tmp_path, 'a/1', 150))
+    cache.record_write(make_file(tmp_path, 'a/2', 10))
+    assert not os.path.exists(first)
+    assert cache.usage() == 160
+
+
+def test_cache_decorators_record_source(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_file, 'MOUNT_DIR', str(tmp_path))
+    index = CacheIndex(str(tmp_path))
+    monkeypatch.setattr(local_file, '_get_local_cache', lambda: LocalCache(str(tmp_path), index=index))
+
+    class Obj:
+        uri = 'datalake://{}/file'.format(CHANNEL_ID)
+        type = 'text/plain'
+        uploaded_at = '2017-12-18T05:39:47+00:00'
+
+    def download(f, state):
+        state.etag = '"etag"'
+        f.write(b'abc')
+
+    path = local_file.use_file_download_cache(download)(Obj())
+    entry = index.get(path)
+    assert (entry['uri'], entry['size'], entry['content_type'], entry['etag'], entry['uploaded_at']) == (
+        Obj.uri, 3, 'text/plain', '"etag"', Obj.uploaded_at)
+    assert local_file.use_binary_cache(lambda: b'x')(Obj()) == b'abc'
+    assert index.get(path)['hits'] == 1
+    index.close()
+
+
+@pytest.mark.parametrize('decorator,read', [
+    (local_file.use_binary_download_cache, lambda content: content),
+    (local_file.use_iter_content_download_cache, lambda chunks: b''.join(chunks)),
+    (local_file.use_buffer_download_cache, lambda buf: buf.tobytes()),
+    (local_file.use_file_download_cache, lambda path: Path(path).read_bytes()),
+])
+def test_cache_decorators_download_indexed_file_removed(tmp_path, monkeypatch, decorator, read):
+    monkeypatch.setattr(local_file, 'MOUNT_DIR', str(tmp_path))
+    index = CacheIndex(str(tmp_path))
+    monkeypatch.setattr(local_file, '_get_local_cache', lambda: LocalCache(str(tmp_path), index=index))
+    calls = []
+
+    class Obj:
+        uri = 'datalake://{}/file'.format(CHANNEL_ID)
+
+    def download(f, state):
+        calls.append(True)
+        f.write(b'abc')
+
+    decorated = decorator(download)
+    assert read(decorated(Obj())) == b'abc'
+    path = os.path.join(str(tmp_path), CHANNEL_ID, 'file')
+    # removed by hand, and still indexed
+    os.remove(path)
+    assert read(decorated(Obj())) == b'abc'
+    assert len(calls) == 2
+    assert index.get(path)['hits'] == 0
+    index.close()
@@ -1,15 +1,22 @@
 import base64
+import io
 import json
 import os
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch
 
 import requests
+import requests_mock
 from mock import MagicMock
 
 from abeja import VERSION
 from abeja.common.connection import Connection
 from abeja.common.connection import http_error_handler
+from abeja.common.json_codec import StdlibJSONCodec
+from abeja.common.response_cache import ResponseCache
 from abeja.common.connection import (
     DEFAULT_CONNECTION_TIMEOUT,
     DEFAULT_MAX_RETRY_COUNT
@@ -302,3 +309,219 @@ class TestConnection(unittest.TestCase):
         connection = Connection()
         self.assertEqual(connection.timeout, DEFAULT_CONNECTION_TIMEOUT)
         self.assertEqual(connection.max_retry_count, DEFAULT_MAX_RETRY_COUNT)
+
+    def test_request_reuses_session(self):
+        connection = Connection()
+        with patch.object(connection, '_generate_session',
+                          wraps=connection._generate_session) as m:
+            first = connection._get_session()
+            second = connection._get_session()
+        self.assertIs(first, second)
+        self.assertEqual(m.call_count, 1)
+
+    @patch.dict(os.environ, {
+        'ABEJA_SDK_POOL_CONNECTIONS': '3',
+        'ABEJA_SDK_POOL_MAXSIZE': '7'
+    })
+    def test_session_pool_size_with_env_vars(self):
+        connection = Connection()
+        adapter = connection._get_session().get_adapter('https://api.abeja.io')
+        self.assertEqual(adapter._pool_connections, 3)
+        self.assertEqual(adapter._pool_maxsize, 7)
+
+    def test_session_is_recreated_in_forked_process(self):
+        connection = Connection()
+        session = connection._get_session()
+        with patch('abeja.common.connection.os.getpid',
+                   return_value=connection._session_pid + 1):
+            self.assertIsNot(connection._get_session(), session)
+
+    def test_close(self):
+        connection = Connection()
+        session = connection._get_session()
+        with patch.object(session, 'close') as m:
+            connection.close()
+        m.assert_called_once_with()
+        self.assertIsNone(connection._session)
+        self.assertIsNot(connection._get_session(), session)
+
+    def test_context_manager(self):
+        connection = Connection()
+        session = connection._get_session()
+        with patch.object(session, 'close') as m:
+            with connection as c:
+                self.assertIs(c, connection)
+        m.assert_called_once_with()
+        self.assertIsNone(connection._session)
+
+    def test_api_request_coalesces_concurrent_get_requests(self):
+        connection = Connection()
+        started = threading.Event()
+        release = threading.Event()
+        res = requests.models.Response()
+        res._content = json.dumps({'files': []}).encode('utf-8')
+
+        def request(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return res
+
+        connection.request = MagicMock(side_effect=request)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            leader = executor.submit(connection.api_request, 'GET', '/dummy')
+            started.wait(5)
+            followers = [
+                executor.submit(connection.api_request, 'GET', '/dummy')
+                for _ in range(3)]
+            call = next(iter(connection._single_flight._calls.values()))
+            while len(call.done._cond._waiters) < 3:
+                time.sleep(0.001)
+            release.set()
+            results = [leader.result()] + [f.result() for f in followers]
+
+        self.assertEqual(connection.request.call_count, 1)
+        for result in results:
+            self.assertEqual(result, {'files': []})
+        # each caller gets its own copy
+        self.assertEqual(len({id(r) for r in results}), len(results))
+
+    def test_api_request_does_not_coalesce_non_get_requests(self):
+        connection = Connection()
+        connection.request = MagicMock()
+        with patch.object(connection._single_flight, 'do') as m:
+            connection.api_request('POST', '/dummy', json={})
+        m.assert_not_called()
+        connection.request.assert_called_once()
+
+    def test_api_request_without_coalescing(self):
+        connection = Connection(coalesce_requests=False)
+        connection.request = MagicMock()
+        connection.api_request('GET', '/dummy')
+        self.assertIsNone(connection._single_flight)
+        connection.request.assert_called_once()
+
+    def test_api_request_with_response_cache(self):
+        connection = Connection(
+            credential={}, response_cache=ResponseCache())
+        url = '{}/channels/1'.format(connection.BASE_URL)
+        with requests_mock.Mocker() as m:
+            m.get(url, [
+                {'json': {'name': 'test'}, 'headers': {'ETag': '"v1"'}},
+                {'status_code': 304, 'headers': {'ETag': '"v1"'}},
+                {'json': {'name': 'updated'}, 'headers': {'ETag': '"v2"'}}])
+
+            self.assertEqual(connection.api_request('GET', '/channels/1'), {'name': 'test'})
+            self.assertNotIn('If-None-Match', m.request_history[0].headers)
+
+            self.assertEqual(connection.api_request('GET', '/channels/1'), {'name': 'test'})
+            self.assertEqual(m.request_history[1].headers['If-None-Match'], '"v1"')
+
+            self.assertEqual(connection.api_request('GET', '/channels/1'), {'name': 'updated'})
+            self.assertEqual(m.request_history[2].headers['If-None-Match'], '"v1"')
+        self.assertEqual(len(connection.response_cache), 1)
+
+    def test_api_request_with_response_cache_keyed_by_params(self):
+        connection = Connection(
+            credential={}, response_cache=ResponseCache())
+        url = '{}/channels'.format(connection.BASE_URL)
+        with requests_mock.Mocker() as m:
+            m.get(url, json={}, headers={'ETag': '"v1"'})
+            connection.api_request('GET', '/channels', params={'limit': 1})
+            connection.api_request('GET', '/channels', params={'limit': 2})
+            self.assertNotIn('If-None-Match', m.request_history[1].headers)
+        self.assertEqual(len(connection.response_cache), 2)
+
+    def test_api_request_with_response_cache_error(self):
+        connection = Connection(
+            credential={}, response_cache=ResponseCache())
+        url = '{}/channels/1'.format(connection.BASE_URL)
+        with requests_mock.Mocker() as m:
+            m.get(url, status_code=400, json={'error': 'bad_request'})
+            with self.assertRaises(BadRequest):
+                connection.api_request('GET', '/channels/1')
+
+    @patch.dict(os.environ, {
+        'ABEJA_SDK_RESPONSE_CACHE_SIZE': '10',
+        'ABEJA_SDK_RESPONSE_CACHE_TTL': '60'
+    })
+    def test_response_cache_with_env_vars(self):
+        connection = Connection()
+        self.assertEqual(connection.response_cache.maxsize, 10)
+        self.assertEqual(connection.response_cache.ttl, 60)
+
+    def test_response_cache_is_disabled_by_default(self):
+        connection = Connection()
+        self.assertIsNone(connection.response_cache)
+
+    def test_api_request_with_json_codec(self):
+        codec = SpyJSONCodec()
+        connection = Connection(credential={}, json_codec=codec)
+        url = '{}/channels'.format(connection.BASE_URL)
+        with requests_mock.Mocker() as m:
+            m.post(url, json={'channel_id': '1'})
+            res = connection.api_request('POST', '/channels', json={'name': 'test'})
+        self.assertEqual(res, {'channel_id': '1'})
+        self.assertEqual(codec.dumped, [{'name': 'test'}])
+        self.assertEqual(codec.loaded, [b'{"channel_id": "1"}'])
+        self.assertEqual(m.last_request.headers['Content-Type'], 'application/json')
+        self.assertEqual(m.last_request.json(), {'name': 'test'})
+
+    def test_api_request_with_invalid_json_response(self):
+        connection = Connection(credential={})
+        url = '{}/channels'.format(connection.BASE_URL)
+        with requests_mock.Mocker() as m:
+            m.get(url, text='not json')
+            with self.assertRaises(ValueError):
+                connection.api_request('GET', '/channels')
+
+    def test_service_request_json_is_not_encoded_by_json_codec(self):
+        codec = SpyJSONCodec()
+        connection = Connection(credential={}, json_codec=codec)
+        url = connection._get_service_url('1234567890123', '/services/1')
+        with requests_mock.Mocker() as m:
+            m.post(url, json={})
+            connection.service_request('1234567890123', '/services/1', json={'a': 1})
+            self.assertEqual(m.last_request.text, json.dumps({'a': 1}))
+        self.assertEqual(codec.dumped, [])
+
+    @patch.dict(os.environ, {'ABEJA_SDK_JSON_CODEC': 'json'})
+    @patch('abeja.common.json_codec._default_codec', None)
+    def test_json_codec_with_env_vars(self):
+        connection = Connection()
+        self.assertIsInstance(connection.json_codec, StdlibJSONCodec)
+
+    def test_api_request_stream(self):
+        connection = Connection(credential={})
+        url = '{}/channels/1'.format(connection.BASE_URL)
+        body = json.dumps({'files': [{'file_id': str(i)} for i in range(100)], 'next_page_token': 'xxx'})
+        with requests_mock.Mocker() as m:
+            m.get(url, body=io.BytesIO(body.encode('utf-8')))
+            stream = connection.api_request_stream(
+                'GET', '/channels/1', 'files', params={'limit': 100},
+                item_hook=lambda f: f['file_id'], chunk_size=16)
+            self.assertEqual(next(stream), '0')
+            self.assertEqual(list(stream), [str(i) for i in range(1, 100)])
+        self.assertEqual(stream.fields, {'next_page_token': 'xxx'})
+        self.assertEqual(m.last_request.qs, {'limit': ['100']})
+
+    def test_api_request_stream_with_error(self):
+        connection = Connection(credential={})
+        url = '{}/channels/1'.format(connection.BASE_URL)
+        with requests_mock.Mocker() as m:
+            m.get(url, status_code=400, json={'error': 'bad_request'})
+            with self.assertRaises(BadRequest):
+                connection.api_request_stream('GET', '/channels/1', 'files')
+
+
+class SpyJSONCodec(StdlibJSONCodec):
+    def __init__(self):
+        self.loaded = []
+        self.dumped = []
+
+    def loads(self, s):
+        self.loaded.append(s)
+        return super().loads(s)
+
+    def dumps(self, obj):
+        self.dumped.append(obj)
+        return super().dumps(obj)
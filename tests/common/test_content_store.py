@@ -0,0 +1,76 @@
+import os
+
+from abeja.common.content_store import ContentStore
+from abeja.common.local_cache import LocalCache
+from abeja.common.s3etag import calc_s3etag
+
+ETAG = '"{}"'.format(calc_s3etag(b'abc', 3))
+
+
+def make_file(root, name, content=b'abc'):
+    path = os.path.join(str(root), name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def test_object_path(tmp_path):
+    store = ContentStore(str(tmp_path))
+    md5 = ETAG.strip('"')
+    assert store.object_path(ETAG) == str(tmp_path / '.objects' / md5[:2] / md5)
+    assert store.object_path('"{}-3"'.format(md5)).endswith('{}-3'.format(md5))
+    # not md5 of content
+    assert store.object_path('W/"5e1b-abc"') is None
+    assert store.object_path(None) is None
+
+
+def test_add_and_link(tmp_path):
+    store = ContentStore(str(tmp_path))
+    first = make_file(tmp_path, '1111111111111/a')
+    assert not store.contains(ETAG)
+    assert store.add(ETAG, first)
+    assert store.contains(ETAG)
+
+    second = str(tmp_path / '2222222222222' / 'b')
+    os.makedirs(os.path.dirname(second))
+    assert store.link(ETAG, second)
+    assert os.path.samefile(first, second)
+    assert os.stat(first).st_nlink == 3
+    assert not store.link('"other"', str(tmp_path / 'c'))
+
+
+def test_add_replaces_duplicate_with_link(tmp_path):
+    store = ContentStore(str(tmp_path))
+    first = make_file(tmp_path, 'a/1')
+    second = make_file(tmp_path, 'b/2')
+    assert store.add(ETAG, first)
+    assert store.add(ETAG, second)
+    assert os.path.samefile(first, second)
+    assert store.add(ETAG, second)
+
+
+def test_collect_garbage(tmp_path):
+    store = ContentStore(str(tmp_path))
+    path = make_file(tmp_path, 'a/1')
+    store.add(ETAG, path)
+    assert store.collect_garbage() == 0
+    os.remove(path)
+    assert store.collect_garbage() == 3
+    assert not store.contains(ETAG)
+
+
+def test_eviction_counts_linked_content_once(tmp_path):
+    store = ContentStore(str(tmp_path))
+    cache = LocalCache(str(tmp_path), size_limit=5, low_watermark=0.6, store=store)
+    paths = [make_file(tmp_path, 'a/{}'.format(i)) for i in range(3)]
+    for path in paths:
+        store.add(ETAG, path)
+    other = make_file(tmp_path, 'b/1', b'xyz')
+    os.utime(other, (2000000000, 2000000000))
+    assert cache.usage() == 6
+
+    # content shared by the files is freed after all of them are removed
+    assert sorted(cache.evict()) == paths
+    assert cache.usage() == 3
+    assert os.listdir(str(tmp_path / '.objects' / ETAG.strip('"')[:2])) == []
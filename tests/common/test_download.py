@@ -0,0 +1,286 @@
+import os
+import re
+import secrets
+
+import pytest
+import requests
+
+from abeja.common.download import (
+    BufferSink,
+    DownloadState,
+    FileSink,
+    download,
+    is_interrupted_download
+)
+from abeja.common.s3etag import calc_s3etag
+from abeja.exceptions import EtagHashNotMatch, IncompleteDownload
+
+URL = 'http://example.com/large.bin'
+ETAG = '"etag"'
+
+
+def serve_ranges(data, etag=ETAG, truncate=False):
+    """requests_mock callback which returns ranges of data"""
+    def callback(request, context):
+        context.headers['ETag'] = etag
+        m = re.match(r'bytes=(\d+)-(\d+)', request.headers.get('Range', ''))
+        if m is None:
+            return data
+        if request.headers.get('If-Match', etag) != etag:
+            context.status_code = 412
+            return b''
+        start, end = int(m.group(1)), min(int(m.group(2)), len(data) - 1)
+        if start >= len(data):
+            context.status_code = 416
+            return b''
+        context.status_code = 206
+        context.headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, len(data))
+        body = data[start:end + 1]
+        return body[:-1] if truncate and start > 0 else body
+    return callback
+
+
+def make_request(session, url=URL):
+    def request(headers):
+        res = session.get(url, headers=headers, stream=True)
+        res.raise_for_status()
+        return res
+    return request
+
+
+@pytest.fixture
+def session():
+    with requests.Session() as s:
+        yield s
+
+
+@pytest.mark.parametrize('size', [0, 1, 100, 1024, 1025, 10 * 1024 + 7])
+def test_download_to_file(requests_mock, session, tmp_path, size):
+    data = secrets.token_bytes(size)
+    requests_mock.get(URL, content=serve_ranges(data))
+    path = str(tmp_path / 'file')
+    with open(path, 'wb') as f:
+        assert download(make_request(session), FileSink(f), part_size=1024, worker_count=3) == size
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+    # an empty object is requested again without range after 416
+    expected_requests = 2 if size == 0 else -(-size // 1024)
+    assert requests_mock.call_count == expected_requests
+    if size > 1024:
+        assert all(h.headers['If-Match'] == ETAG for h in requests_mock.request_history[1:])
+
+
+def test_download_to_buffer(requests_mock, session):
+    data = secrets.token_bytes(5000)
+    requests_mock.get(URL, content=serve_ranges(data))
+    sink = BufferSink()
+    assert download(make_request(session), sink, part_size=1000, worker_count=2) == 5000
+    assert bytes(sink.buffer) == data
+
+
+def test_download_without_range_support(requests_mock, session):
+    data = secrets.token_bytes(5000)
+    requests_mock.get(URL, content=data)
+    sink = BufferSink()
+    assert download(make_request(session), sink, part_size=1000) == 5000
+    assert bytes(sink.buffer) == data
+    assert len(requests_mock.request_history) == 1
+
+
+def test_download_encoded_content_as_single_stream(requests_mock, session):
+    data = secrets.token_bytes(5000)
+    requests_mock.get(URL, [
+        {'status_code': 206, 'content': data[:1000],
+         'headers': {'Content-Range': 'bytes 0-999/5000', 'Content-Encoding': 'br'}},
+        {'content': data}])
+    sink = BufferSink()
+    assert download(make_request(session), sink, part_size=1000) == 5000
+    assert bytes(sink.buffer) == data
+    assert 'Range' not in requests_mock.last_request.headers
+
+
+def test_download_truncated_part(requests_mock, session, tmp_path):
+    data = secrets.token_bytes(5000)
+    requests_mock.get(URL, content=serve_ranges(data, truncate=True))
+    with open(str(tmp_path / 'file'), 'wb') as f:
+        with pytest.raises(IncompleteDownload):
+            download(make_request(session), FileSink(f), part_size=1000)
+
+
+def test_download_changed_object(requests_mock, session):
+    data = secrets.token_bytes(5000)
+    requests_mock.get(URL, [
+        {'status_code': 206, 'content': data[:1000], 'headers': {
+            'Content-Range': 'bytes 0-999/5000', 'ETag': '"old"'}},
+        {'content': serve_ranges(data)}])
+    with pytest.raises(requests.exceptions.HTTPError):
+        download(make_request(session), BufferSink(), part_size=1000, worker_count=1)
+
+
+def test_file_sink_positional_writes(tmp_path):
+    path = str(tmp_path / 'file')
+    with open(path, 'wb') as f:
+        sink = FileSink(f)
+        sink.truncate(6)
+        sink.write_at(3, b'def')
+        sink.write_at(0, b'abc')
+    assert os.path.getsize(path) == 6
+    with open(path, 'rb') as f:
+        assert f.read() == b'abcdef'
+
+
+def test_download_state(tmp_path):
+    path = str(tmp_path / 'file.part.json')
+    state = DownloadState(path)
+    assert not state.is_resumable()
+    state.start(ETAG, 10)
+    state.add_part(4, 7)
+    state.add_part(0, 1)
+
+    loaded = DownloadState.load(path)
+    assert loaded.is_resumable()
+    assert (loaded.etag, loaded.size, sorted(loaded.parts)) == (ETAG, 10, [(0, 1), (4, 7)])
+    assert loaded.missing_ranges(1) == [(2, 2), (3, 3), (8, 8), (9, 9)]
+    assert loaded.missing_ranges(4) == [(2, 3), (8, 9)]
+
+    loaded.remove()
+    assert not DownloadState.load(path).is_resumable()
+
+
+def test_download_state_without_etag_is_not_saved(tmp_path):
+    path = str(tmp_path / 'file.part.json')
+    state = DownloadState(path)
+    state.start(None, 10)
+    state.add_part(0, 9)
+    assert not os.path.exists(path)
+
+
+def test_download_state_broken(tmp_path):
+    path = tmp_path / 'file.part.json'
+    path.write_text('{"etag": "x"')
+    assert not DownloadState.load(str(path)).is_resumable()
+
+
+def test_resume_download(requests_mock, session, tmp_path):
+    data = secrets.token_bytes(5000)
+    requests_mock.get(URL, content=serve_ranges(data))
+    state = DownloadState(str(tmp_path / 'file.part.json'))
+    state.start(ETAG, 5000)
+    state.add_part(0, 999)
+    state.add_part(3000, 3999)
+
+    sink = BufferSink()
+    sink.truncate(5000)
+    sink.write_at(0, data[:1000])
+    sink.write_at(3000, data[3000:4000])
+    assert download(make_request(session), sink, part_size=1000, state=state) == 5000
+    assert bytes(sink.buffer) == data
+    assert sorted(h.headers['Range'] for h in requests_mock.request_history) == [
+        'bytes=1000-1999', 'bytes=2000-2999', 'bytes=4000-4999']
+
+
+def test_resume_download_of_changed_object(requests_mock, session):
+    data = secrets.token_bytes(5000)
+    requests_mock.get(URL, content=serve_ranges(data, etag='"new"'))
+    state = DownloadState()
+    state.start(ETAG, 3000)
+    state.add_part(0, 999)
+
+    sink = BufferSink()
+    assert download(make_request(session), sink, part_size=1000, state=state) == 5000
+    assert bytes(sink.buffer) == data
+    assert state.etag == '"new"'
+    assert sorted(state.parts) == [(s, s + 999) for s in range(0, 5000, 1000)]
+
+
+def test_download_interrupted_and_resumed(requests_mock, session, tmp_path):
+    data = secrets.token_bytes(5000)
+    truncated = serve_ranges(data, truncate=True)
+    callback = serve_ranges(data)
+    interrupted = []
+
+    def serve(request, context):
+        if request.headers.get('Range') == 'bytes=2000-2999' and not interrupted:
+            interrupted.append(True)
+            return truncated(request, context)
+        return callback(request, context)
+
+    requests_mock.get(URL, content=serve)
+    state = DownloadState(str(tmp_path / 'file.part.json'))
+    sink = BufferSink()
+    with pytest.raises(IncompleteDownload) as e:
+        download(make_request(session), sink, part_size=1000, state=state)
+    assert is_interrupted_download(e.value)
+    assert (0, 999) in state.parts
+    assert (2000, 2999) not in state.parts
+
+    assert download(make_request(session), sink, part_size=1000, state=state) == 5000
+    assert bytes(sink.buffer) == data
+    ranges = [h.headers['Range'] for h in requests_mock.request_history]
+    assert ranges.count('bytes=0-999') == 1
+    assert ranges.count('bytes=2000-2999') == 2
+
+
+def test_download_verifies_multipart_etag(requests_mock, session, monkeypatch):
+    monkeypatch.setattr('abeja.common.s3etag.S3_CHUNK_SIZE', 4)
+    data = secrets.token_bytes(10)
+    requests_mock.get(URL, content=serve_ranges(data, etag='"{}"'.format(calc_s3etag(data, 4))))
+    sink = BufferSink()
+    assert download(make_request(session), sink, part_size=4, verify_etag=True) == 10
+    assert bytes(sink.buffer) == data
+
+
+def test_download_aligns_ranges_to_multipart_etag(requests_mock, session, monkeypatch):
+    monkeypatch.setattr('abeja.common.s3etag.S3_CHUNK_SIZE', 5)
+    data = secrets.token_bytes(20)
+    requests_mock.get(URL, content=serve_ranges(data, etag='"{}"'.format(calc_s3etag(data, 5))))
+    sink = BufferSink()
+    assert download(make_request(session), sink, part_size=12, verify_etag=True) == 20
+    assert bytes(sink.buffer) == data
+    assert [h.headers['Range'] for h in requests_mock.request_history] == [
+        'bytes=0-11', 'bytes=12-19']
+
+
+def test_download_corrupted_multipart_object(requests_mock, session, tmp_path, monkeypatch):
+    monkeypatch.setattr('abeja.common.s3etag.S3_CHUNK_SIZE', 4)
+    data = secrets.token_bytes(10)
+    etag = '"{}"'.format(calc_s3etag(secrets.token_bytes(10), 4))
+    requests_mock.get(URL, content=serve_ranges(data, etag=etag))
+    state = DownloadState(str(tmp_path / 'file.part.json'))
+    with pytest.raises(EtagHashNotMatch):
+        download(make_request(session), BufferSink(), part_size=4, state=state, verify_etag=True)
+    assert not state.is_resumable()
+    assert not os.path.exists(state.path)
+
+
+def test_download_multipart_object_of_other_part_size_is_not_verified(requests_mock, session, monkeypatch):
+    monkeypatch.setattr('abeja.common.s3etag.S3_CHUNK_SIZE', 4)
+    data = secrets.token_bytes(10)
+    # the ETag of 4 parts of 3 bytes can not be verified, so it is not a mismatch
+    etag = '"{}"'.format(calc_s3etag(secrets.token_bytes(10), 3))
+    requests_mock.get(URL, content=serve_ranges(data, etag=etag))
+    sink = BufferSink()
+    assert download(make_request(session), sink, part_size=4, verify_etag=True) == 10
+    assert bytes(sink.buffer) == data
+
+
+@pytest.mark.parametrize('content,raises', [(b'abc', False), (b'abd', True)])
+def test_download_verifies_etag_of_single_stream(requests_mock, session, content, raises):
+    requests_mock.get(URL, content=content, headers={
+        'ETag': '"{}"'.format(calc_s3etag(b'abc', 3)), 'Content-Length': '3'})
+    sink = BufferSink()
+    if raises:
+        with pytest.raises(EtagHashNotMatch):
+            download(make_request(session), sink, verify_etag=True)
+    else:
+        assert download(make_request(session), sink, verify_etag=True) == 3
+        assert bytes(sink.buffer) == content
+
+
+def test_download_single_part_object_in_parallel_is_not_verified(requests_mock, session):
+    data = secrets.token_bytes(10)
+    requests_mock.get(URL, content=serve_ranges(data, etag='"{}"'.format(calc_s3etag(b'x', 1))))
+    sink = BufferSink()
+    assert download(make_request(session), sink, part_size=4, verify_etag=True) == 10
+    assert bytes(sink.buffer) == data
@@ -55,3 +55,50 @@ class TestHTTPFile:
             f.write(b"abc")
         http_file = HTTPFile(api=APIClient(), uri=HTTP_URL)
         assert http_file.get_content() == b"abc"
+
+    @patch("abeja.common.local_file.MOUNT_DIR", TEST_MOUNT_DIR)
+    def test_get_buffer(self, requests_mock):
+        requests_mock.get(HTTP_URL, content=b"abc")
+        http_file = HTTPFile(api=APIClient(), uri=HTTP_URL)
+        buf = http_file.get_buffer()
+        assert isinstance(buf, memoryview)
+        assert buf == b"abc"
+        assert http_file.get_buffer() == b"abc"
+        assert requests_mock.call_count == 1
+
+    @patch("abeja.common.local_file.MOUNT_DIR", TEST_MOUNT_DIR)
+    @patch("abeja.common.download.DOWNLOAD_PART_SIZE", 4)
+    def test_get_content_with_ranges(self, requests_mock):
+        def callback(request, context):
+            start, end = map(int, request.headers["Range"][len("bytes="):].split("-"))
+            context.status_code = 206
+            context.headers["Content-Range"] = "bytes {}-{}/10".format(start, min(end, 9))
+            return b"0123456789"[start:end + 1]
+
+        requests_mock.get(HTTP_URL, content=callback)
+        http_file = HTTPFile(api=APIClient(), uri=HTTP_URL)
+        assert http_file.get_content() == b"0123456789"
+        assert requests_mock.call_count == 3
+        with open("./example.com/a/b/c.jpg", "rb") as f:
+            assert f.read() == b"0123456789"
+
+    @patch("abeja.common.local_file.MOUNT_DIR", TEST_MOUNT_DIR)
+    @patch("abeja.common.download.DOWNLOAD_PART_SIZE", 4)
+    def test_get_content_resumes_interrupted_download(self, requests_mock):
+        ranges = []
+
+        def callback(request, context):
+            start, end = map(int, request.headers["Range"][len("bytes="):].split("-"))
+            ranges.append(start)
+            context.status_code = 206
+            context.headers["ETag"] = '"etag"'
+            context.headers["Content-Range"] = "bytes {}-{}/10".format(start, min(end, 9))
+            body = b"0123456789"[start:end + 1]
+            # the first request of the second part is cut off
+            return body[:1] if start == 4 and ranges.count(4) == 1 else body
+
+        requests_mock.get(HTTP_URL, content=callback)
+        http_file = HTTPFile(api=APIClient(), uri=HTTP_URL)
+        assert http_file.get_content() == b"0123456789"
+        assert sorted(ranges) == [0, 4, 4, 8]
+        assert os.listdir("./example.com/a/b") == ["c.jpg"]
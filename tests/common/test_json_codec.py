@@ -0,0 +1,105 @@
+import datetime
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+
+from abeja.common import json_codec
+from abeja.common.json_codec import (
+    OrjsonCodec,
+    StdlibJSONCodec,
+    get_codec,
+    get_default_codec
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None    # type: ignore
+
+requires_orjson = pytest.mark.skipif(orjson is None, reason='orjson is not installed')
+
+CODECS = [StdlibJSONCodec, pytest.param(OrjsonCodec, marks=requires_orjson)]
+
+
+def make_page(size=1000):
+    """a page of a large listing response, like 1000-row qa histories"""
+    return {
+        'histories': [{
+            'id': str(i),
+            'question': 'question {}'.format(i) * 4,
+            'answer': 'answer {} ã'.format(i) * 16,
+            'score': i / 3,
+            'tags': ['a', 'b', 'c'],
+            'attributes': {'x': i, 'y': None, 'z': True},
+        } for i in range(size)],
+        'offset': 0,
+        'limit': size,
+        'has_next': False,
+    }
+
+
+@pytest.mark.parametrize('codec_class', CODECS)
+def test_round_trip(codec_class):
+    codec = codec_class()
+    page = make_page(10)
+    assert codec.loads(codec.dumps(page)) == page
+    assert codec.loads(json.dumps(page)) == page
+    assert codec.loads(json.dumps(page).encode('utf-8')) == page
+
+
+@pytest.mark.parametrize('codec_class', CODECS)
+def test_loads_invalid(codec_class):
+    with pytest.raises(ValueError):
+        codec_class().loads(b'{"a": ')
+
+
+@pytest.mark.parametrize('codec_class', CODECS)
+def test_dumps_unsupported_type(codec_class):
+    with pytest.raises(TypeError):
+        codec_class().dumps({'a': datetime.datetime(2020, 1, 1)})
+
+
+@requires_orjson
+def test_orjson_codec_fallback():
+    codec = OrjsonCodec()
+    assert codec.loads(b'{"a": 18446744073709551616}') == {'a': 2 ** 64}
+    assert codec.dumps({1: 'a'}) == b'{"1": "a"}'
+
+
+def test_get_codec():
+    assert isinstance(get_codec('json'), StdlibJSONCodec)
+    with pytest.raises(ValueError):
+        get_codec('unknown')
+
+
+@requires_orjson
+def test_get_orjson_codec():
+    assert isinstance(get_codec('orjson'), OrjsonCodec)
+
+
+@requires_orjson
+@patch.object(json_codec, '_default_codec', None)
+def test_default_codec_is_orjson_if_installed():
+    assert isinstance(get_default_codec(), OrjsonCodec)
+    assert get_default_codec() is get_default_codec()
+
+
+@patch.object(json_codec, '_default_codec', None)
+@patch.dict(os.environ, {'ABEJA_SDK_JSON_CODEC': 'json'})
+def test_default_codec_with_env_vars():
+    assert isinstance(get_default_codec(), StdlibJSONCodec)
+
+
+@patch.object(json_codec, '_default_codec', None)
+@patch.dict(os.environ, {}, clear=True)
+def test_default_codec_without_orjson():
+    with patch.dict('sys.modules', {'orjson': None}):
+        assert isinstance(get_default_codec(), StdlibJSONCodec)
+
+
+@requires_orjson
+def test_codecs_load_large_page_equally():
+    body = StdlibJSONCodec().dumps(make_page())
+    assert OrjsonCodec().loads(body) == StdlibJSONCodec().loads(body)
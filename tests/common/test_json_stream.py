@@ -0,0 +1,111 @@
+import json
+
+import pytest
+
+from abeja.common.json_stream import JSONArrayStream
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+PAGE = {
+    'total_count': 3,
+    'items': [
+        {'id': 1, 'name': 'ã', 'score': 12345.678, 'tags': ['a', '[', ']'], 'attributes': {}},
+        {'id': 22, 'name': 'b "x", {y}', 'score': -1e-05, 'tags': [], 'attributes': None},
+        12345678901234567890,
+    ],
+    'next_page_token': 'xxx',
+}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 64, 65536])
+@pytest.mark.parametrize('indent', [None, 2])
+def test_iterate(chunk_size, indent):
+    data = json.dumps(PAGE, indent=indent, ensure_ascii=False).encode('utf-8')
+    stream = JSONArrayStream(chunked(data, chunk_size), 'items')
+    assert list(stream) == PAGE['items']
+    assert stream.fields == {'total_count': 3, 'next_page_token': 'xxx'}
+
+
+def test_split_at_every_index():
+    data = b'{"items": [1.25, -3e+10, 12345678901234567890, true, "x"], "total_count": 10}'
+    for i in range(len(data) + 1):
+        stream = JSONArrayStream([data[:i], data[i:]], 'items')
+        assert list(stream) == [1.25, -3e+10, 12345678901234567890, True, 'x'], i
+        assert stream.fields == {'total_count': 10}, i
+
+
+def test_large_item_is_decoded_in_linear_time():
+    class CountingDecoder(json.JSONDecoder):
+        calls = 0
+
+        def raw_decode(self, s, idx=0):
+            CountingDecoder.calls += 1
+            return super().raw_decode(s, idx)
+
+    item = {'data': 'x' * 1000000}
+    data = json.dumps({'items': [item, 1]}).encode('utf-8')
+    stream = JSONArrayStream(chunked(data, 100), 'items')
+    stream._json_decoder = CountingDecoder()
+    assert list(stream) == [item, 1]
+    # the value is decoded again only when the buffer is doubled
+    assert CountingDecoder.calls < 30
+
+
+def test_items_are_yielded_as_they_arrive():
+    received = []
+
+    def chunks():
+        yield b'{"items": [{"id": 1}, '
+        received.append('second chunk')
+        yield b'{"id": 2}], "next_page_token": null}'
+
+    stream = JSONArrayStream(chunks(), 'items')
+    assert next(stream) == {'id': 1}
+    assert received == []
+    assert next(stream) == {'id': 2}
+    with pytest.raises(StopIteration):
+        next(stream)
+    assert stream.fields == {'next_page_token': None}
+
+
+@pytest.mark.parametrize('data,expected', [
+    (b'{}', {'items': []}),
+    (b'{"items": []}', {'items': []}),
+    (b' { "items" : [ 1 , 2 ] } ', {'items': [1, 2]}),
+    (b'{"a": 1, "b": [1, 2]}', {'a': 1, 'b': [1, 2], 'items': []}),
+])
+def test_read_all(data, expected):
+    assert JSONArrayStream([data], 'items').read_all() == expected
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'[]',
+    b'{"items": [1, 2',
+    b'{"items": [1 2]}',
+    b'{"items": [1,]}',
+    b'{1: []}',
+])
+def test_invalid_json(data):
+    with pytest.raises(ValueError):
+        list(JSONArrayStream(chunked(data, 3), 'items'))
+
+
+def test_item_hook():
+    stream = JSONArrayStream([b'{"items": [1, 2]}'], 'items', item_hook=lambda x: x * 10)
+    assert list(stream) == [10, 20]
+
+
+def test_on_close():
+    closed = []
+    stream = JSONArrayStream([b'{"items": [1, 2]}'], 'items', on_close=lambda: closed.append(True))
+    assert list(stream) == [1, 2]
+    assert closed == [True]
+
+    closed.clear()
+    with JSONArrayStream([b'{"items": [1, 2]}'], 'items', on_close=lambda: closed.append(True)) as stream:
+        next(stream)
+    assert closed == [True]
@@ -0,0 +1,137 @@
+import fcntl
+import os
+
+import pytest
+
+from abeja.common import local_cache, local_file
+from abeja.common.local_cache import EVICTION_LOCK_FILE, LocalCache, get_local_cache
+
+
+def make_file(root, name, size, atime):
+    path = os.path.join(str(root), name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    os.utime(path, (atime, atime))
+    return path
+
+
+def test_disabled(tmp_path):
+    cache = LocalCache(str(tmp_path))
+    path = make_file(tmp_path, 'a/1', 100, 1000)
+    cache.record_write(path)
+    assert not cache.enabled
+    assert cache.evict() == []
+    assert os.path.exists(path)
+
+
+def test_invalid_policy(tmp_path):
+    with pytest.raises(ValueError):
+        LocalCache(str(tmp_path), 100, policy='fifo')
+
+
+def test_evict_lru(tmp_path):
+    cache = LocalCache(str(tmp_path), size_limit=250, low_watermark=0.5)
+    paths = [make_file(tmp_path, 'a/{}'.format(i), 100, 1000 + i) for i in range(3)]
+    cache.record_access(paths[0])
+    assert cache.evict() == [paths[1], paths[2]]
+    assert cache.usage() == 100
+
+
+def test_evict_lfu(tmp_path):
+    cache = LocalCache(str(tmp_path), size_limit=250, policy='lfu')
+    paths = [make_file(tmp_path, 'a/{}'.format(i), 100, 1000 + i) for i in range(3)]
+    for _ in range(2):
+        cache.record_access(paths[2])
+    cache.record_access(paths[0])
+    assert cache.evict() == [paths[1]]
+
+
+def test_evict_skips_files_not_entries(tmp_path):
+    cache = LocalCache(str(tmp_path), size_limit=10)
+    names = ['a/1.part', 'a/1.part.json', 'a/2.30304-20191220162525-ee5a', '.lock']
+    paths = [make_file(tmp_path, name, 100, 1000) for name in names]
+    entry = make_file(tmp_path, 'a/3.jpg', 100, 2000)
+    assert cache.evict() == [entry]
+    assert all(os.path.exists(path) for path in paths)
+
+
+def test_evict_skips_pinned_and_excluded_files(tmp_path):
+    cache = LocalCache(str(tmp_path), size_limit=10)
+    paths = [make_file(tmp_path, 'a/{}'.format(i), 100, 1000 + i) for i in range(4)]
+    with cache.pin(paths[0]):
+        # pinned by another process
+        with open(paths[1], 'rb') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+            assert cache.evict(exclude=paths[2]) == [paths[3]]
+    assert cache.evict(exclude=paths[2]) == [paths[0], paths[1]]
+
+
+def test_evict_while_other_process_is_evicting(tmp_path):
+    cache = LocalCache(str(tmp_path), size_limit=10)
+    make_file(tmp_path, 'a/1', 100, 1000)
+    with open(os.path.join(str(tmp_path), EVICTION_LOCK_FILE), 'w') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        assert cache.evict() == []
+    assert len(cache.evict()) == 1
+
+
+def test_pin_evicted_file(tmp_path):
+    cache = LocalCache(str(tmp_path), size_limit=10)
+    with pytest.raises(FileNotFoundError):
+        with cache.pin(os.path.join(str(tmp_path), 'a/1')):
+            pass
+
+
+def test_record_write_evicts_when_limit_exceeded(tmp_path):
+    cache = LocalCache(str(tmp_path), size_limit=250)
+    paths = [make_file(tmp_path, 'a/{}'.format(i), 100, 1000 + i) for i in range(2)]
+    cache.record_write(paths[1])
+    assert cache.usage() == 200
+    path = make_file(tmp_path, 'a/new', 100, 900)
+    cache.record_write(path)
+    assert not os.path.exists(paths[0])
+    assert os.path.exists(path)
+
+
+def test_record_write_counts_files_written_by_other_processes(tmp_path):
+    cache = LocalCache(str(tmp_path), size_limit=250, usage_check_interval=3600)
+    first = make_file(tmp_path, 'a/0', 100, 1000)
+    cache.record_write(first)
+    # written by another process
+    make_file(tmp_path, 'a/1', 150, 1001)
+    cache.record_write(make_file(tmp_path, 'a/2', 10, 1002))
+    assert os.path.exists(first)
+    # files on disk are listed again when the interval has passed
+    cache.usage_check_interval = 0
+    cache.record_write(make_file(tmp_path, 'a/3', 10, 1003))
+    assert not os.path.exists(first)
+    assert cache.usage() == 170
+
+
+def test_evict_logs_files_failed_to_remove(tmp_path, monkeypatch, caplog):
+    cache = LocalCache(str(tmp_path), size_limit=10)
+    path = make_file(tmp_path, 'a/1', 100, 1000)
+
+    def remove(path):
+        raise PermissionError(13, 'Permission denied', path)
+
+    monkeypatch.setattr(local_cache.os, 'remove', remove)
+    assert cache.evict() == []
+    assert os.path.exists(path)
+    assert 'failed to evict a cached file' in caplog.text
+
+
+def test_cache_decorators_evict_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_file, 'MOUNT_DIR', str(tmp_path))
+    monkeypatch.setattr(get_local_cache(str(tmp_path)), 'size_limit', 250)
+
+    class Obj:
+        def __init__(self, uri):
+            self.uri = uri
+
+    for i in range(5):
+        decorated = local_file.use_binary_cache(lambda: b'x' * 100)
+        assert decorated(Obj('datalake://1234567890123/{}'.format(i))) == b'x' * 100
+    assert get_local_cache(str(tmp_path)).usage() <= 250
+    assert os.path.exists(os.path.join(str(tmp_path), '1234567890123', '4'))
@@ -1,11 +1,22 @@
 from abeja.common import local_file
-from abeja.common.local_file import use_text_cache, use_binary_cache, use_iter_content_cache, use_iter_lines_cache
+from abeja.common.local_file import (
+    use_text_cache, use_binary_cache, use_async_binary_cache, use_iter_content_cache, use_iter_lines_cache)
 from abeja.common.config import DEFAULT_CHUNK_SIZE
+from abeja.common.content_store import ContentStore
+from abeja.common.download import ContentCached
+from abeja.common.s3etag import calc_s3etag
+from abeja.exceptions import IncompleteDownload
+import asyncio
 import pytest
 import secrets
 import errno
+import fcntl
 from functools import partial
 import builtins
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 ORIGINAL_OPEN = builtins.open
 
@@ -130,6 +141,34 @@ def test_use_binary_cache(read_file_factory):
     assert cached == content
 
 
+def test_use_async_binary_cache_runs_file_io_in_executor(mount_dir, monkeypatch):
+    io_threads = []
+
+    def record_thread(func):
+        def wrapper(*args):
+            io_threads.append(threading.get_ident())
+            return func(*args)
+        return wrapper
+
+    monkeypatch.setattr(local_file, '_read_file', record_thread(local_file._read_file))
+    monkeypatch.setattr(local_file, '_write_file', record_thread(local_file._write_file))
+
+    async def get_content():
+        return b'test'
+
+    decorated = use_async_binary_cache(get_content)
+    obj = SourceURI('http://example.com/files/testfile')
+
+    async def main():
+        return threading.get_ident(), await decorated(obj), await decorated(obj)
+
+    loop_thread, saved, cached = asyncio.run(main())
+    assert saved == b'test'
+    assert cached == b'test'
+    assert len(io_threads) == 2
+    assert loop_thread not in io_threads
+
+
 def test_use_iter_content_cache(read_iter_factory):
     content = secrets.token_bytes(int(DEFAULT_CHUNK_SIZE * 3.7))
     saved, cached = read_iter_factory(use_iter_content_cache, content)
@@ -142,3 +181,186 @@ def test_use_iter_lines_cache(read_iter_factory):
     saved, cached = read_iter_factory(use_iter_lines_cache, content)
     assert list(saved) == ['1\n', '2\n', '3']
     assert list(cached) == ['1\n', '2\n', '3']
+
+
+def test_download_file(tmp_path):
+    path = str(tmp_path / 'file')
+
+    def download(f, state):
+        state.start('"etag"', 3)
+        f.write(b'abc')
+        state.add_part(0, 2)
+
+    local_file.download_file(path, download)
+    with open(path, 'rb') as f:
+        assert f.read() == b'abc'
+    assert sorted(os.listdir(str(tmp_path))) == ['file']
+
+
+def test_download_file_keeps_partial_file_to_resume(tmp_path):
+    path = str(tmp_path / 'file')
+
+    def interrupted(f, state):
+        state.start('"etag"', 6)
+        f.truncate(6)
+        f.write(b'abc')
+        state.add_part(0, 2)
+        raise IncompleteDownload('interrupted')
+
+    with pytest.raises(IncompleteDownload):
+        local_file.download_file(path, interrupted)
+    assert sorted(os.listdir(str(tmp_path))) == ['file.part', 'file.part.json']
+
+    def resume(f, state):
+        assert state.is_resumable()
+        assert state.missing_ranges(3) == [(3, 5)]
+        os.pwrite(f.fileno(), b'def', 3)
+        state.add_part(3, 5)
+
+    local_file.download_file(path, resume)
+    with open(path, 'rb') as f:
+        assert f.read() == b'abcdef'
+    assert sorted(os.listdir(str(tmp_path))) == ['file']
+
+
+def test_download_file_removes_partial_file_not_resumable(tmp_path):
+    path = str(tmp_path / 'file')
+
+    def failed(f, state):
+        f.write(b'abc')
+        raise IncompleteDownload('interrupted')
+
+    with pytest.raises(IncompleteDownload):
+        local_file.download_file(path, failed)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_download_file_while_other_process_is_downloading(tmp_path, monkeypatch):
+    path = str(tmp_path / 'file')
+    monkeypatch.setattr(local_file, '_try_lock', lambda fd: False)
+
+    def download(f, state):
+        assert not f.name.endswith('.part')
+        f.write(b'abc')
+
+    local_file.download_file(path, download)
+    with open(path, 'rb') as f:
+        assert f.read() == b'abc'
+
+
+@pytest.mark.parametrize('content', [b'', b'abc', secrets.token_bytes(100000)])
+def test_use_buffer_download_cache(tmp_path, monkeypatch, content):
+    monkeypatch.setattr(local_file, 'MOUNT_DIR', str(tmp_path))
+    calls = []
+
+    def download(f, state):
+        calls.append(True)
+        f.write(content)
+
+    obj = type('Obj', (), {'uri': 'datalake://1234567890123/file'})()
+    decorated = local_file.use_buffer_download_cache(download)
+    buf = decorated(obj)
+    assert isinstance(buf, memoryview)
+    assert buf.readonly
+    assert buf == content
+    assert decorated(obj).tobytes() == content
+    assert calls == [True]
+
+
+def test_download_cache_file_links_content_of_same_etag(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_file, 'MOUNT_DIR', str(tmp_path))
+    monkeypatch.setattr(local_file, '_get_content_store', lambda: ContentStore(str(tmp_path)))
+    etag = '"{}"'.format(calc_s3etag(b'abc', 3))
+    calls = []
+
+    def download(f, state):
+        calls.append(True)
+        if state.is_cached(etag):
+            raise ContentCached(etag)
+        state.start(etag, 3)
+        f.write(b'abc')
+        state.add_part(0, 2)
+
+    first = type('Obj', (), {'uri': 'datalake://1111111111111/a'})()
+    second = type('Obj', (), {'uri': 'http://example.com/b'})()
+    first_path = local_file._download_cache_file(first, download)
+    second_path = local_file._download_cache_file(second, download)
+    assert os.path.samefile(first_path, second_path)
+    with open(second_path, 'rb') as f:
+        assert f.read() == b'abc'
+    assert len(calls) == 2
+    assert not os.path.exists(second_path + local_file.PARTIAL_FILE_SUFFIX)
+
+
+def test_download_cache_file_waits_for_other_download(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_file, 'MOUNT_DIR', str(tmp_path))
+    started = threading.Event()
+    calls = []
+
+    def download(f, state):
+        calls.append(True)
+        started.set()
+        time.sleep(0.2)
+        f.write(b'abc')
+
+    obj = type('Obj', (), {'uri': 'datalake://1234567890123/file'})()
+    decorated = local_file.use_binary_download_cache(download)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        first = executor.submit(decorated, obj)
+        started.wait()
+        others = [executor.submit(decorated, obj) for _ in range(3)]
+        assert [f.result() for f in [first] + others] == [b'abc'] * 4
+    assert calls == [True]
+    assert os.listdir(str(tmp_path / '1234567890123')) == ['file']
+
+
+def test_waiter_saves_file_if_other_download_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_file, 'MOUNT_DIR', str(tmp_path))
+    started = threading.Event()
+    calls = []
+
+    def download():
+        calls.append(True)
+        if len(calls) == 1:
+            started.set()
+            time.sleep(0.2)
+            raise IncompleteDownload('interrupted')
+        return b'abc'
+
+    obj = type('Obj', (), {'uri': 'datalake://1234567890123/file'})()
+    decorated = use_binary_cache(lambda: download())
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(decorated, obj)
+        started.wait()
+        second = executor.submit(decorated, obj)
+        with pytest.raises(IncompleteDownload):
+            first.result()
+        assert second.result() == b'abc'
+    assert len(calls) == 2
+    assert os.listdir(str(tmp_path / '1234567890123')) == ['file']
+
+
+def test_download_cache_file_waits_for_other_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_file, 'MOUNT_DIR', str(tmp_path))
+    path = str(tmp_path / '1234567890123' / 'file')
+    os.makedirs(os.path.dirname(path))
+    # lock the entry as another process does
+    fd = os.open(path + local_file.LOCK_FILE_SUFFIX, os.O_RDWR | os.O_CREAT)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def finish():
+        time.sleep(0.2)
+        with open(path, 'wb') as f:
+            f.write(b'abc')
+        os.remove(path + local_file.LOCK_FILE_SUFFIX)
+        os.close(fd)
+
+    def download(f, state):
+        raise AssertionError('downloaded twice')
+
+    obj = type('Obj', (), {'uri': 'datalake://1234567890123/file'})()
+    thread = threading.Thread(target=finish)
+    thread.start()
+    assert local_file.use_binary_download_cache(download)(obj) == b'abc'
+    thread.join()
+    assert os.listdir(os.path.dirname(path)) == ['file']
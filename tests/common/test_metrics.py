@@ -0,0 +1,161 @@
+import pytest
+import requests
+import requests_mock
+
+from abeja.common import metrics
+from abeja.common.connection import Connection
+from abeja.common.metrics import MetricsAggregator, RequestMetrics, route_template
+
+
+@pytest.mark.parametrize('url,expected', [
+    ('https://api.abeja.io/organizations/1234567890123/channels',
+     '/organizations/{id}/channels'),
+    ('https://api.abeja.io/channels/1230000000000/20180510T110208-193d0d17-f0b1-4549-96df-651c02ccb8c9',
+     '/channels/{id}/{id}'),
+    ('https://api.abeja.io/users/user-1234567890123', '/users/{id}'),
+    ('https://s3.amazonaws.com/bucket/0123456789abcdef0123?X-Amz-Signature=x',
+     '/bucket/{id}'),
+    ('https://api.abeja.io', '/'),
+])
+def test_route_template(url, expected):
+    assert route_template(url) == expected
+
+
+def make_metrics(elapsed, status_code=200, **kwargs):
+    return RequestMetrics(
+        'get', 'https://api.abeja.io/channels/1230000000000', elapsed,
+        status_code=status_code, **kwargs)
+
+
+def test_aggregator_summary():
+    aggregator = MetricsAggregator()
+    for i in range(1, 101):
+        aggregator(make_metrics(i / 100, bytes_received=10,
+                                time_to_first_byte=i / 1000))
+    aggregator(make_metrics(2.0, status_code=None, error='ConnectionError', retry_count=3))
+
+    summary = aggregator.summary()[('GET', '/channels/{id}')]
+    assert summary['count'] == 101
+    assert summary['errors'] == 1
+    assert summary['retries'] == 3
+    assert summary['bytes_received'] == 1000
+    assert summary['status'] == {'200': 100, 'error': 1}
+    assert summary['p50'] == 0.51
+    assert summary['p95'] == 0.96
+    assert summary['p99'] == 1.0
+    assert summary['time_to_first_byte_p50'] == 0.051
+
+
+def test_aggregator_keeps_latest_samples():
+    aggregator = MetricsAggregator(max_samples=2)
+    for elapsed in (10, 1, 2):
+        aggregator(make_metrics(elapsed))
+    summary = aggregator.summary()[('GET', '/channels/{id}')]
+    assert summary['count'] == 3
+    assert summary['p99'] == 2
+
+
+def test_aggregator_to_prometheus():
+    aggregator = MetricsAggregator()
+    aggregator(make_metrics(0.5, bytes_sent=3, bytes_received=7,
+                            time_to_first_byte=0.1, retry_count=1))
+    text = aggregator.to_prometheus()
+    labels = 'method="GET",route="/channels/{id}"'
+    assert '# TYPE abeja_sdk_requests_total counter' in text
+    assert 'abeja_sdk_requests_total{%s,status="200"} 1' % labels in text
+    assert '# TYPE abeja_sdk_request_duration_seconds summary' in text
+    assert 'abeja_sdk_request_duration_seconds{%s,quantile="0.99"} 0.5' % labels in text
+    assert 'abeja_sdk_request_duration_seconds_count{%s} 1' % labels in text
+    assert 'abeja_sdk_request_time_to_first_byte_seconds_sum{%s} 0.1' % labels in text
+    assert 'abeja_sdk_request_retries_total{%s} 1' % labels in text
+    assert 'abeja_sdk_request_sent_bytes_total{%s} 3' % labels in text
+    assert 'abeja_sdk_request_received_bytes_total{%s} 7' % labels in text
+    assert text.endswith('\n')
+
+
+def test_connection_request_hook():
+    connection = Connection(credential={})
+    reported = []
+    connection.add_request_hook(reported.append)
+    url = '{}/channels/1230000000000'.format(connection.BASE_URL)
+    with requests_mock.Mocker() as m:
+        m.post(url, json={'a': 1}, headers={'Content-Length': '8'})
+        connection.api_request('POST', '/channels/1230000000000', data=b'abc')
+
+    assert len(reported) == 1
+    reported_metrics = reported[0]
+    assert reported_metrics.method == 'POST'
+    assert reported_metrics.route == '/channels/{id}'
+    assert reported_metrics.status_code == 200
+    assert reported_metrics.bytes_sent == 3
+    assert reported_metrics.bytes_received == 8
+    assert reported_metrics.retry_count == 0
+    assert reported_metrics.time_to_first_byte is not None
+    assert reported_metrics.elapsed >= 0
+
+
+def test_connection_request_hook_with_error():
+    connection = Connection(credential={})
+    reported = []
+    connection.add_request_hook(reported.append)
+    url = '{}/dummy'.format(connection.BASE_URL)
+    with requests_mock.Mocker() as m:
+        m.get(url, exc=requests.exceptions.ConnectTimeout)
+        with pytest.raises(requests.exceptions.ConnectTimeout):
+            connection.api_request('GET', '/dummy')
+    assert reported[0].status_code is None
+    assert reported[0].error == 'ConnectTimeout'
+
+
+def test_global_request_hook_and_failing_hook():
+    reported = []
+
+    def failing_hook(_):
+        raise RuntimeError('error in hook')
+
+    metrics.add_request_hook(failing_hook)
+    metrics.add_request_hook(reported.append)
+    try:
+        connection = Connection(credential={})
+        with requests_mock.Mocker() as m:
+            m.get('{}/dummy'.format(connection.BASE_URL), json={})
+            assert connection.api_request('GET', '/dummy') == {}
+    finally:
+        metrics.remove_request_hook(failing_hook)
+        metrics.remove_request_hook(reported.append)
+    assert len(reported) == 1
+    assert metrics.get_request_hooks() == []
+
+
+def test_connection_request_hook_with_streamed_response():
+    connection = Connection(credential={})
+    reported = []
+    connection.add_request_hook(reported.append)
+    url = '{}/dummy'.format(connection.BASE_URL)
+    with requests_mock.Mocker() as m:
+        m.get(url, content=b'x' * 1000)
+        res = connection.request('GET', url, stream=True)
+        assert reported == []
+        chunks = res.iter_content(100)
+        next(chunks)
+        assert reported == []
+        assert len(b''.join(chunks)) == 900
+        res.close()
+
+    assert len(reported) == 1
+    assert reported[0].status_code == 200
+    assert reported[0].bytes_received == 1000
+
+
+def test_connection_request_hook_with_closed_streamed_response():
+    connection = Connection(credential={})
+    reported = []
+    connection.add_request_hook(reported.append)
+    url = '{}/dummy'.format(connection.BASE_URL)
+    with requests_mock.Mocker() as m:
+        m.get(url, content=b'x' * 1000)
+        with connection.request('GET', url, stream=True):
+            assert reported == []
+
+    assert len(reported) == 1
+    assert reported[0].bytes_received is None
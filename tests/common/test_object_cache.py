@@ -0,0 +1,58 @@
+import pytest
+
+from abeja.common import object_cache
+from abeja.common.object_cache import ObjectCache, get_object_cache
+
+
+def test_get_and_put():
+    cache = ObjectCache(max_size=10)
+    assert cache.get('a') is None
+    assert cache.get('a', 'missing') == 'missing'
+    obj = {'a': 1}
+    cache.put('a', obj, 4)
+    assert cache.get('a') is obj
+    assert 'a' in cache
+    assert (len(cache), cache.size) == (1, 4)
+
+
+def test_evict_least_recently_used():
+    cache = ObjectCache(max_size=10)
+    cache.put('a', 1, 4)
+    cache.put('b', 2, 4)
+    cache.get('a')
+    cache.put('c', 3, 4)
+    assert 'b' not in cache
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.size == 8
+
+
+def test_replace_and_discard():
+    cache = ObjectCache(max_size=10)
+    cache.put('a', 1, 4)
+    cache.put('a', 2, 6)
+    assert (cache.get('a'), cache.size) == (2, 6)
+    cache.discard('a')
+    assert (len(cache), cache.size) == (0, 0)
+
+
+def test_object_larger_than_max_size_is_not_stored():
+    cache = ObjectCache(max_size=10)
+    cache.put('a', 1, 4)
+    cache.put('b', 2, 11)
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+
+
+def test_invalid_max_size():
+    with pytest.raises(ValueError):
+        ObjectCache(0)
+
+
+def test_get_object_cache(monkeypatch):
+    monkeypatch.setattr(object_cache, 'DECODED_OBJECT_CACHE_SIZE', 0)
+    assert get_object_cache() is None
+    monkeypatch.setattr(object_cache, 'DECODED_OBJECT_CACHE_SIZE', 100)
+    monkeypatch.setattr(object_cache, '_object_cache', None)
+    cache = get_object_cache()
+    assert cache.max_size == 100
+    assert get_object_cache() is cache
@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+from abeja.common.iterator import Iterator
+from abeja.common.prefetch import prefetch, read_ahead
+
+
+def test_ordered():
+    def func(x):
+        # later items complete first
+        time.sleep((10 - x) * 0.002)
+        return x * 10
+
+    results = list(prefetch(range(10), func, window_size=5, worker_count=5, ordered=True))
+    assert results == [x * 10 for x in range(10)]
+
+
+def test_unordered():
+    results = list(prefetch(range(20), lambda x: x, window_size=4, worker_count=2))
+    assert sorted(results) == list(range(20))
+
+
+def test_empty():
+    assert list(prefetch([], lambda x: x)) == []
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_window_bounds_items_taken_from_source(ordered):
+    taken = []
+
+    def source():
+        for i in range(1000):
+            taken.append(i)
+            yield i
+
+    it = prefetch(source(), lambda x: x, window_size=3, worker_count=2, ordered=ordered)
+    assert next(it) in (0, 1, 2)
+    # items are taken only as the consumer pulls results
+    assert len(taken) <= 4
+    next(it)
+    assert len(taken) <= 5
+    it.close()
+    assert len(taken) <= 5
+
+
+def test_window_is_at_least_worker_count():
+    running = set()
+    peak = []
+    lock = threading.Lock()
+
+    def func(x):
+        with lock:
+            running.add(x)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.discard(x)
+        return x
+
+    assert sorted(prefetch(range(8), func, window_size=1, worker_count=4)) == list(range(8))
+    assert max(peak) > 1
+
+
+def test_error_is_raised_to_consumer():
+    def func(x):
+        if x == 3:
+            raise ValueError(x)
+        return x
+
+    with pytest.raises(ValueError):
+        list(prefetch(range(10), func, window_size=2, worker_count=2, ordered=True))
+
+
+def test_read_ahead():
+    assert list(read_ahead(range(10), 2)) == list(range(10))
+    assert list(read_ahead([])) == []
+
+
+def test_read_ahead_takes_items_in_background():
+    taken = []
+
+    def source():
+        for i in range(100):
+            taken.append(i)
+            yield i
+
+    it = read_ahead(source(), 2)
+    assert next(it) == 0
+    deadline = time.time() + 1
+    while len(taken) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    # the next items are taken without waiting for the consumer, up to the limit
+    time.sleep(0.05)
+    assert 3 <= len(taken) <= 4
+    it.close()
+
+
+def test_read_ahead_raises_error_in_order():
+    def source():
+        yield 1
+        raise ValueError('failed')
+
+    it = read_ahead(source())
+    assert next(it) == 1
+    with pytest.raises(ValueError):
+        next(it)
+
+
+class Pages(Iterator):
+    def __init__(self, page_count, page_read_ahead=None):
+        self.requested = []
+        self._remaining = list(range(page_count))
+        if page_read_ahead is not None:
+            self.page_read_ahead = page_read_ahead
+
+    def _page(self):
+        if not self._remaining:
+            return []
+        page = self._remaining.pop(0)
+        self.requested.append(page)
+        return [page * 10, page * 10 + 1]
+
+
+def test_iterator_without_read_ahead():
+    pages = Pages(3)
+    items = iter(pages)
+    assert next(items) == 0
+    assert pages.requested == [0]
+    assert list(items) == [1, 10, 11, 20, 21]
+
+
+def test_iterator_with_read_ahead():
+    pages = Pages(10, page_read_ahead=1)
+    items = iter(pages)
+    assert next(items) == 0
+    deadline = time.time() + 1
+    while len(pages.requested) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    # the next page is requested before the current page is consumed
+    assert 2 <= len(pages.requested) <= 3
+    assert list(items) == [i for page in range(10) for i in (page * 10, page * 10 + 1)][1:]
@@ -0,0 +1,91 @@
+import os
+from unittest.mock import patch
+
+import pytest
+import requests_mock
+
+from abeja.common import rate_limiter as rate_limiter_module
+from abeja.common.connection import Connection
+from abeja.common.rate_limiter import RateLimiter, TokenBucket, DEFAULT_RATE_LIMITER
+
+
+@pytest.fixture
+def monotonic():
+    with patch('abeja.common.rate_limiter.time.monotonic') as m:
+        m.return_value = 100.0
+        yield m
+
+
+def test_token_bucket(monotonic):
+    bucket = TokenBucket(rate=2, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0.5
+    assert bucket.reserve() == 1.0
+    # tokens reserved in advance are paid back first
+    monotonic.return_value = 101.0
+    assert bucket.reserve() == 0.5
+    monotonic.return_value = 110.0
+    assert bucket.reserve() == 0
+
+
+def test_token_bucket_invalid_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_rate_limiter_matches_host_and_path_prefix(monotonic):
+    limiter = RateLimiter()
+    limiter.set_limit(1, host='api.abeja.io')
+    limiter.set_limit(1, host='api.abeja.io', path_prefix='/channels')
+
+    assert limiter.reserve('https://api.abeja.io/channels/1') == 0
+    # both of host and route buckets are consumed
+    assert limiter.reserve('https://api.abeja.io/organizations/1') == 1
+    assert limiter.reserve('https://api.abeja.io/channels/1') == 2
+    assert limiter.reserve('https://s3.amazonaws.com/bucket/key') == 0
+
+
+def test_rate_limiter_without_host(monotonic):
+    limiter = RateLimiter()
+    limiter.set_limit(1)
+    assert limiter.reserve('https://example.com/a') == 0
+    assert limiter.reserve('https://api.abeja.io/b') == 1
+    limiter.remove_limit()
+    assert limiter.reserve('https://api.abeja.io/b') == 0
+
+
+def test_rate_limiter_acquire_sleeps(monotonic):
+    limiter = RateLimiter()
+    limiter.set_limit(2, burst=1)
+    with patch('abeja.common.rate_limiter.time.sleep') as m:
+        limiter.acquire('https://api.abeja.io/')
+        m.assert_not_called()
+        limiter.acquire('https://api.abeja.io/')
+        m.assert_called_once_with(0.5)
+
+
+@patch.dict(os.environ, {
+    'ABEJA_SDK_RATE_LIMIT': '10:20',
+    'ABEJA_API_URL': 'https://api.example.com'})
+def test_configure_from_env():
+    limiter = RateLimiter()
+    rate_limiter_module._configure_from_env(limiter)
+    bucket = limiter._buckets[('api.example.com', '')]
+    assert bucket.rate == 10
+    assert bucket.capacity == 20
+
+
+def test_connection_consults_rate_limiter():
+    limiter = RateLimiter()
+    connection = Connection(credential={}, rate_limiter=limiter)
+    url = '{}/dummy'.format(connection.BASE_URL)
+    with patch.object(limiter, 'acquire') as m, requests_mock.Mocker() as rm:
+        rm.get(url, json={})
+        connection.api_request('GET', '/dummy')
+    m.assert_called_once_with(url)
+
+
+def test_connection_shares_default_rate_limiter():
+    assert Connection().rate_limiter is DEFAULT_RATE_LIMITER
+    assert Connection().rate_limiter is Connection().rate_limiter
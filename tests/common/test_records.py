@@ -0,0 +1,115 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from abeja.common import records
+from abeja.common.records import guess_record_format, iter_record_batches
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+JSONL = b''.join(
+    json.dumps({'id': i, 'name': 'itemé{}'.format(i)}).encode() + b'\n' for i in range(10))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1024])
+def test_jsonl(chunk_size):
+    batches = list(iter_record_batches(split(JSONL, chunk_size), 'jsonl', batch_size=4))
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert [record['id'] for batch in batches for record in batch] == list(range(10))
+    assert batches[0][1]['name'] == 'itemé1'
+
+
+def test_jsonl_without_trailing_newline_and_blank_lines():
+    data = b'{"a": 1}\n\n{"a": 2}\r\n{"a": 3}'
+    assert list(iter_record_batches([data], 'jsonl')) == [[{'a': 1}, {'a': 2}, {'a': 3}]]
+
+
+def test_jsonl_columns():
+    data = b'{"a": 1, "b": "x"}\n{"a": 2, "c": true}\n'
+    assert list(iter_record_batches([data], 'jsonl', columns=True)) == [
+        {'a': [1, 2], 'b': ['x', None], 'c': [None, True]}]
+
+
+def test_jsonl_numpy():
+    np = pytest.importorskip('numpy')
+    data = b'{"a": 1, "b": [1, 2]}\n{"a": 2, "b": [3]}\n'
+    batch, = iter_record_batches([data], 'jsonl', numpy=True)
+    assert batch['a'].dtype == np.int64
+    assert batch['a'].tolist() == [1, 2]
+    assert batch['b'].dtype == object
+    assert batch['b'].tolist() == [[1, 2], [3]]
+
+
+def test_jsonl_batch_is_decoded_at_once(monkeypatch):
+    loads = MagicMock(side_effect=json.loads)
+    monkeypatch.setattr(records, 'get_default_codec', lambda: SimpleNamespace(loads=loads))
+    batches = list(iter_record_batches(split(JSONL, 7), 'jsonl', batch_size=4))
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert loads.call_count == 3
+
+
+@pytest.mark.parametrize('data', [b'{"a": 1}\n{"a"\n', b'{"a": 1}\n1, 2\n', b'[1\n2]\n'])
+def test_invalid_jsonl(data):
+    with pytest.raises(ValueError):
+        list(iter_record_batches([data], 'jsonl'))
+
+
+CSV = 'id,name,price\r\n1,"multi\r\nline",1.5\r\n2,café,2\r\n\r\n3,"a,b",3\r\n'.encode()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 1024])
+def test_csv(chunk_size):
+    batches = list(iter_record_batches(split(b'\xef\xbb\xbf' + CSV, chunk_size), 'csv', batch_size=2))
+    assert batches == [
+        [{'id': '1', 'name': 'multi\r\nline', 'price': '1.5'},
+         {'id': '2', 'name': 'café', 'price': '2'}],
+        [{'id': '3', 'name': 'a,b', 'price': '3'}]]
+
+
+def test_csv_without_header():
+    data = b'1,a\n2,b,extra\n'
+    assert list(iter_record_batches([data], 'csv', header=False)) == [[['1', 'a'], ['2', 'b', 'extra']]]
+    assert list(iter_record_batches([data], 'csv', header=False, columns=True)) == [
+        {0: ['1', '2'], 1: ['a', 'b'], 2: [None, 'extra']}]
+
+
+def test_csv_numpy():
+    np = pytest.importorskip('numpy')
+    batch, = iter_record_batches([CSV], 'csv', numpy=True)
+    assert batch['id'].dtype == np.int64
+    assert batch['price'].dtype == np.float64
+    assert batch['price'].tolist() == [1.5, 2.0, 3.0]
+    assert batch['name'].tolist() == ['multi\r\nline', 'café', 'a,b']
+
+
+def test_csv_with_delimiter_and_encoding():
+    data = 'a;b\n1;あ\n'.encode('shift_jis')
+    assert list(iter_record_batches([data], 'csv', delimiter=';', encoding='shift_jis')) == [
+        [{'a': '1', 'b': 'あ'}]]
+
+
+def test_empty_file():
+    assert list(iter_record_batches([], 'csv')) == []
+    assert list(iter_record_batches([b''], 'jsonl')) == []
+
+
+@pytest.mark.parametrize('kwargs', [{'record_format': 'parquet'}, {'record_format': 'csv', 'batch_size': 0}])
+def test_invalid_arguments(kwargs):
+    with pytest.raises(ValueError):
+        list(iter_record_batches([b''], **kwargs))
+
+
+@pytest.mark.parametrize('content_type,filename,expected', [
+    ('application/x-ndjson', None, 'jsonl'),
+    ('text/csv; charset=utf-8', None, 'csv'),
+    ('application/octet-stream', 'log.JSONL', 'jsonl'),
+    (None, 'data.csv', 'csv'),
+    ('text/plain', 'data.txt', None),
+])
+def test_guess_record_format(content_type, filename, expected):
+    assert guess_record_format(content_type, filename) == expected
@@ -0,0 +1,58 @@
+from unittest.mock import patch
+
+import pytest
+
+from abeja.common.response_cache import ResponseCache
+
+
+def test_put_and_get():
+    cache = ResponseCache()
+    body = {'channel': {'name': 'test'}}
+    cache.put('key', {'ETag': '"abc"'}, body)
+    body['channel']['name'] = 'modified'
+
+    entry = cache.get('key')
+    assert entry.body == {'channel': {'name': 'test'}}
+    assert entry.conditional_headers() == {'If-None-Match': '"abc"'}
+
+
+def test_put_with_last_modified():
+    cache = ResponseCache()
+    cache.put('key', {'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'}, {})
+    assert cache.get('key').conditional_headers() == {
+        'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+
+
+def test_put_without_validators():
+    cache = ResponseCache()
+    cache.put('key', {'ETag': '"abc"'}, {})
+    cache.put('key', {}, {})
+    assert cache.get('key') is None
+    assert len(cache) == 0
+
+
+def test_evict_least_recently_used():
+    cache = ResponseCache(maxsize=2)
+    cache.put('a', {'ETag': 'a'}, {})
+    cache.put('b', {'ETag': 'b'}, {})
+    cache.get('a')
+    cache.put('c', {'ETag': 'c'}, {})
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+    assert cache.get('c') is not None
+
+
+def test_expire_after_ttl():
+    cache = ResponseCache(ttl=10)
+    with patch('abeja.common.response_cache.time.monotonic', return_value=100):
+        cache.put('key', {'ETag': 'a'}, {})
+    with patch('abeja.common.response_cache.time.monotonic', return_value=110):
+        assert cache.get('key') is not None
+    with patch('abeja.common.response_cache.time.monotonic', return_value=111):
+        assert cache.get('key') is None
+    assert len(cache) == 0
+
+
+def test_invalid_maxsize():
+    with pytest.raises(ValueError):
+        ResponseCache(maxsize=0)
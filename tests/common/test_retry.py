@@ -0,0 +1,140 @@
+from unittest.mock import patch
+from urllib.parse import urlparse
+
+import pytest
+import requests
+import requests_mock
+
+from abeja.common.connection import Connection
+from abeja.common.retry import CircuitBreaker, RetryBudget, RetryPolicy
+from abeja.exceptions import CircuitBreakerOpen, InternalServerError
+
+
+def test_get_backoff_time_with_full_jitter():
+    policy = RetryPolicy(backoff_factor=1, backoff_max=10)
+    assert policy.get_backoff_time(0) == 0
+    with patch('abeja.common.retry.random.uniform', side_effect=lambda a, b: b):
+        assert policy.get_backoff_time(1) == 1
+        assert policy.get_backoff_time(3) == 4
+        assert policy.get_backoff_time(10) == 10
+    with patch('abeja.common.retry.random.uniform', side_effect=lambda a, b: a):
+        assert policy.get_backoff_time(3) == 0
+
+
+def test_get_backoff_time_without_jitter():
+    policy = RetryPolicy(backoff_factor=0.5, jitter=False)
+    assert policy.get_backoff_time(3) == 2
+
+
+@pytest.mark.parametrize('value,expected', [
+    (None, None),
+    ('3', 3),
+    ('1000', 120),
+    ('Wed, 21 Oct 2015 07:28:00 GMT', 0),
+    ('invalid', None),
+])
+def test_get_retry_after(value, expected):
+    policy = RetryPolicy()
+    headers = {} if value is None else {'Retry-After': value}
+    assert policy.get_retry_after(headers) == expected
+
+
+def test_is_retryable():
+    policy = RetryPolicy()
+    assert policy.is_retryable('get')
+    assert policy.is_retryable('POST', 429)
+    assert policy.is_retryable('GET', 503)
+    assert not policy.is_retryable('GET', 404)
+    assert not policy.is_retryable('HEAD', 503)
+
+
+def test_build_retry_keeps_policy():
+    policy = RetryPolicy(total=3)
+    retry = policy.build_retry(5)
+    assert retry.total == 3
+    assert retry.new(total=2).policy is policy
+    assert 429 in retry.status_forcelist
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, min_retries_per_second=0, window=10)
+    with patch('abeja.common.retry.time.monotonic', return_value=100):
+        for _ in range(4):
+            budget.record_request()
+        assert budget.try_acquire()
+        assert budget.try_acquire()
+        assert not budget.try_acquire()
+    # counts out of the window are forgotten
+    with patch('abeja.common.retry.time.monotonic', return_value=111):
+        assert not budget.try_acquire()
+        budget.record_request()
+        budget.record_request()
+        assert budget.try_acquire()
+
+
+def test_retry_budget_with_min_retries():
+    budget = RetryBudget(ratio=0, min_retries_per_second=0.1, window=10)
+    with patch('abeja.common.retry.time.monotonic', return_value=100):
+        assert budget.try_acquire()
+        assert not budget.try_acquire()
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10)
+    with patch('abeja.common.retry.time.monotonic', return_value=100):
+        breaker.record_failure('a')
+        assert breaker.allow_request('a')
+        breaker.record_failure('a')
+        assert not breaker.allow_request('a')
+        assert breaker.allow_request('b')
+    with patch('abeja.common.retry.time.monotonic', return_value=110):
+        # half-open: only one trial request is allowed
+        assert breaker.allow_request('a')
+        assert not breaker.allow_request('a')
+        breaker.record_success('a')
+        assert breaker.allow_request('a')
+
+
+class TestConnectionWithRetryPolicy:
+    def test_retry_on_too_many_requests(self):
+        policy = RetryPolicy(backoff_factor=0, budget=None)
+        connection = Connection(credential={}, retry_policy=policy)
+        session = connection._get_session()
+        retry = session.get_adapter('https://api.abeja.io').max_retries
+        assert retry.policy is policy
+        assert retry.is_retry('GET', 429)
+
+    def test_circuit_breaker_rejects_requests(self):
+        policy = RetryPolicy(
+            total=0, budget=None,
+            circuit_breaker=CircuitBreaker(failure_threshold=2))
+        connection = Connection(credential={}, retry_policy=policy)
+        url = '{}/dummy'.format(connection.BASE_URL)
+        with requests_mock.Mocker() as m:
+            m.get(url, status_code=500, text='error')
+            for _ in range(2):
+                with pytest.raises(InternalServerError):
+                    connection.api_request('GET', '/dummy')
+            with pytest.raises(CircuitBreakerOpen):
+                connection.api_request('GET', '/dummy')
+            assert m.call_count == 2
+
+    def test_circuit_breaker_records_connection_error(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        policy = RetryPolicy(total=0, budget=None, circuit_breaker=breaker)
+        connection = Connection(credential={}, retry_policy=policy)
+        url = '{}/dummy'.format(connection.BASE_URL)
+        with requests_mock.Mocker() as m:
+            m.get(url, exc=requests.exceptions.ConnectionError)
+            with pytest.raises(requests.exceptions.ConnectionError):
+                connection.api_request('GET', '/dummy')
+        assert not breaker.allow_request(urlparse(connection.BASE_URL).netloc)
+
+    def test_request_is_recorded_in_budget(self):
+        budget = RetryBudget()
+        connection = Connection(
+            credential={}, retry_policy=RetryPolicy(budget=budget))
+        with requests_mock.Mocker() as m:
+            m.get('{}/dummy'.format(connection.BASE_URL), json={})
+            connection.api_request('GET', '/dummy')
+        assert sum(b[1] for b in budget._buckets) == 1
@@ -0,0 +1,102 @@
+import hashlib
+import secrets
+
+import pytest
+
+from abeja.common.s3etag import S3ETagVerifier, calc_s3etag, content_md5_etag, infer_part_size, parse_s3etag
+from abeja.exceptions import EtagHashNotMatch
+
+MB = 1024 * 1024
+
+
+@pytest.mark.parametrize('etag,expected', [
+    ('"d41d8cd98f00b204e9800998ecf8427e"', ('d41d8cd98f00b204e9800998ecf8427e', 1)),
+    ('D41D8CD98F00B204E9800998ECF8427E', ('d41d8cd98f00b204e9800998ecf8427e', 1)),
+    ('"d41d8cd98f00b204e9800998ecf8427e-12"', ('d41d8cd98f00b204e9800998ecf8427e', 12)),
+    ('W/"5e-17a2c4"', None),
+    ('', None),
+    (None, None),
+])
+def test_parse_s3etag(etag, expected):
+    assert parse_s3etag(etag) == expected
+
+
+@pytest.mark.parametrize('size,part_count,expected', [
+    (100, 1, 100),
+    (12 * MB, 3, 5 * MB),
+    (10 * MB, 2, 5 * MB),
+    (100 * MB, 13, None),
+    (95000000, 10, None),
+    (10, 3, None),
+    (20 * MB, 2, None),
+    (2, 3, None),
+])
+def test_infer_part_size(size, part_count, expected):
+    assert infer_part_size(size, part_count) == expected
+
+
+@pytest.mark.parametrize('headers,expected', [
+    ({'ETag': '"abc"'}, '"abc"'),
+    ({'ETag': '"abc"', 'x-amz-server-side-encryption': 'AES256'}, '"abc"'),
+    ({'ETag': '"abc"', 'x-amz-server-side-encryption': 'aws:kms'}, None),
+    ({'ETag': '"abc"', 'x-amz-server-side-encryption-customer-algorithm': 'AES256'}, None),
+    ({}, None),
+])
+def test_content_md5_etag(headers, expected):
+    assert content_md5_etag(headers) == expected
+
+
+@pytest.fixture
+def small_chunk_size(monkeypatch):
+    monkeypatch.setattr('abeja.common.s3etag.S3_CHUNK_SIZE', 4)
+
+
+@pytest.mark.parametrize('size,part_size', [(0, 1), (1000, 1000), (11 * MB, 5 * MB), (10 * MB, 5 * MB)])
+def test_verify(size, part_size):
+    data = secrets.token_bytes(size)
+    verifier = S3ETagVerifier.create(calc_s3etag(data, part_size), size)
+    for offset in range(0, size, 100000):
+        verifier.update(offset, data[offset:offset + 100000])
+    assert verifier.verify()
+
+
+def test_verify_parts_in_any_order(small_chunk_size):
+    data = secrets.token_bytes(10)
+    verifier = S3ETagVerifier.create(calc_s3etag(data, 4), len(data))
+    assert verifier.part_size == 4
+    for start in (8, 4, 0):
+        verifier.update(start, data[start:start + 2])
+        verifier.update(start + 2, data[start + 2:start + 4])
+    assert verifier.verify()
+
+
+def test_verify_not_sequential_part(small_chunk_size):
+    data = secrets.token_bytes(10)
+    verifier = S3ETagVerifier.create(calc_s3etag(data, 4), len(data))
+    verifier.update(2, data[2:4])
+    verifier.update(0, data[:2])
+    verifier.update(4, data[4:])
+    assert not verifier.verifiable
+    assert not verifier.verify()
+
+
+def test_verify_incomplete(small_chunk_size):
+    data = secrets.token_bytes(10)
+    verifier = S3ETagVerifier.create(calc_s3etag(data, 4), len(data))
+    verifier.update(0, data[:9])
+    assert not verifier.verify()
+
+
+def test_verify_corrupted():
+    data = secrets.token_bytes(1000)
+    verifier = S3ETagVerifier.create(hashlib.md5(data).hexdigest(), len(data))
+    verifier.update(0, data[:-1] + b'x')
+    with pytest.raises(EtagHashNotMatch):
+        verifier.verify()
+
+
+def test_create_without_verifiable_etag():
+    assert S3ETagVerifier.create('"xyz"', 10) is None
+    assert S3ETagVerifier.create('"d41d8cd98f00b204e9800998ecf8427e-3"', None) is None
+    # the part size is not the chunk size of the platform
+    assert S3ETagVerifier.create('"d41d8cd98f00b204e9800998ecf8427e-10"', 95000000) is None
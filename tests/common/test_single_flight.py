@@ -0,0 +1,99 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from abeja.common.single_flight import SingleFlight
+
+
+def wait_for_waiters(single_flight, key, n):
+    """wait until `n` callers are blocked on the call in flight for `key`"""
+    call = single_flight._calls[key]
+    while len(call.done._cond._waiters) < n:
+        time.sleep(0.001)
+
+
+def test_do_coalesces_calls_in_flight():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def func():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'result'
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        leader = executor.submit(single_flight.do, 'key', func)
+        started.wait(5)
+        followers = [executor.submit(single_flight.do, 'key', func)
+                     for _ in range(4)]
+        wait_for_waiters(single_flight, 'key', 4)
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert len(calls) == 1
+    assert results[0] == ('result', False)
+    assert all(r == ('result', True) for r in results[1:])
+
+
+def test_do_calls_again_after_completion():
+    single_flight = SingleFlight()
+    calls = []
+    assert single_flight.do('key', lambda: calls.append(1)) == (None, False)
+    assert single_flight.do('key', lambda: calls.append(1)) == (None, False)
+    assert len(calls) == 2
+
+
+def test_do_raises_error():
+    single_flight = SingleFlight()
+
+    def func():
+        raise ValueError('error')
+
+    with pytest.raises(ValueError):
+        single_flight.do('key', func)
+    assert single_flight._calls == {}
+
+
+def test_do_copies_result_for_waiters_before_caller_modifies_it():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    copies = []
+
+    def func():
+        started.set()
+        release.wait(5)
+        return {'files': ['encoded']}
+
+    def copy_result(result):
+        copies.append(True)
+        return {'files': list(result['files'])}
+
+    def leader():
+        result, shared = single_flight.do('key', func, copy_result=copy_result)
+        # e.g. metadata of files is decoded in place
+        result['files'] = ['decoded']
+        return result, shared
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        first = executor.submit(leader)
+        started.wait(5)
+        followers = [executor.submit(single_flight.do, 'key', func, copy_result)
+                     for _ in range(2)]
+        wait_for_waiters(single_flight, 'key', 2)
+        release.set()
+        assert first.result() == ({'files': ['decoded']}, False)
+        assert [f.result() for f in followers] == [({'files': ['encoded']}, True)] * 2
+    # a snapshot for waiters, and a copy for each waiter
+    assert len(copies) == 3
+
+
+def test_do_does_not_copy_result_without_waiters():
+    single_flight = SingleFlight()
+    result = {'a': 1}
+    assert single_flight.do('key', lambda: result, copy_result=dict)[0] is result
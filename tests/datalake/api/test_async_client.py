@@ -0,0 +1,107 @@
+import asyncio
+import datetime
+import io
+from unittest.mock import patch
+
+import pytest
+
+from abeja.common.retry import RetryPolicy
+from abeja.datalake import AsyncAPIClient
+from abeja.datalake.file import DatalakeFile
+from abeja.exceptions import NotFound
+
+web = pytest.importorskip('aiohttp.web')
+test_utils = pytest.importorskip('aiohttp.test_utils')
+
+CHANNEL_ID = '1230000000000'
+FILE_ID = '20180510T110208-193d0d17-f0b1-4549-96df-651c02ccb8c9'
+
+
+def make_app():
+    async def get_file(request):
+        return web.json_response({
+            'file_id': FILE_ID,
+            'download_uri': str(request.url.with_path('/download')),
+            'metadata': {'x-abeja-meta-filename': '%E3%81%82.jpg'}})
+
+    async def download(request):
+        return web.Response(body=b'content')
+
+    async def missing(request):
+        return web.json_response(
+            {'error': 'not_found', 'error_description': 'file not found'}, status=404)
+
+    async def expired(request):
+        return web.Response(status=403, body=b'expired')
+
+    uploaded = []
+
+    async def upload(request):
+        uploaded.append(await request.read())
+        if len(uploaded) < 2:
+            return web.Response(status=503)
+        return web.json_response({'file_id': FILE_ID, 'size': len(uploaded[-1])}, status=201)
+
+    app = web.Application()
+    app.router.add_get('/channels/{}/{}'.format(CHANNEL_ID, FILE_ID), get_file)
+    app.router.add_get('/channels/{}/missing'.format(CHANNEL_ID), missing)
+    app.router.add_get('/download', download)
+    app.router.add_get('/expired', expired)
+    app.router.add_post('/channels/{}/upload'.format(CHANNEL_ID), upload)
+    return app
+
+
+def run(coro_factory):
+    async def main():
+        async with test_utils.TestServer(make_app()) as server:
+            async with AsyncAPIClient(credential={}) as api_client:
+                api_client._connection.BASE_URL = str(server.make_url(''))
+                return await coro_factory(api_client)
+    return asyncio.run(main())
+
+
+def test_get_channel_file_download():
+    res = run(lambda api: api.get_channel_file_download(CHANNEL_ID, FILE_ID))
+    assert res['file_id'] == FILE_ID
+    assert res['metadata'] == {'x-abeja-meta-filename': 'あ.jpg'}
+
+
+def test_get_channel_file_download_not_found():
+    async def main(api):
+        with pytest.raises(NotFound):
+            await api.get_channel_file_download(CHANNEL_ID, 'missing')
+    run(main)
+
+
+def test_datalake_file_get_content_async(tmpdir):
+    datalake_file = DatalakeFile(None, channel_id=CHANNEL_ID, file_id=FILE_ID)
+    with patch('abeja.common.local_file.MOUNT_DIR', str(tmpdir)):
+        content = run(lambda api: datalake_file.get_content_async(api))
+        assert content == b'content'
+        assert tmpdir.join(CHANNEL_ID, FILE_ID).read_binary() == b'content'
+
+
+def test_datalake_file_get_content_async_refreshes_rejected_uri():
+    url_expires_on = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)).isoformat()
+
+    async def main(api):
+        datalake_file = DatalakeFile(
+            None, channel_id=CHANNEL_ID, file_id=FILE_ID,
+            download_uri=api._connection.BASE_URL.rstrip('/') + '/expired',
+            url_expires_on=url_expires_on)
+        content = await datalake_file._get_content_from_remote_async(api)
+        return content, datalake_file.download_uri
+
+    content, download_uri = run(main)
+    assert content == b'content'
+    assert download_uri.endswith('/download')
+
+
+def test_post_channel_file_upload_retries_with_whole_file():
+    async def main(api):
+        api._connection.retry_policy = RetryPolicy(backoff_factor=0, budget=None)
+        return await api.post_channel_file_upload(
+            CHANNEL_ID, io.BytesIO(b'content'), 'application/octet-stream')
+    res = run(main)
+    assert res['file_id'] == FILE_ID
+    assert res['size'] == len(b'content')
@@ -329,6 +329,32 @@ class TestApiClient(TestCase):
         file = res['files'][0]
         assert METADATA.items() < file['metadata'].items()
 
+    @requests_mock.Mocker()
+    def test_list_channel_files_with_stream(self, m):
+        path = '/channels/{}'.format(CHANNEL_ID)
+        m.get(path, json={
+            'files': [
+                {
+                    "metadata": ENCODED_METADATA,
+                    "file_id": FILE_ID,
+                    "content_type": CONTENT_TYPE
+                },
+                {
+                    "file_id": FILE_ID,
+                    "content_type": CONTENT_TYPE
+                }
+            ],
+            'next_page_token': 'xxx'
+        })
+
+        api_client = APIClient()
+        stream = api_client.list_channel_files(CHANNEL_ID, stream=True)
+        files = list(stream)
+
+        assert len(files) == 2
+        assert files[0]['metadata'] == METADATA
+        assert stream.fields == {'next_page_token': 'xxx'}
+
     @patch('requests.Session.request')
     def test_list_channel_files_with_sort(self, m):
         self.api_client.list_channel_files(CHANNEL_ID, sort='-uploaded_at')
@@ -1,18 +1,24 @@
+import datetime
+import hashlib
 import json
 import os
 import shutil
+import tempfile
 import unittest
-from unittest.mock import patch, create_autospec
+from unittest.mock import call, patch, create_autospec
 
 import requests
+import requests_mock
 from mock import MagicMock
 
+from abeja.common.object_cache import ObjectCache
+from abeja.datalake.api.client import APIClient
 from abeja.exceptions import HttpError
 from abeja.datalake.file import (
     FileIterator,
     DatalakeFile
 )
-from abeja.exceptions import BadRequest
+from abeja.exceptions import BadRequest, EtagHashNotMatch
 
 TEST_MOUNT_DIR = 'tests/datasets/tmp'
 
@@ -250,6 +256,26 @@ class TestFileIterator(unittest.TestCase):
         self.assertEqual(len(page), 1)
         self.assertEqual(page[0].file_id, 'file_id_2')
 
+    def test_page_iter_with_read_ahead(self):
+        mock_api = MagicMock()
+        mock_api.list_channel_files.side_effect = [
+            {
+                'next_page_token': 'dummy{}'.format(page),
+                'files': [{'file_id': 'file_id_{}'.format(page)}]
+            } for page in range(5)
+        ] + [{'next_page_token': None, 'files': [{'file_id': 'file_id_5'}]}]
+        iterator = FileIterator(
+            mock_api,
+            organization_id=ORGANIZATION_ID,
+            channel_id=CHANNEL_ID,
+            page_read_ahead=2)
+        self.assertListEqual(
+            [f.file_id for f in iterator], ['file_id_{}'.format(i) for i in range(6)])
+        self.assertEqual(mock_api.list_channel_files.call_count, 6)
+        self.assertDictEqual(
+            mock_api.list_channel_files.call_args_list[3][1],
+            {'next_page_token': 'dummy2'})
+
     def test_page_with_start_and_end(self):
         mock_api = MagicMock()
         mock_api.list_channel_files.side_effect = [
@@ -318,6 +344,50 @@ class TestFileIterator(unittest.TestCase):
             mock_api.list_channel_files.call_args_list[1][1],
             {'next_page_token': 'dummy'})
 
+    @patch('abeja.datalake.file.DatalakeFile.get_content')
+    @patch('abeja.datalake.file.DatalakeFile.cache_only')
+    def test_items_iter_with_prefetch(self, mock_cache_only, mock_get_content):
+        mock_api = MagicMock()
+        mock_api.list_channel_files.return_value = {
+            'next_page_token': None,
+            'files': [{'file_id': 'file_id_1'}, {'file_id': 'file_id_2'}]
+        }
+        iterator = FileIterator(
+            mock_api,
+            organization_id=ORGANIZATION_ID,
+            channel_id=CHANNEL_ID,
+            prefetch=True)
+        file_ids = sorted(f.file_id for f in iterator)
+        self.assertListEqual(file_ids, ['file_id_1', 'file_id_2'])
+        # content is streamed to the cache, not read into memory
+        self.assertEqual(mock_cache_only.call_count, 2)
+        mock_get_content.assert_not_called()
+
+    @patch('abeja.datalake.file.DatalakeFile.cache_only')
+    def test_items_iter_with_prefetch_lists_pages_lazily(self, mock_cache_only):
+        mock_api = MagicMock()
+        mock_api.list_channel_files.side_effect = [
+            {
+                'next_page_token': 'dummy{}'.format(page),
+                'files': [{'file_id': 'file_id_{}_{}'.format(page, i)} for i in range(3)]
+            } for page in range(100)
+        ]
+        iterator = FileIterator(
+            mock_api,
+            organization_id=ORGANIZATION_ID,
+            channel_id=CHANNEL_ID,
+            prefetch=True,
+            prefetch_window=4,
+            prefetch_workers=2,
+            prefetch_ordered=True)
+        files = iter(iterator)
+        file_ids = [next(files).file_id for _ in range(4)]
+        self.assertListEqual(
+            file_ids, ['file_id_0_0', 'file_id_0_1', 'file_id_0_2', 'file_id_1_0'])
+        # only pages needed to fill the window, and a page read ahead are listed
+        self.assertLessEqual(mock_api.list_channel_files.call_count, 5)
+        files.close()
+
 
 class TestDatalakeFile(unittest.TestCase):
     def setUp(self):
@@ -400,12 +470,22 @@ class TestDatalakeFile(unittest.TestCase):
 
     @patch('abeja.common.local_file.MOUNT_DIR', TEST_MOUNT_DIR)
     def test_get_content(self):
+        datalake_file = DatalakeFile(None, uri=self.uri, type=type)
+        mock_func = create_autospec(
+            datalake_file._download_to_file,
+            side_effect=lambda f, state=None: f.write(self.binary_data))
+        datalake_file._download_to_file = mock_func
+        content = datalake_file.get_content()
+        self.assertEqual(content, self.binary_data)
+        mock_func.assert_called_once()
+
+    def test_get_content_without_cache(self):
         datalake_file = DatalakeFile(None, uri=self.uri, type=type)
         mock_func = create_autospec(
             datalake_file._get_content_from_remote,
             return_value=self.binary_data)
         datalake_file._get_content_from_remote = mock_func
-        content = datalake_file.get_content()
+        content = datalake_file.get_content(cache=False)
         self.assertEqual(content, self.binary_data)
         mock_func.assert_called_once_with()
 
@@ -424,18 +504,72 @@ class TestDatalakeFile(unittest.TestCase):
 
     @patch('abeja.common.local_file.MOUNT_DIR', TEST_MOUNT_DIR)
     def test_get_iter_content(self):
+        datalake_file = DatalakeFile(None, uri=self.uri, type=type)
+        mock_func = create_autospec(
+            datalake_file._download_to_file,
+            side_effect=lambda f, state=None: f.write(self.binary_data))
+        datalake_file._download_to_file = mock_func
+        iter_content = datalake_file.get_iter_content(chunk_size=4)
+        self.assertEqual(list(iter_content), [b'test', b' bin', b'ary'])
+        mock_func.assert_called_once()
+
+    def test_get_iter_content_without_cache(self):
         datalake_file = DatalakeFile(None, uri=self.uri, type=type)
         mock_func = create_autospec(
             datalake_file._get_iter_content_from_remote,
             return_value=self._generate_iter_content())
         datalake_file._get_iter_content_from_remote = mock_func
-        iter_content = datalake_file.get_iter_content(chunk_size=128)
+        iter_content = datalake_file.get_iter_content(cache=False, chunk_size=128)
         content = b''
         for c in iter_content:
             content += c
         self.assertEqual(content, self.binary_data)
         mock_func.assert_called_once_with(128)
 
+    @patch('abeja.common.local_file.MOUNT_DIR', TEST_MOUNT_DIR)
+    def test_cache_only(self):
+        datalake_file = DatalakeFile(None, uri=self.uri, type=type)
+        mock_func = create_autospec(
+            datalake_file._download_to_file,
+            side_effect=lambda f, state=None: f.write(self.binary_data))
+        datalake_file._download_to_file = mock_func
+        path = datalake_file.cache_only()
+        self.assertEqual(path, '{}/{}/{}'.format(TEST_MOUNT_DIR, self.channel_id, self.file_id))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.binary_data)
+
+        # cached file is not downloaded again, and content is read from the cache
+        self.assertEqual(datalake_file.cache_only(), path)
+        self.assertEqual(datalake_file.get_content(), self.binary_data)
+        mock_func.assert_called_once()
+
+    @patch('abeja.common.local_file.MOUNT_DIR', TEST_MOUNT_DIR)
+    def test_get_buffer(self):
+        datalake_file = DatalakeFile(None, uri=self.uri, type=type)
+        mock_func = create_autospec(
+            datalake_file._download_to_file,
+            side_effect=lambda f, state=None: f.write(self.binary_data))
+        datalake_file._download_to_file = mock_func
+        buf = datalake_file.get_buffer()
+        self.assertIsInstance(buf, memoryview)
+        self.assertEqual(buf.tobytes(), self.binary_data)
+        self.assertEqual(datalake_file.get_buffer().tobytes(), self.binary_data)
+        mock_func.assert_called_once()
+
+    def test_download_to(self):
+        datalake_file = DatalakeFile(None, uri=self.uri, type=type)
+        mock_func = create_autospec(
+            datalake_file._download_to_file,
+            side_effect=lambda f, state=None: f.write(self.binary_data))
+        datalake_file._download_to_file = mock_func
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'test.jpg')
+            self.assertEqual(datalake_file.download_to(path), path)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), self.binary_data)
+            self.assertEqual(sorted(os.listdir(d)), ['test.jpg'])
+        mock_func.assert_called_once()
+
     @patch('abeja.common.local_file.MOUNT_DIR', TEST_MOUNT_DIR)
     def test_get_text(self):
         datalake_file = DatalakeFile(None, uri=self.uri, type=type)
@@ -470,6 +604,30 @@ class TestDatalakeFile(unittest.TestCase):
         self.assertEqual(data, self.json_data)
         mock_func.assert_called_once_with()
 
+    @patch('abeja.common.local_file.MOUNT_DIR', TEST_MOUNT_DIR)
+    def test_get_json_using_cache(self):
+        datalake_file = DatalakeFile(None, uri=self.uri, type=type)
+        mock_func = create_autospec(
+            datalake_file._download_to_file,
+            side_effect=lambda f, state=None: f.write(json.dumps(self.json_data).encode()))
+        datalake_file._download_to_file = mock_func
+        self.assertEqual(datalake_file.get_json(cache=True), self.json_data)
+        self.assertEqual(datalake_file.get_json(cache=True), self.json_data)
+        mock_func.assert_called_once()
+
+    @patch('abeja.common.local_file.MOUNT_DIR', TEST_MOUNT_DIR)
+    @patch('abeja.datalake.file.get_object_cache')
+    def test_get_json_using_object_cache(self, mock_get_object_cache):
+        mock_get_object_cache.return_value = ObjectCache(max_size=1024)
+        datalake_file = DatalakeFile(None, uri=self.uri, type=type)
+        datalake_file._download_to_file = create_autospec(
+            datalake_file._download_to_file,
+            side_effect=lambda f, state=None: f.write(json.dumps(self.json_data).encode()))
+        data = datalake_file.get_json(cache=True)
+        with patch('abeja.datalake.file.use_binary_download_cache') as mock_cache:
+            self.assertIs(datalake_file.get_json(cache=True), data)
+            mock_cache.assert_not_called()
+
     @patch('abeja.common.local_file.MOUNT_DIR', TEST_MOUNT_DIR)
     def test_get_iter_lines(self):
         self.text_data = 'a\nb\nc'
@@ -483,6 +641,23 @@ class TestDatalakeFile(unittest.TestCase):
         self.assertEqual(content, self.text_data)
         mock_func.assert_called_once_with()
 
+    @patch('abeja.common.local_file.MOUNT_DIR', TEST_MOUNT_DIR)
+    def test_iter_records(self):
+        data = b'{"a": 1}\n{"a": 2}\n{"a": 3}\n'
+        datalake_file = DatalakeFile(
+            None, uri=self.uri, type=type, metadata={'x-abeja-meta-filename': 'log.jsonl'})
+        mock_func = create_autospec(
+            datalake_file._download_to_file, side_effect=lambda f, state=None: f.write(data))
+        datalake_file._download_to_file = mock_func
+        batches = list(datalake_file.iter_records(batch_size=2, columns=True))
+        self.assertEqual(batches, [{'a': [1, 2]}, {'a': [3]}])
+        mock_func.assert_called_once()
+
+    def test_iter_records_of_unknown_format(self):
+        datalake_file = DatalakeFile(None, uri=self.uri, type=type, content_type='image/jpeg')
+        with self.assertRaises(ValueError):
+            datalake_file.iter_records()
+
     def test_file_info(self):
         mock_api = MagicMock()
         datalake_file = DatalakeFile(mock_api, uri=self.uri, type=type)
@@ -498,6 +673,44 @@ class TestDatalakeFile(unittest.TestCase):
         content = datalake_file._get_content_from_remote()
         self.assertEqual(content, self.binary_data)
 
+    @patch('abeja.datalake.file.VERIFY_DOWNLOAD_ETAG', True)
+    def test_get_content_from_remote_verifies_etag(self):
+        datalake_file = DatalakeFile(None, uri=self.uri, type=type)
+        corrupted_response = self._build_content_response()
+        corrupted_response._content = b'corrupted'
+        responses = [corrupted_response, self._build_content_response()]
+        for res in responses:
+            res.headers['ETag'] = '"{}"'.format(hashlib.md5(self.binary_data).hexdigest())
+        datalake_file._do_download = MagicMock(side_effect=responses)
+        content = datalake_file._get_content_from_remote()
+        self.assertEqual(content, self.binary_data)
+        self.assertEqual(datalake_file._do_download.call_count, 2)
+
+    @patch('abeja.datalake.file.VERIFY_DOWNLOAD_ETAG', True)
+    def test_get_iter_content_from_remote_verifies_etag(self):
+        datalake_file = DatalakeFile(None, uri=self.uri, type=type)
+        res = MagicMock()
+        res.headers = {
+            'ETag': '"{}"'.format(hashlib.md5(self.binary_data).hexdigest()),
+            'Content-Length': str(len(self.binary_data))}
+        res.iter_content.return_value = iter([b'test ', b'broken'])
+        datalake_file._do_download = MagicMock(return_value=res)
+        iter_content = datalake_file._get_iter_content_from_remote(5)
+        self.assertEqual(next(iter_content), b'test ')
+        with self.assertRaises(EtagHashNotMatch):
+            list(iter_content)
+
+    @patch('abeja.datalake.file.VERIFY_DOWNLOAD_ETAG', True)
+    def test_get_content_from_remote_does_not_verify_etag_of_sse_kms(self):
+        datalake_file = DatalakeFile(None, uri=self.uri, type=type)
+        res = self._build_content_response()
+        res.headers['ETag'] = '"{}"'.format(hashlib.md5(b'encrypted').hexdigest())
+        res.headers['x-amz-server-side-encryption'] = 'aws:kms'
+        datalake_file._do_download = MagicMock(return_value=res)
+        content = datalake_file._get_content_from_remote()
+        self.assertEqual(content, self.binary_data)
+        self.assertEqual(datalake_file._do_download.call_count, 1)
+
     def test_get_text_from_remote(self):
         datalake_file = DatalakeFile(None, uri=self.uri, type=type)
         mock_response = self._build_text_response()
@@ -527,6 +740,51 @@ class TestDatalakeFile(unittest.TestCase):
         self.assertEqual(download_uri, self.file_info['download_uri'])
         datalake_file._api._connection.api_request.assert_called_once()
 
+    def test_get_download_uri_reuses_valid_uri(self):
+        mock_api = MagicMock()
+        url_expires_on = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)).isoformat()
+        datalake_file = DatalakeFile(
+            mock_api, uri=self.uri, type=type,
+            download_uri='known uri', url_expires_on=url_expires_on)
+        self.assertEqual(datalake_file._get_download_uri(), 'known uri')
+        datalake_file._api._connection.api_request.assert_not_called()
+
+    def test_get_download_uri_refreshes_expiring_uri(self):
+        for url_expires_on in (
+                (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=10)).isoformat(),
+                '2017-12-20T17:08:26Z',
+                'invalid',
+                None):
+            mock_api = MagicMock()
+            mock_api._connection.api_request.return_value = self.file_info
+            datalake_file = DatalakeFile(
+                mock_api, uri=self.uri, type=type,
+                download_uri='known uri', url_expires_on=url_expires_on)
+            self.assertEqual(datalake_file._get_download_uri(), self.file_info['download_uri'])
+            self.assertEqual(datalake_file.url_expires_on, self.file_info['url_expires_on'])
+            mock_api._connection.api_request.assert_called_once()
+
+    def test_do_download_refreshes_uri_on_forbidden(self):
+        mock_api = MagicMock()
+        url_expires_on = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)).isoformat()
+        datalake_file = DatalakeFile(
+            mock_api, uri=self.uri, type=type,
+            download_uri='known uri', url_expires_on=url_expires_on)
+        mock_api._connection.api_request.return_value = self.file_info
+
+        http_error = requests.exceptions.HTTPError()
+        res = requests.models.Response()
+        res.status_code = 403
+        res._content = b'expired'
+        http_error.response = res
+        mock_api._connection.request.side_effect = [http_error, self.text_data]
+
+        self.assertEqual(datalake_file._do_download(), self.text_data)
+        self.assertEqual(mock_api._connection.request.call_args_list, [
+            call('GET', 'known uri', stream=False),
+            call('GET', self.file_info['download_uri'], stream=False)])
+        mock_api._connection.api_request.assert_called_once()
+
     def test_do_download(self):
         mock_api = MagicMock()
         datalake_file = DatalakeFile(mock_api, uri=self.uri, type=type)
@@ -540,6 +798,29 @@ class TestDatalakeFile(unittest.TestCase):
         datalake_file._api._connection.request.assert_called_with(
             'GET', dummy_url, stream=False)
 
+    @patch('abeja.common.download.DOWNLOAD_PART_SIZE', 4)
+    def test_download_to_file(self):
+        data = b'0123456789'
+
+        def callback(request, context):
+            start, end = map(int, request.headers['Range'][len('bytes='):].split('-'))
+            context.status_code = 206
+            context.headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                start, min(end, len(data) - 1), len(data))
+            return data[start:end + 1]
+
+        url_expires_on = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)).isoformat()
+        datalake_file = DatalakeFile(
+            APIClient(), uri=self.uri, type=type,
+            download_uri='http://example.com/file', url_expires_on=url_expires_on)
+        with requests_mock.Mocker() as m:
+            m.get('http://example.com/file', content=callback)
+            with tempfile.TemporaryFile() as f:
+                datalake_file._download_to_file(f)
+                f.seek(0)
+                self.assertEqual(f.read(), data)
+            self.assertEqual(m.call_count, 3)
+
     def test_do_download_error_handling(self):
         mock_api = MagicMock()
         datalake_file = DatalakeFile(mock_api, uri=self.uri, type=type)
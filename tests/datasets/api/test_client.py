@@ -131,6 +131,20 @@ class TestAPIClient(unittest.TestCase):
                                                       path=path,
                                                       params=params)
 
+    def test_list_datatest_items_with_stream(self):
+        mock_conn = MagicMock()
+        client = APIClient()
+        client._connection = mock_conn
+        client.list_dataset_items(
+            self.organization_id, self.dataset_id, stream=True)
+        path = '/organizations/{}/datasets/{}/items'.format(
+            self.organization_id, self.dataset_id)
+        mock_conn.api_request_stream.assert_called_once_with(method='GET',
+                                                             path=path,
+                                                             key='items',
+                                                             params={})
+        mock_conn.api_request.assert_not_called()
+
     def test_delete_datatest_item(self):
         mock_conn = MagicMock()
         client = APIClient()
@@ -344,6 +344,29 @@ class TestDatasetItemIterator(unittest.TestCase):
                 self.assertIsInstance(item, DatasetItem)
             self.assertEqual(m.call_count, 1)
 
+    def test__items_iter_with_prefetch_ordered(self):
+        mock_api = MagicMock()
+        pages = []
+        for page in range(3):
+            res = self._build_dataset_items_response()
+            item = res['items'][0]
+            res['items'] = [dict(item, dataset_item_id=page * 10 + i) for i in range(5)]
+            res['next_page_token'] = 'token{}'.format(page)
+            pages.append(res)
+        mock_api.list_dataset_items.side_effect = pages + [self._build_empty_dataset_items_response()]
+        iterator = DatasetItemIterator(
+            mock_api,
+            self.organization_id,
+            self.dataset_id,
+            prefetch=True,
+            prefetch_window=3,
+            prefetch_workers=3,
+            prefetch_ordered=True)
+        with patch('abeja.datalake.file.DatalakeFile.get_content') as m:
+            item_ids = [item.dataset_item_id for item in iterator]
+            self.assertEqual(m.call_count, 15)
+        self.assertListEqual(item_ids, [page * 10 + i for page in range(3) for i in range(5)])
+
     def test__page(self):
         mock_api = MagicMock()
         mock_api.list_dataset_items.return_value = self._build_dataset_items_response()
@@ -279,6 +279,29 @@ class TestOpsBeeLLMAPIClient(unittest.TestCase):
         )
         self.assertDictEqual(ret, res)
 
+    @requests_mock.Mocker()
+    def test_get_qa_histories_with_stream(self, m):
+        path = '/opsbee-llm/organizations/{}/deployments/{}'.format(
+            ORGANIZATION_ID,
+            DEPLOYMENT_QA_ID,
+        )
+        m.get(path, json=DEPLOYMENT_QA_RES)
+        path = '/opsbee-llm/organizations/{}/deployments/{}/qa_histories'.format(
+            ORGANIZATION_ID,
+            DEPLOYMENT_QA_ID,
+        )
+        m.get(path, json=HISTORIES_RES)
+
+        client = APIClient()
+        ret = client.get_qa_histories(
+            ORGANIZATION_ID,
+            DEPLOYMENT_QA_ID,
+            stream=True,
+        )
+        self.assertEqual(list(ret), HISTORIES_RES['histories'])
+        self.assertEqual(
+            {**ret.fields, 'histories': HISTORIES_RES['histories']}, HISTORIES_RES)
+
     @requests_mock.Mocker()
     def test_get_qa_histories(self, m):
         # get-deployment-api mock
@@ -587,6 +610,29 @@ class TestOpsBeeLLMAPIClient(unittest.TestCase):
             )
         self.assertEqual(e.exception.error, 'deployment type is not supported')
 
+    @requests_mock.Mocker()
+    def test_get_chat_histories_with_stream(self, m):
+        path = '/opsbee-llm/organizations/{}/deployments/{}'.format(
+            ORGANIZATION_ID,
+            DEPLOYMENT_CHAT_ID,
+        )
+        m.get(path, json=DEPLOYMENT_CHAT_RES)
+        path = '/opsbee-llm/organizations/{}/deployments/{}/histories'.format(
+            ORGANIZATION_ID,
+            DEPLOYMENT_CHAT_ID,
+        )
+        m.get(path, json=HISTORIES_RES)
+
+        client = APIClient()
+        ret = client.get_chat_histories(
+            ORGANIZATION_ID,
+            DEPLOYMENT_CHAT_ID,
+            stream=True,
+        )
+        self.assertEqual(list(ret), HISTORIES_RES['histories'])
+        self.assertEqual(
+            {**ret.fields, 'histories': HISTORIES_RES['histories']}, HISTORIES_RES)
+
     @requests_mock.Mocker()
     def test_get_chat_histories(self, m):
         # get-deployment-api mock
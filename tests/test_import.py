@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# generous enough for slow CI machines, while still catching a heavy
+# dependency (tensorboardX, protobuf, ...) sneaking back into `import abeja`.
+IMPORT_TIME_BUDGET_US = int(os.environ.get('ABEJA_SDK_IMPORT_TIME_BUDGET_US', 1500000))
+
+HEAVY_MODULES = ('tensorboardX', 'google.protobuf', 'abeja.tracking', 'asyncio')
+
+
+def _run(code, *options):
+    return subprocess.run(
+        [sys.executable, *options, '-c', code],
+        check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+
+
+@pytest.mark.parametrize('module', ['abeja', 'abeja.datalake'])
+def test_import_does_not_load_heavy_modules(module):
+    code = 'import sys, {}; print(",".join(m for m in {!r} if m in sys.modules))'.format(
+        module, HEAVY_MODULES)
+    assert _run(code).stdout.strip() == ''
+
+
+@pytest.mark.parametrize('module', ['abeja', 'abeja.datalake'])
+def test_import_time_budget(module):
+    stderr = _run('import {}'.format(module), '-X', 'importtime').stderr
+    for line in stderr.splitlines():
+        _, _, cumulative, name = [col.strip() for col in line.replace(':', '|', 1).split('|')]
+        if name == module:
+            assert int(cumulative) < IMPORT_TIME_BUDGET_US
+            return
+    pytest.fail('{} not found in import time report'.format(module))
+
+
+def test_lazy_attributes():
+    code = (
+        'import abeja, sys\n'
+        'assert "abeja.datalake" not in sys.modules\n'
+        'assert abeja.datalake.Client\n'
+        'assert abeja.Tracking.__module__ == "abeja.tracking"\n'
+        'import abeja.tracking\n'
+        'assert callable(abeja.tracking) and not isinstance(abeja.tracking, type(sys))\n'
+    )
+    _run(code)
+
+
+def test_unknown_attribute():
+    import abeja
+    with pytest.raises(AttributeError):
+        abeja.no_such_attribute